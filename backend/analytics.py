@@ -0,0 +1,217 @@
+"""HR analytics computed inside MongoDB, so dashboards receive totals instead of rows."""
+import asyncio
+import calendar
+import os
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from cache import TTLCache, get_departments
+from occupancy import OCCUPANCY_COLLECTION
+
+ANALYTICS_CACHE_TTL = float(os.environ.get('ANALYTICS_CACHE_TTL', 60))
+
+DAY_MS = 24 * 3600 * 1000
+# Lower bounds (days) of the pending backlog age buckets
+BACKLOG_BUCKETS = [0, 3, 7, 14, 30]
+
+analytics_cache = TTLCache("analytics", maxsize=32, ttl=ANALYTICS_CACHE_TTL)
+# Summaries being built, by cache key: requests arriving meanwhile wait for the same build
+_builds: Dict[str, "asyncio.Task[dict]"] = {}
+
+
+def _as_date(field: str) -> dict:
+    """field as a date, also when migrate_dates.py has not converted it from an
+    ISO string yet; null when it cannot be read, which $avg and $max skip"""
+    return {"$convert": {"input": field, "to": "date", "onError": None, "onNull": None}}
+
+
+def _age_days(field: str, now: datetime) -> dict:
+    return {"$divide": [{"$subtract": [now, _as_date(field)]}, DAY_MS]}
+
+
+async def request_overview(db, now: datetime) -> dict:
+    """Request counts by status and the age profile of pending requests"""
+    pending_age = [
+        {"$match": {"status": "pending"}},
+        {"$project": {"_id": 0, "age": _age_days("$created_at", now)}},
+    ]
+    pipeline = [{"$facet": {
+        "statuses": [
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        ],
+        "backlog": pending_age + [{"$group": {
+            "_id": None, "count": {"$sum": 1},
+            "avg_age_days": {"$avg": "$age"}, "max_age_days": {"$max": "$age"}
+        }}],
+        "backlog_buckets": pending_age + [{"$bucket": {
+            "groupBy": "$age", "boundaries": BACKLOG_BUCKETS + [float('inf')], "default": "other"
+        }}],
+    }}]
+    result = (await db.vacation_requests.aggregate(pipeline).to_list(1))[0]
+    summary = result['backlog'][0] if result['backlog'] else {"count": 0, "avg_age_days": 0, "max_age_days": 0}
+    bucket_counts = {b['_id']: b['count'] for b in result['backlog_buckets']}
+    return {
+        "statuses": {s['_id']: s['count'] for s in result['statuses']},
+        "pending_backlog": {
+            "count": summary['count'],
+            "avg_age_days": round(summary['avg_age_days'] or 0, 1),
+            "max_age_days": round(summary['max_age_days'] or 0, 1),
+            "buckets": [
+                {"from_days": low, "to_days": high, "count": bucket_counts.get(low, 0)}
+                for low, high in zip(BACKLOG_BUCKETS, BACKLOG_BUCKETS[1:] + [None])
+            ],
+        },
+    }
+
+
+async def department_balances(db, year: int) -> Dict[str, dict]:
+    """Balance totals of the year per department"""
+    pipeline = [
+        {"$match": {"year": year}},
+        {"$lookup": {
+            "from": "users",
+            "localField": "user_id",
+            "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, "department_id": 1}}],
+            "as": "user"
+        }},
+        {"$unwind": "$user"},
+        {"$group": {
+            "_id": "$user.department_id",
+            "total_days": {"$sum": "$total_days"},
+            "used_days": {"$sum": {"$ifNull": ["$used_days", 0]}},
+            "reserved_days": {"$sum": {"$ifNull": ["$reserved_days", 0]}},
+        }},
+    ]
+    return {row.pop('_id'): row async for row in db.vacation_balances.aggregate(pipeline)}
+
+
+async def department_headcount(db) -> Dict[str, int]:
+    pipeline = [{"$group": {"_id": "$department_id", "count": {"$sum": 1}}}]
+    return {row['_id']: row['count'] async for row in db.users.aggregate(pipeline)}
+
+
+async def monthly_days_off(db, year: int) -> Dict[str, Dict[int, int]]:
+    """Person-days on approved vacation per department and month, from department_occupancy"""
+    pipeline = [
+        {"$match": {"date": {"$gte": datetime(year, 1, 1), "$lt": datetime(year + 1, 1, 1)}}},
+        {"$group": {
+            "_id": {"department_id": "$department_id", "month": {"$month": "$date"}},
+            "days_off": {"$sum": "$count"},
+        }},
+    ]
+    result: Dict[str, Dict[int, int]] = {}
+    async for row in db[OCCUPANCY_COLLECTION].aggregate(pipeline):
+        result.setdefault(row['_id']['department_id'], {})[row['_id']['month']] = row['days_off']
+    return result
+
+
+async def approval_latency(db, year: int) -> List[dict]:
+    """Time from submission to decision for decisions taken during the year"""
+    pipeline = [
+        {"$match": {
+            "action": {"$in": ["approved", "rejected"]},
+            # dates, or ISO strings not migrated yet, which sort the same way
+            "$or": [
+                {"acted_at": {"$gte": datetime(year, 1, 1, tzinfo=timezone.utc),
+                              "$lt": datetime(year + 1, 1, 1, tzinfo=timezone.utc)}},
+                {"acted_at": {"$gte": f"{year}-01-01", "$lt": f"{year + 1}-01-01"}},
+            ],
+        }},
+        {"$lookup": {
+            "from": "vacation_requests",
+            "localField": "request_id",
+            "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, "created_at": 1}}],
+            "as": "request"
+        }},
+        {"$unwind": "$request"},
+        {"$project": {
+            "_id": 0, "action": 1,
+            "hours": {"$divide": [
+                {"$subtract": [_as_date("$acted_at"), _as_date("$request.created_at")]}, 3600 * 1000
+            ]},
+        }},
+        {"$group": {
+            "_id": "$action", "count": {"$sum": 1},
+            "avg_hours": {"$avg": "$hours"}, "max_hours": {"$max": "$hours"}
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+    return [{
+        "action": row['_id'],
+        "count": row['count'],
+        "avg_hours": round(row['avg_hours'] or 0, 1),
+        "max_hours": round(row['max_hours'] or 0, 1),
+    } async for row in db.request_history.aggregate(pipeline)]
+
+
+async def build_summary(db, year: int) -> dict:
+    now = datetime.now(timezone.utc)
+    overview, balances, headcount, days_off, latency, departments = await asyncio.gather(
+        request_overview(db, now),
+        department_balances(db, year),
+        department_headcount(db),
+        monthly_days_off(db, year),
+        approval_latency(db, year),
+        get_departments(db),
+    )
+
+    department_rows = []
+    for department in sorted(departments, key=lambda d: d['name']):
+        department_id = department['id']
+        balance = balances.get(department_id, {})
+        employees = headcount.get(department_id, 0)
+        months = days_off.get(department_id, {})
+        department_rows.append({
+            "department_id": department_id,
+            "name": department['name'],
+            "employees": employees,
+            "total_days": balance.get('total_days', 0),
+            "used_days": balance.get('used_days', 0),
+            "reserved_days": balance.get('reserved_days', 0),
+            "remaining_days": balance.get('total_days', 0) - balance.get('used_days', 0) - balance.get('reserved_days', 0),
+            "monthly_utilization": [{
+                "month": month,
+                "days_off": months.get(month, 0),
+                # share of the department's person-days spent on vacation
+                "utilization": round(
+                    months.get(month, 0) / (employees * calendar.monthrange(year, month)[1]), 4
+                ) if employees else 0.0,
+            } for month in range(1, 13)],
+        })
+
+    return {
+        "year": year,
+        "generated_at": now.isoformat(),
+        **overview,
+        "departments": department_rows,
+        "approval_latency": latency,
+    }
+
+
+async def get_summary(db, year: int, refresh: bool = False, version: str = "") -> dict:
+    """Summary for the year, reused for ANALYTICS_CACHE_TTL seconds.
+
+    version identifies the data the summary is built from (the ETag of the
+    request), so a write starts a new entry on every worker instead of
+    waiting for the old one to expire. Dashboards that reload together after
+    a write share one aggregation per worker.
+    """
+    key = f"{year}:{version}"
+    summary = None if refresh else analytics_cache.get(key)
+    if summary is not None:
+        return summary
+    build = _builds.get(key)
+    if build is None:
+        build = _builds[key] = asyncio.create_task(build_summary(db, year))
+
+        def finished(task: "asyncio.Task[dict]"):
+            if _builds.get(key) is task:
+                del _builds[key]
+            if not task.cancelled() and task.exception() is None:
+                analytics_cache.set(key, task.result())
+
+        build.add_done_callback(finished)
+    # one caller disconnecting must not cancel the build the others wait for
+    return await asyncio.shield(build)
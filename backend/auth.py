@@ -1,14 +1,43 @@
 import os
+import time
+import asyncio
+import hashlib
+import secrets
 import jwt
 import bcrypt
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from fastapi import HTTPException, Header
-from typing import Optional
+from pymongo import ReturnDocument
+from typing import Dict, List, Optional
+import cache
+from cache import TTLCache
+import metrics
 
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'vacation-flow-secret-key-2024')
 ALGORITHM = 'HS256'
 ACCESS_TOKEN_EXPIRE_DAYS = 30
 
+# bcrypt releases the GIL, so threads scale across cores; "process" is available
+# for interpreters where that does not hold
+PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', 256))
+
+# Stream tickets stand in for the token in EventSource URLs, which end up in logs
+STREAM_TICKET_TTL = int(os.environ.get('STREAM_TICKET_TTL', 60))
+STREAM_TICKETS_COLLECTION = "stream_tickets"
+
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TTL = float(os.environ.get('TOKEN_CACHE_TTL', 300))
+
+# Claims that scope what a token may see; a token whose copy no longer matches
+# the user document is refused
+SCOPING_CLAIMS = ("role", "department_id", "manager_id")
+
+# Set at startup; without it (scripts, benchmarks) tokens are checked offline only
+db = None
+
 def hash_password(password: str) -> str:
     """Hash password using bcrypt"""
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
@@ -17,6 +46,100 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify password against hash"""
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
+def hash_passwords(passwords: List[str]) -> List[str]:
+    """Hash several passwords in one worker call"""
+    return [hash_password(p) for p in passwords]
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded worker pool so it never blocks the event loop"""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE,
+                 executor: str = PASSWORD_HASH_EXECUTOR):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor_kind = executor
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Сервис перегружен, повторите попытку позже")
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.total_seconds += elapsed
+            metrics.observe_password_hash(fn.__name__, elapsed)
+            self.completed += 1
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def hash_many(self, passwords: List[str]) -> List[str]:
+        """Hash a batch split into one slice per worker, so a large batch takes
+        only a few queue slots and, with processes, few pickling round trips"""
+        if not passwords:
+            return []
+        size = -(-len(passwords) // self.workers)
+        parts = await asyncio.gather(*(
+            self._run(hash_passwords, passwords[i:i + size]) for i in range(0, len(passwords), size)
+        ))
+        return [hashed for part in parts for hashed in part]
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.executor_kind,
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "max_queue_depth": self.max_queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_seconds * 1000 / self.completed, 2) if self.completed else 0.0,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+password_hasher = PasswordHasher()
+
+token_cache = TTLCache("tokens", maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
 def create_access_token(data: dict) -> str:
     """Create JWT access token"""
     to_encode = data.copy()
@@ -25,6 +148,16 @@ def create_access_token(data: dict) -> str:
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def user_claims(user: dict) -> dict:
+    """Signed claims that let handlers authorize and scope without a user lookup"""
+    return {
+        "sub": user['id'],
+        "role": user['role'],
+        "department_id": user.get('department_id'),
+        "manager_id": user.get('manager_id'),
+        "ver": user.get('token_version', 0),
+    }
+
 def decode_token(token: str) -> dict:
     """Decode JWT token"""
     try:
@@ -35,7 +168,91 @@ def decode_token(token: str) -> dict:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Недействительный токен")
 
-def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
+# Lowest token version still accepted per user; tokens issued before a
+# revocation carry a smaller "ver" claim
+_token_versions: Dict[str, int] = {}
+
+def set_token_version(user_id: str, version: int):
+    _token_versions[user_id] = max(version, _token_versions.get(user_id, 0))
+    token_cache.clear()
+
+# revocations made by other workers arrive on the cache invalidation channel
+cache.register_handler("token_version", lambda message: set_token_version(message['user_id'], message['version']))
+
+async def load_token_versions(db):
+    """Load revocation stamps so they survive restarts"""
+    async for user in db.users.find({"token_version": {"$gt": 0}}, {"_id": 0, "id": 1, "token_version": 1}):
+        _token_versions[user['id']] = user['token_version']
+
+async def revoke_user_tokens(db, user_id: str) -> int:
+    """Invalidate every token issued to the user so far"""
+    user = await db.users.find_one_and_update(
+        {"id": user_id},
+        {"$inc": {"token_version": 1}},
+        projection={"_id": 0, "token_version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    version = user['token_version'] if user else 0
+    set_token_version(user_id, version)
+    await cache.publish("token_version", {"user_id": user_id, "version": version})
+    return version
+
+def _check_not_revoked(payload: dict):
+    if payload.get('ver', 0) < _token_versions.get(payload['sub'], 0):
+        raise HTTPException(status_code=401, detail="Токен отозван")
+
+async def _check_claims_current(payload: dict):
+    """Refuse tokens issued before the user's role, department or manager changed.
+
+    Reads the user through the shared cache, so edits made outside the app take
+    effect within USER_CACHE_TTL, or at once where change streams are available.
+    """
+    if db is None:
+        return
+    user = await cache.get_user(db, payload['sub'])
+    if user is None:
+        raise HTTPException(status_code=401, detail="Пользователь не найден")
+    if any(key in payload and payload[key] != user.get(key) for key in SCOPING_CLAIMS):
+        raise HTTPException(status_code=401, detail="Данные учётной записи изменились, войдите снова")
+
+def verify_token(token: str) -> dict:
+    """Decode a token, reusing the result of earlier verifications"""
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = token_cache.get(key)
+    if payload is None:
+        payload = decode_token(token)
+        # never keep a token in the cache past its expiry
+        token_cache.set(key, payload, ttl=payload['exp'] - time.time())
+    _check_not_revoked(payload)
+    return dict(payload)
+
+async def issue_stream_ticket(db, claims: dict) -> str:
+    """Single-use ticket for opening one event stream as the caller.
+
+    Only a hash is stored, in MongoDB so that any worker can redeem it; the
+    TTL index removes tickets that were never used.
+    """
+    ticket = secrets.token_urlsafe(32)
+    await db[STREAM_TICKETS_COLLECTION].insert_one({
+        "_id": hashlib.sha256(ticket.encode('utf-8')).hexdigest(),
+        "claims": claims,
+        "expires_at": datetime.now(timezone.utc) + timedelta(seconds=STREAM_TICKET_TTL),
+    })
+    return ticket
+
+async def redeem_stream_ticket(db, ticket: str) -> dict:
+    """Claims of the ticket's owner; the ticket is deleted, so a second use fails"""
+    doc = await db[STREAM_TICKETS_COLLECTION].find_one_and_delete({
+        "_id": hashlib.sha256(ticket.encode('utf-8')).hexdigest(),
+        "expires_at": {"$gt": datetime.now(timezone.utc)},
+    })
+    if not doc:
+        raise HTTPException(status_code=401, detail="Недействительный билет подключения")
+    _check_not_revoked(doc['claims'])
+    await _check_claims_current(doc['claims'])
+    return doc['claims']
+
+async def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
     """Get current user from JWT token"""
     if not authorization:
         raise HTTPException(status_code=401, detail="Требуется авторизация")
@@ -45,7 +262,8 @@ def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
         if scheme.lower() != 'bearer':
             raise HTTPException(status_code=401, detail="Неверная схема авторизации")
         
-        payload = decode_token(token)
-        return payload
+        payload = verify_token(token)
     except ValueError:
-        raise HTTPException(status_code=401, detail="Неверный формат токена")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Неверный формат токена")
+    await _check_claims_current(payload)
+    return payload
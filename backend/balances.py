@@ -0,0 +1,68 @@
+"""Atomic bookkeeping of vacation balances.
+
+A balance counts approved days in used_days and days held by pending
+requests in reserved_days. Every change that raises used_days +
+reserved_days is a single conditional update that only matches while the
+sum stays within total_days, so concurrent submissions and approvals
+cannot overdraw a balance, with no locks and no transactions needed.
+"""
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+
+def current_year() -> int:
+    return datetime.now(timezone.utc).year
+
+
+def available_days(balance: dict) -> int:
+    return balance['total_days'] - balance.get('used_days', 0) - balance.get('reserved_days', 0)
+
+
+def _fits(days: int) -> dict:
+    return {"$expr": {"$lte": [
+        {"$add": [{"$ifNull": ["$used_days", 0]}, {"$ifNull": ["$reserved_days", 0]}, days]},
+        "$total_days"
+    ]}}
+
+
+async def adjust_balance(db, user_id: str, year: int, used: int = 0, reserved: int = 0,
+                         session=None, enforce: bool = True) -> Optional[bool]:
+    """Add used and reserved days in one update.
+
+    Returns True when applied, False when the balance exists but would be
+    overdrawn, and None when the user has no balance for the year (nothing
+    is tracked then, as before balances were enforced). With enforce=False
+    the change is applied even if it overdraws, to take back an earlier one.
+    """
+    if not used and not reserved:
+        return True
+    query = {"user_id": user_id, "year": year}
+    if enforce and used + reserved > 0:
+        query.update(_fits(used + reserved))
+    result = await db.vacation_balances.update_one(
+        query, {"$inc": {"used_days": used, "reserved_days": reserved}}, session=session
+    )
+    if result.matched_count:
+        return True
+    exists = await db.vacation_balances.count_documents(
+        {"user_id": user_id, "year": year}, limit=1, session=session
+    )
+    return False if exists else None
+
+
+def request_balance_change(request: dict, new_status: str) -> Tuple[int, int]:
+    """(used, reserved) increments for moving request from its current status to new_status"""
+    if request.get('vacation_type') != 'annual' or request['status'] == new_status:
+        return 0, 0
+    used = 0
+    if request['status'] == 'approved':
+        used -= request['work_days']
+    if new_status == 'approved':
+        used += request['work_days']
+    # any reservation is settled when a request leaves its current status
+    return used, -request.get('reserved_days', 0)
+
+
+def request_balance_year(request: dict) -> int:
+    # requests created before reservations were tracked carry no year
+    return request.get('balance_year') or current_year()
@@ -0,0 +1,73 @@
+"""Per-request authentication overhead: full JWT verification versus the token cache.
+
+With --db it also times the user lookup that handlers needed before the
+token carried department_id, to show the round-trip the claims remove.
+
+Usage: python -m benchmarks.auth [--requests 100000] [--tokens 1000] [--db]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from auth import create_access_token, decode_token, token_cache, verify_token
+from benchmarks.common import bench_db, summarize, timer
+
+
+def make_tokens(count: int):
+    return [create_access_token({
+        "sub": str(uuid.uuid4()), "role": "employee", "department_id": str(uuid.uuid4()),
+        "manager_id": None, "ver": 0,
+    }) for _ in range(count)]
+
+
+def per_call_us(fn, tokens, requests: int) -> float:
+    rnd = random.Random(5)
+    sample = [rnd.choice(tokens) for _ in range(requests)]
+    started = time.perf_counter()
+    for token in sample:
+        fn(token)
+    return round((time.perf_counter() - started) * 1e6 / requests, 2)
+
+
+async def user_lookup_ms(lookups: int):
+    client, db = bench_db("auth")
+    await client.drop_database(db.name)
+    try:
+        user_ids = [str(uuid.uuid4()) for _ in range(1000)]
+        await db.users.insert_many([{"id": u, "department_id": "d", "role": "employee"} for u in user_ids])
+        await db.users.create_index("id", unique=True)
+        latencies = []
+        for _ in range(lookups):
+            with timer(latencies):
+                await db.users.find_one({"id": random.choice(user_ids)}, {"_id": 0})
+        return summarize(latencies)
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+def main(requests: int, tokens_count: int, with_db: bool):
+    tokens = make_tokens(tokens_count)
+    token_cache.clear()
+    result = {
+        "requests": requests,
+        "distinct_tokens": tokens_count,
+        "decode_us": per_call_us(decode_token, tokens, requests),
+        "cached_verify_us": per_call_us(verify_token, tokens, requests),
+        "token_cache": token_cache.stats(),
+    }
+    if with_db:
+        result["user_lookup_ms"] = asyncio.run(user_lookup_ms(min(requests, 2000)))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--tokens", type=int, default=1000)
+    parser.add_argument("--db", action="store_true")
+    args = parser.parse_args()
+    main(args.requests, args.tokens, args.db)
@@ -0,0 +1,153 @@
+"""Concurrency stress check for balance reservations: no balance may be overdrawn.
+
+Every employee fires many overlapping submissions at once, more than the
+balance can hold, then the created requests are approved, rejected and
+cancelled concurrently through the single, bulk and cancel handlers.
+Afterwards each balance must satisfy used + reserved <= total and match
+the requests exactly. Exits with status 1 on any violation.
+
+Usage: python -m benchmarks.balance_stress [--employees 50] [--submissions 20] [--days 5] [--total 28]
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+from fastapi import HTTPException
+
+import server
+from balances import current_year
+from database import ensure_indexes
+from models import VacationRequestBulkUpdate, VacationRequestCreate, VacationRequestUpdate
+from benchmarks.common import bench_db
+
+
+async def attempt(coro, outcomes: dict):
+    try:
+        await coro
+        outcomes["ok"] = outcomes.get("ok", 0) + 1
+    except HTTPException as e:
+        outcomes[e.status_code] = outcomes.get(e.status_code, 0) + 1
+
+
+async def seed(db, employees: int, total: int):
+    department_id = str(uuid.uuid4())
+    users = [{
+        "id": str(uuid.uuid4()), "login": f"stress-{i}", "role": "employee", "full_name": f"Сотрудник {i}",
+        "email": f"user{i}@example.com", "department_id": department_id,
+    } for i in range(employees)]
+    await db.users.insert_many(users)
+    await db.vacation_balances.insert_many([{
+        "id": str(uuid.uuid4()), "user_id": u["id"], "year": current_year(), "total_days": total,
+        "used_days": 0, "reserved_days": 0,
+    } for u in users])
+    await ensure_indexes(db)
+    manager = {"sub": str(uuid.uuid4()), "role": "manager", "department_id": department_id}
+    return [u["id"] for u in users], manager
+
+
+def workweek(rnd: random.Random, days: int):
+    # a Monday in the current year far from the holidays, days <= 5 stay within the week
+    start = date(current_year(), 3, 2) + timedelta(weeks=rnd.randrange(30))
+    start -= timedelta(days=start.weekday())
+    return start.isoformat(), (start + timedelta(days=days - 1)).isoformat()
+
+
+async def check(db) -> list:
+    violations = []
+    async for balance in db.vacation_balances.find({}, {"_id": 0}):
+        requests = await db.vacation_requests.find(
+            {"user_id": balance["user_id"], "vacation_type": "annual"}, {"_id": 0}
+        ).to_list(None)
+        used = sum(r["work_days"] for r in requests if r["status"] == "approved")
+        reserved = sum(r.get("reserved_days", 0) for r in requests if r["status"] == "pending")
+        if balance["used_days"] + balance["reserved_days"] > balance["total_days"]:
+            violations.append({"user_id": balance["user_id"], "error": "overdrawn", **balance})
+        if (balance["used_days"], balance["reserved_days"]) != (used, reserved):
+            violations.append({"user_id": balance["user_id"], "error": "drift", "expected_used": used,
+                               "expected_reserved": reserved, **balance})
+    return violations
+
+
+async def main(employees: int, submissions: int, days: int, total: int, seed_value: int):
+    rnd = random.Random(seed_value)
+    client, db = bench_db("balance_stress")
+    await client.drop_database(db.name)
+    server.client, server.db = client, db
+    server.notification_queue.db = db
+    try:
+        user_ids, manager = await seed(db, employees, total)
+        started = time.perf_counter()
+
+        created = {}
+        await asyncio.gather(*(
+            attempt(server.create_vacation_request(
+                VacationRequestCreate(start_date=start, end_date=end, vacation_type="annual"),
+                {"sub": user_id, "role": "employee"}
+            ), created)
+            for user_id in user_ids for _ in range(submissions)
+            for start, end in [workweek(rnd, days)]
+        ))
+
+        # Legacy requests without a reservation exercise the guarded approval path
+        legacy = [{
+            "id": str(uuid.uuid4()), "user_id": user_id, "start_date": "2024-07-01", "end_date": "2024-07-05",
+            "vacation_type": "annual", "status": "pending", "work_days": days, "comment": None,
+            "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc), "updated_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+        } for user_id in user_ids for _ in range(2)]
+        await db.vacation_requests.insert_many(legacy)
+
+        request_ids = [r["id"] async for r in db.vacation_requests.find({}, {"_id": 0, "id": 1})]
+        rnd.shuffle(request_ids)
+        decided = {}
+        actions = []
+        for i, request_id in enumerate(request_ids):
+            owner = {"sub": manager["sub"], "role": "hr"}
+            if i % 4 == 0:
+                actions.append(server.cancel_vacation_request(request_id, owner))
+            elif i % 4 == 1:
+                status = rnd.choice(["approved", "approved", "rejected"])
+                actions.append(server.update_vacation_request(request_id, VacationRequestUpdate(status=status), manager))
+            # the same request often appears in a single and a bulk decision to force conflicts
+            if i % 2 == 1:
+                actions.append(server.bulk_update_vacation_requests(
+                    VacationRequestBulkUpdate(request_ids=[request_id], status="approved"), manager
+                ))
+        for i in range(0, len(request_ids), 50):
+            actions.append(server.bulk_update_vacation_requests(
+                VacationRequestBulkUpdate(request_ids=request_ids[i:i + 50], status="approved"), manager
+            ))
+        rnd.shuffle(actions)
+        await asyncio.gather(*(attempt(action, decided) for action in actions))
+
+        violations = await check(db)
+        statuses = await db.vacation_requests.aggregate([{"$group": {"_id": "$status", "n": {"$sum": 1}}}]).to_list(None)
+        print(json.dumps({
+            "employees": employees,
+            "submissions": employees * submissions,
+            "seconds": round(time.perf_counter() - started, 2),
+            "create_outcomes": {str(k): v for k, v in created.items()},
+            "decision_outcomes": {str(k): v for k, v in decided.items()},
+            "statuses": {s["_id"]: s["n"] for s in statuses},
+            "violations": violations[:20],
+        }, indent=2, ensure_ascii=False, default=str))
+        return not violations
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=50)
+    parser.add_argument("--submissions", type=int, default=20)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--total", type=int, default=28)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    ok = asyncio.run(main(args.employees, args.submissions, args.days, args.total, args.seed))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,84 @@
+"""Throughput of approving a batch of requests one by one versus the bulk endpoint.
+
+Handlers are called directly against a scratch database, so the numbers
+cover the database round trips and outbox writes but not HTTP. Emails are
+only written to the outbox; the delivery queue is not started.
+
+Usage: python -m benchmarks.bulk_decision [--batch 1000] [--employees 100]
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+
+import server
+from database import ensure_indexes
+from models import VacationRequestBulkUpdate, VacationRequestUpdate
+from benchmarks.common import bench_db
+
+
+async def seed(db, batch: int, employees: int):
+    department_id = str(uuid.uuid4())
+    users = [{
+        "id": str(uuid.uuid4()), "login": f"bulk-{i}", "role": "employee", "full_name": f"Сотрудник {i}",
+        "email": f"user{i}@example.com", "department_id": department_id,
+    } for i in range(employees)]
+    year = datetime.now(timezone.utc).year
+    await db.users.insert_many(users)
+    await db.vacation_balances.insert_many([
+        {"id": str(uuid.uuid4()), "user_id": u["id"], "year": year, "total_days": 10 ** 6, "used_days": 0}
+        for u in users
+    ])
+    now = datetime.now(timezone.utc)
+    await db.vacation_requests.insert_many([{
+        "id": str(uuid.uuid4()), "user_id": users[i % employees]["id"], "start_date": "2024-07-01",
+        "end_date": "2024-07-05", "vacation_type": "annual", "status": "pending", "work_days": 5,
+        "comment": None, "created_at": now, "updated_at": now,
+    } for i in range(batch * 2)])
+    await ensure_indexes(db)
+    request_ids = [r["id"] async for r in db.vacation_requests.find({}, {"_id": 0, "id": 1})]
+    manager = {"sub": str(uuid.uuid4()), "role": "manager", "department_id": department_id}
+    return request_ids[:batch], request_ids[batch:], manager
+
+
+async def main(batch: int, employees: int):
+    client, db = bench_db("bulk_decision")
+    await client.drop_database(db.name)
+    server.client, server.db = client, db
+    server.notification_queue.db = db
+    try:
+        one_by_one, bulk, manager = await seed(db, batch, employees)
+
+        started = time.perf_counter()
+        for request_id in one_by_one:
+            await server.update_vacation_request(request_id, VacationRequestUpdate(status="approved"), manager)
+        sequential = time.perf_counter() - started
+
+        started = time.perf_counter()
+        result = await server.bulk_update_vacation_requests(
+            VacationRequestBulkUpdate(request_ids=bulk, status="approved"), manager
+        )
+        bulk_seconds = time.perf_counter() - started
+
+        used = await db.vacation_balances.aggregate([{"$group": {"_id": None, "days": {"$sum": "$used_days"}}}]).to_list(1)
+        print(json.dumps({
+            "batch": batch,
+            "employees": employees,
+            "one_by_one": {"seconds": round(sequential, 3), "requests_per_sec": round(batch / sequential)},
+            "bulk": {"seconds": round(bulk_seconds, 3), "requests_per_sec": round(batch / bulk_seconds),
+                     "updated": len(result.updated), "skipped": len(result.skipped)},
+            "used_days_total": used[0]["days"] if used else 0,
+        }, indent=2))
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--employees", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.batch, args.employees))
@@ -0,0 +1,47 @@
+import os
+import statistics
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+def bench_db(suffix: str = "bench"):
+    """Connect to a scratch database next to the application one"""
+    mongo_url = os.environ.get('BENCH_MONGO_URL', os.environ['MONGO_URL'])
+    client = AsyncIOMotorClient(mongo_url)
+    return client, client[f"{os.environ['DB_NAME']}_{suffix}"]
+
+
+@contextmanager
+def timer(results: List[float]):
+    """Append elapsed milliseconds of the block to results"""
+    started = time.perf_counter()
+    yield
+    results.append((time.perf_counter() - started) * 1000)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds"""
+    return {
+        "count": len(values),
+        "mean": round(statistics.fmean(values), 3) if values else 0.0,
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(max(values), 3) if values else 0.0,
+    }
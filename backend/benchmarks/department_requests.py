@@ -0,0 +1,90 @@
+"""Latency of /vacation-requests/department queries versus department size.
+
+Compares the previous three-query version (with a linear user scan per
+request) to the single $lookup aggregation used by the handler.
+
+Usage: python -m benchmarks.department_requests [--sizes 10,50,200,1000] [--requests-per-user 10]
+"""
+import argparse
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from database import ensure_indexes
+from pagination import DEFAULT_PAGE_SIZE
+from server import department_requests_pipeline
+from benchmarks.common import bench_db, summarize, timer
+
+
+async def seed(db, sizes, requests_per_user: int):
+    departments = {}
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for size in sizes:
+        department_id = str(uuid.uuid4())
+        users = [{
+            "id": str(uuid.uuid4()), "login": f"{department_id}-{i}", "role": "employee",
+            "full_name": f"Сотрудник {i}", "email": f"user{i}@example.com", "department_id": department_id,
+        } for i in range(size)]
+        requests = [{
+            "id": str(uuid.uuid4()), "user_id": user["id"], "start_date": "2024-07-01", "end_date": "2024-07-14",
+            "vacation_type": "annual", "status": "pending", "work_days": 10, "comment": None,
+            "created_at": base + timedelta(minutes=n * size + i),
+            "updated_at": base,
+        } for i, user in enumerate(users) for n in range(requests_per_user)]
+        await db.users.insert_many(users)
+        for i in range(0, len(requests), 10000):
+            await db.vacation_requests.insert_many(requests[i:i + 10000])
+        departments[size] = users[0]["id"]
+    await ensure_indexes(db)
+    return departments
+
+
+async def legacy(db, caller_id: str):
+    user = await db.users.find_one({"id": caller_id}, {"_id": 0})
+    department_users = await db.users.find({"department_id": user['department_id']}, {"_id": 0}).to_list(1000)
+    user_ids = [u['id'] for u in department_users]
+    requests = await db.vacation_requests.find(
+        {"user_id": {"$in": user_ids}}, {"_id": 0}
+    ).sort("created_at", -1).to_list(1000)
+    for req in requests:
+        req_user = next((u for u in department_users if u['id'] == req['user_id']), None)
+        if req_user:
+            req['user_name'] = req_user['full_name']
+            req['user_email'] = req_user['email']
+    return requests
+
+
+async def aggregated(db, caller_id: str):
+    user = await db.users.find_one({"id": caller_id}, {"_id": 0, "department_id": 1})
+    pipeline = department_requests_pipeline(user['department_id'], None, DEFAULT_PAGE_SIZE)
+    return await db.users.aggregate(pipeline).to_list(None)
+
+
+async def main(sizes, requests_per_user: int, repeats: int):
+    client, db = bench_db("department")
+    await client.drop_database(db.name)
+    try:
+        departments = await seed(db, sizes, requests_per_user)
+        report = []
+        for size, caller_id in departments.items():
+            results = {"legacy": [], "aggregation": []}
+            for _ in range(repeats):
+                with timer(results["legacy"]):
+                    await legacy(db, caller_id)
+                with timer(results["aggregation"]):
+                    await aggregated(db, caller_id)
+            report.append({"department_size": size, **{k: summarize(v) for k, v in results.items()}})
+        print(json.dumps(report, indent=2))
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,50,200,1000")
+    parser.add_argument("--requests-per-user", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=30)
+    args = parser.parse_args()
+    asyncio.run(main([int(s) for s in args.sizes.split(",")], args.requests_per_user, args.repeats))
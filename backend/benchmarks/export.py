@@ -0,0 +1,94 @@
+"""Throughput and peak memory of the streaming report writers.
+
+Rows are generated in chunks the way iter_report_chunks yields them, so the
+numbers isolate the writers from the database.
+
+Usage: python -m benchmarks.export [--rows 500000] [--xlsx] [--memory]
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+from utils import iter_csv, iter_xlsx
+
+COLUMNS = [
+    'Сотрудник', 'Email', 'Отдел', 'Дата начала', 'Дата окончания', 'Тип',
+    'Рабочих дней', 'Статус', 'Комментарий', 'Комментарий руководителя'
+]
+CHUNK_SIZE = 2000
+
+
+async def report_chunks(rows: int):
+    for offset in range(0, rows, CHUNK_SIZE):
+        yield [{
+            'Сотрудник': f"Сотрудник {i}",
+            'Email': f"user{i}@example.com",
+            'Отдел': "Разработка",
+            'Дата начала': "2024-07-01",
+            'Дата окончания': "2024-07-14",
+            'Тип': "Ежегодный",
+            'Рабочих дней': 10,
+            'Статус': "approved",
+            'Комментарий': "Отпуск, море",
+            'Комментарий руководителя': None,
+        } for i in range(offset, min(offset + CHUNK_SIZE, rows))]
+        await asyncio.sleep(0)
+
+
+async def measure(name: str, stream, memory: bool):
+    if memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    first_byte = None
+    size = 0
+    async for piece in stream:
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+        size += len(piece)
+    elapsed = time.perf_counter() - started
+    result = {
+        "writer": name,
+        "seconds": round(elapsed, 2),
+        "first_byte_ms": round(first_byte * 1000, 1),
+        "output_mb": round(size / 2 ** 20, 1),
+    }
+    if memory:
+        # tracemalloc slows allocation-heavy writers down, so timings are only
+        # comparable between runs with the same flag
+        result["peak_python_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        tracemalloc.stop()
+    return result
+
+
+async def pandas_baseline(rows: int):
+    """The previous exporter: full list of dicts -> DataFrame -> one string"""
+    import pandas as pd
+    from io import StringIO
+    data = [row async for chunk in report_chunks(rows) for row in chunk]
+    buffer = StringIO()
+    pd.DataFrame(data).to_csv(buffer, index=False, encoding='utf-8')
+    yield buffer.getvalue().encode('utf-8-sig')
+
+
+async def main(rows: int, xlsx: bool, memory: bool):
+    results = [await measure("csv", iter_csv(report_chunks(rows), COLUMNS), memory)]
+    if xlsx:
+        results.append(await measure("xlsx", iter_xlsx(report_chunks(rows), COLUMNS), memory))
+    try:
+        import pandas  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        results.append(await measure("pandas (previous)", pandas_baseline(rows), memory))
+    print(json.dumps({"rows": rows, "results": results}, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--xlsx", action="store_true")
+    parser.add_argument("--memory", action="store_true", help="track peak Python memory with tracemalloc")
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.xlsx, args.memory))
@@ -0,0 +1,294 @@
+"""HTTP load test of the /api endpoints with a realistic mix of user actions.
+
+Fills a scratch database with generate_data (or reuses it with --reuse),
+starts the API with uvicorn in a subprocess, logs in as generated
+employees, managers and HR, and runs virtual users for a fixed time. Each
+virtual user repeats weighted scenarios:
+
+    dashboard  employee opens the dashboard: profile, balance, own requests, departments
+    overlap    employee picks dates and checks them against the department
+    approval   manager lists the department's requests and decides a pending one
+    export     HR loads the analytics summary and exports a CSV report
+
+The JSON report has throughput and p50/p95/p99 per endpoint and the git
+commit. Save it with --output; with --baseline the run is compared to an
+earlier report and exits with status 1 when an endpoint's p95 or the total
+throughput got worse by more than --threshold percent.
+
+Usage: python -m benchmarks.http_load [--users 2000] [--concurrency 50] [--duration 60]
+       [--mix dashboard=60,overlap=20,approval=15,export=5] [--output run.json] [--baseline main.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.common import ROOT_DIR, bench_db, summarize
+from generate_data import DEFAULT_PASSWORD, GENERATED_COLLECTIONS, generate
+
+DEFAULT_MIX = "dashboard=60,overlap=20,approval=15,export=5"
+# Accounts logged in per role, virtual users share them
+ACCOUNTS = {"employee": 200, "manager": 40, "hr": 5}
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}, choose from {', '.join(SCENARIOS)}")
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Recorder:
+    """Latencies and status codes per endpoint, ignoring calls made during warm-up"""
+
+    def __init__(self):
+        self.recording = False
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.scenarios: Dict[str, int] = {}
+
+    async def call(self, http: httpx.AsyncClient, method: str, url: str, endpoint: str, token: str,
+                   **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await http.request(method, url, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            response, status = None, type(e).__name__
+        if self.recording:
+            name = f"{method} {endpoint}"
+            self.latencies.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+            counts = self.statuses.setdefault(name, {})
+            counts[status] = counts.get(status, 0) + 1
+        return response
+
+
+def random_dates(rnd: random.Random) -> dict:
+    start = date.today() + timedelta(days=rnd.randint(14, 300))
+    return {"start_date": start.isoformat(), "end_date": (start + timedelta(days=rnd.choice([4, 6, 13]))).isoformat()}
+
+
+async def dashboard(http, rec: Recorder, tokens: Dict[str, List[str]], rnd: random.Random):
+    token = rnd.choice(tokens["employee"])
+    await rec.call(http, "GET", "/api/auth/me", "/api/auth/me", token)
+    await asyncio.gather(
+        rec.call(http, "GET", "/api/vacation-balance/my", "/api/vacation-balance/my", token),
+        rec.call(http, "GET", "/api/vacation-requests/my", "/api/vacation-requests/my", token),
+        rec.call(http, "GET", "/api/departments", "/api/departments", token),
+    )
+
+
+async def overlap(http, rec: Recorder, tokens: Dict[str, List[str]], rnd: random.Random):
+    token = rnd.choice(tokens["employee"])
+    await rec.call(http, "POST", "/api/vacation-requests/check-overlap", "/api/vacation-requests/check-overlap",
+                   token, json={**random_dates(rnd), "vacation_type": "annual"})
+
+
+async def approval(http, rec: Recorder, tokens: Dict[str, List[str]], rnd: random.Random):
+    token = rnd.choice(tokens["manager"])
+    response = await rec.call(http, "GET", "/api/vacation-requests/department", "/api/vacation-requests/department",
+                              token, params={"limit": 50})
+    if response is None or response.status_code != 200:
+        return
+    pending = [r for r in response.json() if r["status"] == "pending"]
+    if pending:
+        # a random pick keeps managers of one department from racing for the same request
+        request = rnd.choice(pending)
+        await rec.call(http, "PUT", f"/api/vacation-requests/{request['id']}", "/api/vacation-requests/{request_id}",
+                       token, json={"status": rnd.choices(["approved", "rejected"], [9, 1])[0]})
+
+
+async def export(http, rec: Recorder, tokens: Dict[str, List[str]], rnd: random.Random):
+    token = rnd.choice(tokens["hr"])
+    year = date.today().year - rnd.randint(0, 1)
+    await rec.call(http, "GET", "/api/analytics/summary", "/api/analytics/summary", token)
+    await rec.call(http, "GET", "/api/reports/export-csv", "/api/reports/export-csv", token,
+                   params={"start_date": f"{year}-06-01", "end_date": f"{year}-08-31"})
+
+
+SCENARIOS = {"dashboard": dashboard, "overlap": overlap, "approval": approval, "export": export}
+
+
+async def virtual_user(http, rec: Recorder, tokens: Dict[str, List[str]], mix: Dict[str, int], seed: int,
+                       stop: asyncio.Event):
+    rnd = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    while not stop.is_set():
+        name = rnd.choices(names, weights)[0]
+        await SCENARIOS[name](http, rec, tokens, rnd)
+        if rec.recording:
+            rec.scenarios[name] = rec.scenarios.get(name, 0) + 1
+
+
+async def log_in(http: httpx.AsyncClient, db, concurrency: int) -> Dict[str, List[str]]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(login: str) -> str:
+        async with semaphore:
+            response = await http.post("/api/auth/login", json={"login": login, "password": DEFAULT_PASSWORD})
+            response.raise_for_status()
+            return response.json()["token"]
+
+    tokens = {}
+    for role, count in ACCOUNTS.items():
+        logins = [u["login"] async for u in db.users.find({"role": role}, {"login": 1}).sort("login", 1).limit(count)]
+        if not logins:
+            raise RuntimeError(f"no {role} users in {db.name}, run without --reuse")
+        tokens[role] = await asyncio.gather(*(one(login) for login in logins))
+    return tokens
+
+
+async def wait_ready(http: httpx.AsyncClient):
+    for _ in range(200):
+        try:
+            await http.get("/api/departments")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def run(base_url: str, db, mix: Dict[str, int], concurrency: int, duration: float, warmup: float,
+              seed: int) -> dict:
+    rec = Recorder()
+    limits = httpx.Limits(max_connections=concurrency * 3, max_keepalive_connections=concurrency * 3)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as http:
+        await wait_ready(http)
+        started = time.perf_counter()
+        tokens = await log_in(http, db, concurrency)
+        login_seconds = time.perf_counter() - started
+
+        stop = asyncio.Event()
+        users = [asyncio.create_task(virtual_user(http, rec, tokens, mix, seed + i, stop)) for i in range(concurrency)]
+        await asyncio.sleep(warmup)
+        rec.recording = True
+        started = time.perf_counter()
+        await asyncio.sleep(duration)
+        rec.recording = False
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await asyncio.gather(*users)
+
+    endpoints = {}
+    for name in sorted(rec.latencies):
+        endpoints[name] = {
+            "rps": round(len(rec.latencies[name]) / elapsed, 1),
+            "latency_ms": summarize(rec.latencies[name]),
+            "statuses": rec.statuses[name],
+        }
+    total = sum(len(values) for values in rec.latencies.values())
+    failed = sum(count for counts in rec.statuses.values() for status, count in counts.items()
+                 if not status.isdigit() or int(status) >= 500)
+    return {
+        "commit": git_commit(),
+        "mix": mix,
+        "concurrency": concurrency,
+        "duration_seconds": round(elapsed, 1),
+        "login_seconds": round(login_seconds, 1),
+        "requests": total,
+        "rps": round(total / elapsed, 1),
+        "failed": failed,
+        "latency_ms": summarize([ms for values in rec.latencies.values() for ms in values]),
+        "scenarios_per_sec": {name: round(count / elapsed, 1) for name, count in sorted(rec.scenarios.items())},
+        "endpoints": endpoints,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """Endpoints whose p95 grew, or a total throughput that fell, by more than threshold percent"""
+    regressions = []
+    for name, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous or not previous["latency_ms"]["p95"]:
+            continue
+        change = (current["latency_ms"]["p95"] / previous["latency_ms"]["p95"] - 1) * 100
+        current["p95_change_pct"] = round(change, 1)
+        if change > threshold:
+            regressions.append(f"{name}: p95 {previous['latency_ms']['p95']} -> {current['latency_ms']['p95']} ms")
+    if baseline.get("rps"):
+        change = (results["rps"] / baseline["rps"] - 1) * 100
+        results["rps_change_pct"] = round(change, 1)
+        if change < -threshold:
+            regressions.append(f"throughput: {baseline['rps']} -> {results['rps']} rps")
+    return regressions
+
+
+async def main(args) -> int:
+    client, db = bench_db("http")
+    try:
+        if not args.reuse:
+            for collection in GENERATED_COLLECTIONS:
+                await db.drop_collection(collection)
+            report = await generate(db, args.users, max(2, args.users // 200), 2, 2.5, args.seed,
+                                    batch_size=5000, concurrency=4, password=DEFAULT_PASSWORD)
+            print(f"Generated {report['documents']} in {report['total_seconds']}s", file=sys.stderr)
+
+        env = {
+            **os.environ,
+            "MONGO_URL": os.environ.get('BENCH_MONGO_URL', os.environ['MONGO_URL']),
+            "DB_NAME": db.name,
+            # approvals must not send real email
+            "SENDGRID_API_KEY": "",
+        }
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--port", str(args.port), "--workers", str(args.workers),
+             "--log-level", "warning", "--no-access-log"],
+            cwd=ROOT_DIR, env=env
+        )
+        try:
+            results = await run(f"http://127.0.0.1:{args.port}", db, args.mix, args.concurrency, args.duration,
+                                args.warmup, args.seed)
+        finally:
+            server.terminate()
+            server.wait()
+        results["workers"] = args.workers
+
+        regressions = []
+        if args.baseline:
+            regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.threshold)
+            results["regressions"] = regressions
+        output = json.dumps(results, indent=2, ensure_ascii=False)
+        if args.output:
+            Path(args.output).write_text(output + "\n")
+        print(output)
+        return 1 if regressions else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000, help="generated users, two years of history")
+    parser.add_argument("--reuse", action="store_true", help="keep the data of the previous run")
+    parser.add_argument("--concurrency", type=int, default=50, help="virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds run before measuring")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=20, help="allowed regression in percent")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,121 @@
+"""Compare query plans of the API query shapes before and after ensure_indexes.
+
+Usage: python -m benchmarks.indexes [--users 20000] [--requests-per-user 5]
+"""
+import argparse
+import asyncio
+import random
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+from database import ensure_indexes
+from benchmarks.common import bench_db
+
+STATUSES = ["pending", "approved", "rejected", "cancelled"]
+
+
+async def seed(db, users_count: int, requests_per_user: int):
+    rnd = random.Random(42)
+    departments = [{"id": str(uuid.uuid4()), "name": f"Отдел {i}", "max_simultaneous_vacations": 2} for i in range(50)]
+    await db.departments.insert_many(departments)
+
+    users, balances, requests, history = [], [], [], []
+    for i in range(users_count):
+        user_id = str(uuid.uuid4())
+        users.append({
+            "id": user_id,
+            "login": f"user{i}",
+            "role": "employee",
+            "full_name": f"Сотрудник {i}",
+            "email": f"user{i}@example.com",
+            "department_id": rnd.choice(departments)["id"],
+        })
+        balances.append({"id": str(uuid.uuid4()), "user_id": user_id, "year": 2024, "total_days": 28, "used_days": 0})
+        for _ in range(requests_per_user):
+            start = date(2024, 1, 1) + timedelta(days=rnd.randrange(365))
+            created = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=rnd.randrange(525600))
+            request_id = str(uuid.uuid4())
+            requests.append({
+                "id": request_id,
+                "user_id": user_id,
+                "start_date": start.isoformat(),
+                "end_date": (start + timedelta(days=rnd.randrange(1, 14))).isoformat(),
+                "vacation_type": "annual",
+                "status": rnd.choice(STATUSES),
+                "work_days": 5,
+                "created_at": created,
+            })
+            history.append({"id": str(uuid.uuid4()), "request_id": request_id, "action": "approved",
+                            "acted_at": created})
+    for collection, docs in [("users", users), ("vacation_balances", balances),
+                             ("vacation_requests", requests), ("request_history", history)]:
+        for i in range(0, len(docs), 10000):
+            await db[collection].insert_many(docs[i:i + 10000], ordered=False)
+    return users, requests
+
+
+def query_shapes(users, requests):
+    user = users[len(users) // 2]
+    request = requests[len(requests) // 2]
+    department_user_ids = [u["id"] for u in users if u["department_id"] == user["department_id"]]
+    return [
+        ("users by login", "users", {"login": user["login"]}, None),
+        ("users by id", "users", {"id": user["id"]}, None),
+        ("users by department", "users", {"department_id": user["department_id"]}, None),
+        ("balance by user/year", "vacation_balances", {"user_id": user["id"], "year": 2024}, None),
+        ("request by id", "vacation_requests", {"id": request["id"]}, None),
+        ("my requests", "vacation_requests", {"user_id": user["id"]}, [("created_at", -1), ("id", -1)]),
+        ("department approved", "vacation_requests",
+         {"user_id": {"$in": department_user_ids}, "status": "approved"}, None),
+        ("all requests", "vacation_requests", {}, [("created_at", -1), ("id", -1)]),
+        ("report by start_date", "vacation_requests",
+         {"start_date": {"$gte": "2024-06-01", "$lte": "2024-06-30"}}, None),
+        ("history by request", "request_history", {"request_id": request["id"]}, None),
+    ]
+
+
+def _stages(plan: dict):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+async def explain(db, collection: str, query: dict, sort):
+    cursor = db[collection].find(query, {"_id": 0}).limit(1000)
+    if sort:
+        cursor = cursor.sort(sort)
+    result = await cursor.explain()
+    stages = [s for s in _stages(result["queryPlanner"]["winningPlan"]) if s]
+    stats = result.get("executionStats", {})
+    scan = "IXSCAN" if "IXSCAN" in stages else "COLLSCAN" if "COLLSCAN" in stages else stages[-1]
+    return scan, stats.get("totalDocsExamined"), stats.get("executionTimeMillis")
+
+
+async def main(users_count: int, requests_per_user: int):
+    client, db = bench_db("indexes")
+    await client.drop_database(db.name)
+    try:
+        users, requests = await seed(db, users_count, requests_per_user)
+        shapes = query_shapes(users, requests)
+
+        before = [await explain(db, c, q, s) for _, c, q, s in shapes]
+        await ensure_indexes(db)
+        after = [await explain(db, c, q, s) for _, c, q, s in shapes]
+
+        print(f"{'query':<24}{'before':<30}{'after':<30}")
+        for (name, *_), b, a in zip(shapes, before, after):
+            print(f"{name:<24}{f'{b[0]} docs={b[1]} {b[2]}ms':<30}{f'{a[0]} docs={a[1]} {a[2]}ms':<30}")
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--requests-per-user", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.requests_per_user))
@@ -0,0 +1,93 @@
+"""Measure latency of an unrelated endpoint while a burst of logins is in progress.
+
+Run against a live server, e.g.
+    uvicorn server:app --port 8000
+    python -m benchmarks.login_burst --url http://localhost:8000 --logins 200
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import List
+
+import httpx
+
+from benchmarks.common import summarize, timer
+
+LOGIN = "bench_login_user"
+PASSWORD = "bench-password"
+
+
+async def ensure_user(http: httpx.AsyncClient, department_id: str):
+    await http.post("/api/auth/register", json={
+        "login": LOGIN,
+        "password": PASSWORD,
+        "role": "employee",
+        "full_name": "Нагрузочный Тест",
+        "email": "bench@example.com",
+        "department_id": department_id,
+    })
+    response = await http.post("/api/auth/login", json={"login": LOGIN, "password": PASSWORD})
+    response.raise_for_status()
+    return response.json()["token"]
+
+
+async def probe(http: httpx.AsyncClient, token: str, stop: asyncio.Event, latencies: List[float]):
+    headers = {"Authorization": f"Bearer {token}"}
+    while not stop.is_set():
+        with timer(latencies):
+            await http.get("/api/departments", headers=headers)
+        await asyncio.sleep(0.01)
+
+
+async def login_burst(http: httpx.AsyncClient, count: int, concurrency: int, latencies: List[float]):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            with timer(latencies):
+                await http.post("/api/auth/login", json={"login": LOGIN, "password": PASSWORD})
+
+    await asyncio.gather(*(one() for _ in range(count)))
+
+
+async def main(url: str, logins: int, concurrency: int, department_id: str):
+    limits = httpx.Limits(max_connections=concurrency + 4)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as http:
+        token = await ensure_user(http, department_id)
+
+        idle: List[float] = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(http, token, stop, idle))
+        await asyncio.sleep(2)
+        stop.set()
+        await task
+
+        during: List[float] = []
+        login_latencies: List[float] = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(http, token, stop, during))
+        started = time.perf_counter()
+        await login_burst(http, logins, concurrency, login_latencies)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await task
+
+    print(json.dumps({
+        "logins": logins,
+        "concurrency": concurrency,
+        "logins_per_sec": round(logins / elapsed, 1),
+        "login_ms": summarize(login_latencies),
+        "probe_idle_ms": summarize(idle),
+        "probe_during_burst_ms": summarize(during),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--department-id", default="bench-department")
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.logins, args.concurrency, args.department_id))
@@ -0,0 +1,173 @@
+"""Regression check for the hot helpers in utils and the models on every request path.
+
+Each case runs on fixed, seeded datasets of increasing size and reports the
+best time per call over several repeats. Results are compared with the
+baseline file: a case slower than its baseline by more than --threshold
+percent fails the run with exit status 1, so CI can run it after the
+build. Baselines depend on the machine, so each host and Python version
+has its own file, which is not committed; record it with --save on the
+machine that checks it, and again after an intended change.
+benchmarks/test_micro.py runs the same check under pytest when that file
+exists, and always checks speedups measured within one run.
+
+Usage: python -m benchmarks.micro [--filter check_overlap] [--threshold 15] [--save]
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import timeit
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from pydantic import TypeAdapter
+
+from models import User, VacationRequest, VacationRequestCreate
+from utils import calculate_work_days, calculate_work_days_batch, check_overlap, export_to_csv
+
+BASELINE_PATH = Path(__file__).parent / "baselines" / (
+    f"micro-{platform.node() or 'host'}-py{sys.version_info.major}.{sys.version_info.minor}.json"
+)
+SIZES = (10, 1000, 10000)
+REPEAT = 5
+
+STATUSES = ["pending", "approved", "rejected", "cancelled"]
+
+
+def make_ranges(count: int, rnd: random.Random) -> List[Tuple[str, str]]:
+    ranges = []
+    for _ in range(count):
+        start = date(2024, 1, 1) + timedelta(days=rnd.randrange(2 * 365))
+        ranges.append((start.isoformat(), (start + timedelta(days=rnd.randrange(30))).isoformat()))
+    return ranges
+
+
+def make_requests(count: int, rnd: random.Random) -> List[dict]:
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    requests = []
+    for i, (start, end) in enumerate(make_ranges(count, rnd)):
+        requests.append({
+            "id": str(uuid.UUID(int=rnd.getrandbits(128), version=4)), "user_id": f"user{i % 500}",
+            "start_date": start, "end_date": end, "vacation_type": "annual", "status": rnd.choice(STATUSES),
+            "comment": None, "manager_comment": None, "work_days": 10, "reserved_days": 0, "balance_year": 2024,
+            "created_at": base + timedelta(minutes=i), "updated_at": base + timedelta(minutes=i),
+        })
+    return requests
+
+
+def make_users(count: int, rnd: random.Random) -> List[dict]:
+    return [{
+        "id": str(uuid.UUID(int=rnd.getrandbits(128), version=4)), "login": f"user{i}", "password_hash": "x" * 60,
+        "role": "employee", "full_name": f"Сотрудник {i}", "email": f"user{i}@example.com",
+        "department_id": "dept", "manager_id": None, "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+    } for i in range(count)]
+
+
+def report_rows(requests: List[dict]) -> List[dict]:
+    """Rows shaped like the HR report export"""
+    return [{
+        "Сотрудник": f"Сотрудник {r['user_id']}", "Email": f"{r['user_id']}@example.com",
+        "Дата начала": r["start_date"], "Дата окончания": r["end_date"], "Тип": r["vacation_type"],
+        "Статус": r["status"], "Рабочих дней": r["work_days"], "Комментарий": r["comment"] or "",
+    } for r in requests]
+
+
+def build_cases() -> Dict[str, Callable[[], object]]:
+    """Case id (function[size]) to a zero-argument call over its dataset"""
+    cases = {}
+    request_adapter = TypeAdapter(List[VacationRequest])
+    for size in SIZES:
+        # every case of a size starts from the same seed, so datasets never change between runs
+        ranges = make_ranges(size, random.Random(size))
+        requests = make_requests(size, random.Random(size))
+        users = make_users(size, random.Random(size))
+        rows = report_rows(requests)
+        models = [VacationRequest(**r) for r in requests]
+        creates = [{"start_date": s, "end_date": e, "vacation_type": "annual"} for s, e in ranges]
+
+        cases[f"calculate_work_days[{size}]"] = lambda ranges=ranges: [calculate_work_days(s, e) for s, e in ranges]
+        cases[f"calculate_work_days_batch[{size}]"] = lambda ranges=ranges: calculate_work_days_batch(ranges)
+        # one candidate range against a department with size requests
+        cases[f"check_overlap[{size}]"] = lambda requests=requests: check_overlap(requests, "2024-07-01", "2024-07-28", 2)
+        cases[f"export_to_csv[{size}]"] = lambda rows=rows: export_to_csv(rows)
+        cases[f"VacationRequest.validate[{size}]"] = lambda requests=requests: [VacationRequest(**r) for r in requests]
+        cases[f"VacationRequest.dump[{size}]"] = lambda models=models: [m.model_dump() for m in models]
+        cases[f"VacationRequest.list_json[{size}]"] = (
+            lambda models=models: request_adapter.dump_json(models)
+        )
+        cases[f"VacationRequestCreate.validate[{size}]"] = (
+            lambda creates=creates: [VacationRequestCreate(**c) for c in creates]
+        )
+        cases[f"User.validate[{size}]"] = lambda users=users: [User(**u) for u in users]
+    return cases
+
+
+def measure(fn: Callable[[], object], repeat: int = REPEAT) -> float:
+    """Best time of one call in microseconds; each repeat runs long enough to be timed reliably"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def measure_against(fn: Callable[[], object], baseline: float, threshold: float, repeat: int = REPEAT,
+                    attempts: int = 2) -> float:
+    """Like measure, but a result over the threshold is measured again, up to
+    attempts times; a busy machine slows single runs, only a slowdown that
+    repeats counts"""
+    us = measure(fn, repeat)
+    for _ in range(attempts - 1):
+        if us <= baseline * (1 + threshold / 100):
+            break
+        us = min(us, measure(fn, repeat))
+    return us
+
+
+def main(args) -> int:
+    baseline_path = Path(args.baseline)
+    baselines = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+
+    results = {}
+    regressions = []
+    for case, fn in build_cases().items():
+        if args.filter and args.filter not in case:
+            continue
+        baseline = baselines.get(case)
+        if baseline and not args.save:
+            us = measure_against(fn, baseline, args.threshold, args.repeat)
+        else:
+            us = measure(fn, args.repeat)
+        result = {"us": round(us, 3)}
+        if baseline and not args.save:
+            change = (us / baseline - 1) * 100
+            result["baseline_us"] = baseline
+            result["change_pct"] = round(change, 1)
+            if change > args.threshold:
+                regressions.append(case)
+        results[case] = result
+
+    if args.save:
+        baselines.update({case: result["us"] for case, result in results.items()})
+        baseline_path.parent.mkdir(exist_ok=True)
+        baseline_path.write_text(json.dumps(dict(sorted(baselines.items())), indent=2) + "\n")
+
+    print(json.dumps({
+        "threshold_pct": args.threshold,
+        "baseline": str(baseline_path) if baselines else None,
+        "cases": results,
+        "regressions": regressions,
+    }, indent=2))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", help="run only cases whose id contains this text")
+    parser.add_argument("--threshold", type=float, default=15, help="allowed slowdown in percent")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--save", action="store_true", help="record the results as the new baseline")
+    args = parser.parse_args()
+    sys.exit(main(args))
@@ -0,0 +1,110 @@
+"""Throughput of the notification outbox against a local stub of the SendGrid API.
+
+Usage: python -m benchmarks.notifications [--messages 1000] [--latency-ms 50] [--failure-rate 0.05]
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from database import ensure_indexes
+from email_service import EmailService
+from notifications import NotificationQueue
+from benchmarks.common import bench_db
+
+
+class StubSink(BaseHTTPRequestHandler):
+    """Accepts POST /v3/mail/send like SendGrid, with configurable latency and failures"""
+    latency = 0.05
+    failure_rate = 0.0
+    received = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            self.send_response(503)
+        else:
+            with StubSink.lock:
+                StubSink.received += 1
+            self.send_response(202)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_sink(latency: float, failure_rate: float) -> ThreadingHTTPServer:
+    StubSink.latency = latency
+    StubSink.failure_rate = failure_rate
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubSink)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def inline_baseline(sender: EmailService, count: int) -> float:
+    """The previous behaviour: one blocking send per approval"""
+    started = time.perf_counter()
+    for i in range(count):
+        sender.send_vacation_status_email(f"user{i}@example.com", "Сотрудник", "2025-07-01", "2025-07-14", "approved")
+    return time.perf_counter() - started
+
+
+async def main(messages: int, latency_ms: float, failure_rate: float, concurrency: int):
+    sink = start_sink(latency_ms / 1000, failure_rate)
+    sender = EmailService(api_key="stub", host=f"http://127.0.0.1:{sink.server_port}")
+    client, db = bench_db("notifications")
+    await client.drop_database(db.name)
+    await ensure_indexes(db)
+
+    queue = NotificationQueue(db, sender=sender, concurrency=concurrency, backoff_base=0.1, sweep_interval=0.5)
+    queue.start()
+    try:
+        baseline_count = min(messages, 50)
+        baseline = await inline_baseline(sender, baseline_count)
+
+        started = time.perf_counter()
+        for i in range(messages):
+            await queue.enqueue_vacation_status(f"request-{i}", f"history-{i}", f"user{i}@example.com", "Сотрудник",
+                                                "2025-07-01", "2025-07-14", "approved")
+        enqueue_time = time.perf_counter() - started
+        # duplicates of already queued approvals (same history entry) are dropped
+        for i in range(min(messages, 100)):
+            await queue.enqueue_vacation_status(f"request-{i}", f"history-{i}", f"user{i}@example.com", "Сотрудник",
+                                                "2025-07-01", "2025-07-14", "approved")
+
+        while await db.email_outbox.count_documents({"status": "pending"}):
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+
+        print(json.dumps({
+            "messages": messages,
+            "sink_latency_ms": latency_ms,
+            "sink_failure_rate": failure_rate,
+            "inline_per_approval_ms": round(baseline * 1000 / baseline_count, 2),
+            "queued_per_approval_ms": round(enqueue_time * 1000 / messages, 3),
+            "delivered_per_sec": round(messages / elapsed, 1),
+            "sent": await db.email_outbox.count_documents({"status": "sent"}),
+            "failed": await db.email_outbox.count_documents({"status": "failed"}),
+            "stats": queue.stats(),
+        }, indent=2))
+    finally:
+        await queue.stop()
+        await client.drop_database(db.name)
+        client.close()
+        sink.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.latency_ms, args.failure_rate, args.concurrency))
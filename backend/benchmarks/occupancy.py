@@ -0,0 +1,93 @@
+"""check-overlap and year heatmaps: range query over requests versus department_occupancy.
+
+Reuses the request data set of benchmarks.overlap_query and also reports
+how long a full rebuild of the occupancy collection takes.
+
+Usage: python -m benchmarks.occupancy [--department-size 200] [--years 10] [--checks 100]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import date, timedelta
+
+import occupancy
+from utils import build_occupancy_segments
+from benchmarks.common import bench_db, summarize, timer
+from benchmarks.overlap_query import fetch_range, seed
+
+MAX_ALLOWED = 2
+
+
+async def from_occupancy(db, department_id, start, end):
+    days = await occupancy.occupied_days(db, department_id, start, end, MAX_ALLOWED)
+    return [{
+        'date': day['date'].strftime('%Y-%m-%d'),
+        'count': day['count'] + 1,
+        'employees': [entry['user_id'] for entry in day['requests']],
+        'max_allowed': MAX_ALLOWED,
+    } for day in days]
+
+
+async def heatmap_from_requests(db, user_ids, year):
+    requests = await db.vacation_requests.find(
+        {"user_id": {"$in": user_ids}, "status": "approved",
+         "start_date": {"$lte": f"{year}-12-31"}, "end_date": {"$gte": f"{year}-01-01"}},
+        {"_id": 0, "user_id": 1, "start_date": 1, "end_date": 1, "status": 1}
+    ).to_list(None)
+    return build_occupancy_segments(requests, window=(f"{year}-01-01", f"{year}-12-31"))
+
+
+def same_warnings(expected, actual) -> bool:
+    # employees come in request order from one source and in approval order from the other
+    normalize = lambda warnings: [(w['date'], w['count'], sorted(w['employees'])) for w in warnings]
+    return normalize(expected) == normalize(actual)
+
+
+async def main(department_size: int, years: int, checks: int):
+    rnd = random.Random(3)
+    client, db = bench_db("occupancy")
+    await client.drop_database(db.name)
+    try:
+        user_ids, total = await seed(db, department_size, years, rnd)
+        department_id = str(uuid.uuid4())
+        await db.users.insert_many([{"id": user_id, "department_id": department_id} for user_id in user_ids])
+
+        started = time.perf_counter()
+        stored = await occupancy.rebuild(db)
+        rebuild_seconds = time.perf_counter() - started
+
+        results = {"range_query": [], "occupancy": [], "heatmap_requests": [], "heatmap_occupancy": []}
+        year = date.today().year
+        for _ in range(checks):
+            start = date(year, 1, 1) + timedelta(days=rnd.randrange(330))
+            window = (start.isoformat(), (start + timedelta(days=14)).isoformat())
+            with timer(results["range_query"]):
+                expected = await fetch_range(db, user_ids, *window)
+            with timer(results["occupancy"]):
+                actual = await from_occupancy(db, department_id, *window)
+            assert same_warnings(expected, actual)
+            with timer(results["heatmap_requests"]):
+                await heatmap_from_requests(db, user_ids, year)
+            with timer(results["heatmap_occupancy"]):
+                await occupancy.occupied_days(db, department_id, f"{year}-01-01", f"{year}-12-31", with_users=False)
+        print(json.dumps({
+            "department_size": department_size,
+            "requests": total,
+            "rebuild": {"seconds": round(rebuild_seconds, 2), "days": sum(stored.values())},
+            **{name: summarize(values) for name, values in results.items()},
+        }, indent=2))
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--department-size", type=int, default=200)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--checks", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.department_size, args.years, args.checks))
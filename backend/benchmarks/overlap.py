@@ -0,0 +1,105 @@
+"""Compare the sweep-line overlap check with the previous day-by-day loop.
+
+Usage: python -m benchmarks.overlap [--requests 10000] [--checks 200]
+"""
+import argparse
+import json
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from utils import check_overlap, check_overlaps_batch
+
+
+def legacy_check_overlap(requests, start_date, end_date, max_allowed):
+    """The day-by-day implementation that check_overlap replaced"""
+    warnings = []
+    start = datetime.strptime(start_date, '%Y-%m-%d').date()
+    end = datetime.strptime(end_date, '%Y-%m-%d').date()
+    requested_dates = set()
+    current = start
+    while current <= end:
+        requested_dates.add(current)
+        current += timedelta(days=1)
+    overlap_counts = {}
+    for req in requests:
+        if req.get('status') != 'approved':
+            continue
+        req_start = datetime.strptime(req['start_date'], '%Y-%m-%d').date()
+        req_end = datetime.strptime(req['end_date'], '%Y-%m-%d').date()
+        current = req_start
+        while current <= req_end:
+            if current in requested_dates:
+                if current not in overlap_counts:
+                    overlap_counts[current] = {'count': 0, 'employees': []}
+                overlap_counts[current]['count'] += 1
+                overlap_counts[current]['employees'].append(req.get('user_id'))
+            current += timedelta(days=1)
+    for day, data in overlap_counts.items():
+        if data['count'] >= max_allowed:
+            warnings.append({
+                'date': day.strftime('%Y-%m-%d'),
+                'count': data['count'] + 1,
+                'employees': data['employees'],
+                'max_allowed': max_allowed
+            })
+    return warnings
+
+
+def make_requests(count: int, rnd: random.Random):
+    requests = []
+    for i in range(count):
+        start = date(2020, 1, 1) + timedelta(days=rnd.randrange(5 * 365))
+        requests.append({
+            "user_id": f"user-{rnd.randrange(count // 5 or 1)}",
+            "start_date": start.isoformat(),
+            "end_date": (start + timedelta(days=rnd.randrange(1, 21))).isoformat(),
+            "status": "approved" if rnd.random() < 0.7 else "pending",
+        })
+    return requests
+
+
+def make_ranges(count: int, rnd: random.Random):
+    ranges = []
+    for _ in range(count):
+        start = date(2020, 1, 1) + timedelta(days=rnd.randrange(5 * 365))
+        ranges.append((start.isoformat(), (start + timedelta(days=rnd.randrange(1, 28))).isoformat()))
+    return ranges
+
+
+def main(requests_count: int, checks: int, max_allowed: int):
+    rnd = random.Random(7)
+    requests = make_requests(requests_count, rnd)
+    ranges = make_ranges(checks, rnd)
+
+    started = time.perf_counter()
+    legacy = [legacy_check_overlap(requests, s, e, max_allowed) for s, e in ranges]
+    legacy_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    single = [check_overlap(requests, s, e, max_allowed) for s, e in ranges]
+    single_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = check_overlaps_batch(requests, ranges, max_allowed)
+    batch_time = time.perf_counter() - started
+
+    by_date = lambda warnings: sorted(warnings, key=lambda w: w['date'])
+    assert [by_date(w) for w in legacy] == single == batch, "implementations disagree"
+
+    print(json.dumps({
+        "requests": requests_count,
+        "checks": checks,
+        "legacy_ms_per_check": round(legacy_time * 1000 / checks, 3),
+        "sweep_ms_per_check": round(single_time * 1000 / checks, 3),
+        "batch_ms_per_check": round(batch_time * 1000 / checks, 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--checks", type=int, default=200)
+    parser.add_argument("--max-allowed", type=int, default=2)
+    args = parser.parse_args()
+    main(args.requests, args.checks, args.max_allowed)
@@ -0,0 +1,90 @@
+"""Fetch-all-then-filter versus the indexed date-range query behind check-overlap.
+
+Usage: python -m benchmarks.overlap_query [--department-size 200] [--years 10] [--checks 100]
+"""
+import argparse
+import asyncio
+import json
+import random
+import uuid
+from datetime import date, timedelta
+
+from database import ensure_indexes
+from utils import check_overlap, to_bson_date
+from benchmarks.common import bench_db, summarize, timer
+
+
+async def seed(db, department_size: int, years: int, rnd: random.Random):
+    user_ids = [str(uuid.uuid4()) for _ in range(department_size)]
+    first_year = date.today().year - years + 1
+    requests = []
+    for user_id in user_ids:
+        for year in range(first_year, first_year + years):
+            # a few vacations per person per year
+            for _ in range(3):
+                start = date(year, 1, 1) + timedelta(days=rnd.randrange(350))
+                end = start + timedelta(days=rnd.randrange(3, 15))
+                requests.append({
+                    "id": str(uuid.uuid4()),
+                    "user_id": user_id,
+                    "start_date": start.isoformat(),
+                    "end_date": end.isoformat(),
+                    "start_at": to_bson_date(start.isoformat()),
+                    "end_at": to_bson_date(end.isoformat()),
+                    "status": "approved",
+                    "vacation_type": "annual",
+                })
+    for i in range(0, len(requests), 10000):
+        await db.vacation_requests.insert_many(requests[i:i + 10000])
+    await ensure_indexes(db)
+    return user_ids, len(requests)
+
+
+async def fetch_all(db, user_ids, start, end):
+    requests = await db.vacation_requests.find(
+        {"user_id": {"$in": user_ids}, "status": "approved"}, {"_id": 0}
+    ).to_list(None)
+    return check_overlap(requests, start, end, 2)
+
+
+async def fetch_range(db, user_ids, start, end):
+    requests = await db.vacation_requests.find(
+        {"user_id": {"$in": user_ids}, "status": "approved",
+         "start_at": {"$lte": to_bson_date(end)}, "end_at": {"$gte": to_bson_date(start)}},
+        {"_id": 0, "user_id": 1, "start_date": 1, "end_date": 1, "status": 1}
+    ).to_list(None)
+    return check_overlap(requests, start, end, 2)
+
+
+async def main(department_size: int, years: int, checks: int):
+    rnd = random.Random(3)
+    client, db = bench_db("overlap")
+    await client.drop_database(db.name)
+    try:
+        user_ids, total = await seed(db, department_size, years, rnd)
+        results = {"fetch_all": [], "range_query": []}
+        for _ in range(checks):
+            start = date(date.today().year, 1, 1) + timedelta(days=rnd.randrange(330))
+            window = (start.isoformat(), (start + timedelta(days=14)).isoformat())
+            with timer(results["fetch_all"]):
+                expected = await fetch_all(db, user_ids, *window)
+            with timer(results["range_query"]):
+                actual = await fetch_range(db, user_ids, *window)
+            assert expected == actual
+        print(json.dumps({
+            "department_size": department_size,
+            "requests": total,
+            **{name: summarize(values) for name, values in results.items()},
+        }, indent=2))
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--department-size", type=int, default=200)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--checks", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.department_size, args.years, args.checks))
@@ -0,0 +1,100 @@
+"""Per-row cost of turning request documents into a JSON response body.
+
+Compares the previous path (ISO strings parsed back with fromisoformat, then
+response_model validation and serialization, or jsonable_encoder for
+endpoints without a model) with projecting native-datetime documents and
+dumping them with orjson.
+
+Usage: python -m benchmarks.serialization [--rows 5000] [--repeat 5]
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from models import VacationRequest
+from serialization import project
+
+STATUSES = ["pending", "approved", "rejected", "cancelled"]
+
+
+def make_docs(count: int) -> List[dict]:
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [{
+        "id": str(uuid.uuid4()), "user_id": str(uuid.uuid4()), "start_date": "2024-07-01", "end_date": "2024-07-14",
+        "vacation_type": "annual", "status": STATUSES[i % len(STATUSES)], "comment": "Отпуск с семьёй",
+        "manager_comment": None, "work_days": 10, "reserved_days": 0, "balance_year": 2024,
+        "created_at": base + timedelta(minutes=i), "updated_at": base + timedelta(minutes=i),
+        # stored next to the model fields, not part of the response
+        "start_at": datetime(2024, 7, 1), "end_at": datetime(2024, 7, 14),
+    } for i in range(count)]
+
+
+def with_string_timestamps(docs: List[dict]) -> List[dict]:
+    return [{**doc, "created_at": doc["created_at"].isoformat(), "updated_at": doc["updated_at"].isoformat()}
+            for doc in docs]
+
+
+def best_us_per_row(fn, docs: List[dict], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        # the legacy paths modify documents in place, as the handlers did
+        batch = [dict(doc) for doc in docs]
+        started = time.perf_counter()
+        fn(batch)
+        timings.append(time.perf_counter() - started)
+    return round(min(timings) * 1e6 / len(docs), 3)
+
+
+def main(rows: int, repeat: int):
+    adapter = TypeAdapter(List[VacationRequest])
+    docs = make_docs(rows)
+    legacy_docs = with_string_timestamps(docs)
+
+    def parse(batch):
+        for doc in batch:
+            for field in ('created_at', 'updated_at'):
+                if isinstance(doc.get(field), str):
+                    doc[field] = datetime.fromisoformat(doc[field])
+        return batch
+
+    def response_model(batch):
+        return json.dumps(adapter.dump_python(adapter.validate_python(parse(batch)), mode="json"),
+                          ensure_ascii=False).encode("utf-8")
+
+    def encoder(batch):
+        return json.dumps(jsonable_encoder(parse(batch)), ensure_ascii=False).encode("utf-8")
+
+    def fast(batch):
+        return orjson.dumps(project(batch, VacationRequest))
+
+    # same fields and values; pydantic writes UTC as "Z", orjson as "+00:00"
+    for new, old in zip(json.loads(fast(docs[:100])), json.loads(response_model([dict(doc) for doc in legacy_docs[:100]]))):
+        for field in ('created_at', 'updated_at'):
+            assert datetime.fromisoformat(new.pop(field)) == datetime.fromisoformat(old.pop(field).replace("Z", "+00:00"))
+        assert new == old
+
+    results = {
+        "rows": rows,
+        "legacy_response_model_us_per_row": best_us_per_row(response_model, legacy_docs, repeat),
+        "legacy_jsonable_encoder_us_per_row": best_us_per_row(encoder, legacy_docs, repeat),
+        "orjson_projection_us_per_row": best_us_per_row(fast, docs, repeat),
+    }
+    results["speedup_vs_response_model"] = round(
+        results["legacy_response_model_us_per_row"] / results["orjson_projection_us_per_row"], 1
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.rows, args.repeat)
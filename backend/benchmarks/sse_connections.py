@@ -0,0 +1,156 @@
+"""Connection load test of the /api/events/stream push channel.
+
+Starts the API with uvicorn in a subprocess on a scratch database, opens
+many idle SSE connections (managers of one department and HR), then
+creates requests through the API and measures how long each event takes
+to reach every connection, plus the server's memory per connection.
+
+Raise the open-file limit first for large runs (ulimit -n 65536).
+
+Usage: python -m benchmarks.sse_connections [--connections 2000] [--events 20] [--port 8765]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import List
+
+import httpx
+
+from auth import create_access_token
+from benchmarks.common import ROOT_DIR, bench_db, summarize
+
+
+def rss_mb(pid: int) -> float:
+    """Resident memory of a process, from /proc (Linux)"""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return 0.0
+
+
+async def wait_ready(client: httpx.AsyncClient, token: str):
+    for _ in range(100):
+        try:
+            await client.get("/api/auth/me", headers={"Authorization": f"Bearer {token}"})
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def listen(client: httpx.AsyncClient, token: str, expected: int, received: List[float],
+                 connected: asyncio.Event):
+    try:
+        ticket = await client.post("/api/events/ticket", headers={"Authorization": f"Bearer {token}"})
+        ticket.raise_for_status()
+        async with client.stream("GET", "/api/events/stream", params={"ticket": ticket.json()["ticket"]}) as response:
+            response.raise_for_status()
+            connected.set()
+            async for line in response.aiter_lines():
+                if line.startswith("data: "):
+                    received.append(time.perf_counter())
+                    if len(received) == expected:
+                        return
+    finally:
+        # a failed connection must not stall the ramp-up
+        connected.set()
+
+
+async def run(base_url: str, connections: int, event_count: int, server_pid: int) -> dict:
+    department_id = str(uuid.uuid4())
+    employee = create_access_token({"sub": str(uuid.uuid4()), "role": "employee", "department_id": department_id})
+    listeners = [
+        create_access_token({"sub": str(uuid.uuid4()), "role": role, "department_id": department_id})
+        for role in (["manager"] * 9 + ["hr"]) for _ in range(connections // 10)
+    ]
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    timeout = httpx.Timeout(60.0)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        await wait_ready(client, employee)
+        rss_idle = rss_mb(server_pid)
+
+        per_event: List[List[float]] = [[] for _ in range(event_count)]
+        received: List[List[float]] = [[] for _ in listeners]
+        started = time.perf_counter()
+        tasks = []
+        for i, token in enumerate(listeners):
+            connected = asyncio.Event()
+            tasks.append(asyncio.create_task(listen(client, token, event_count, received[i], connected)))
+            await connected.wait()
+        connect_seconds = time.perf_counter() - started
+        await asyncio.sleep(1)
+        rss_connected = rss_mb(server_pid)
+        active = [times for times, task in zip(received, tasks) if not task.done()]
+
+        sent_at = []
+        for n in range(event_count):
+            sent_at.append(time.perf_counter())
+            response = await client.post(
+                "/api/vacation-requests",
+                headers={"Authorization": f"Bearer {employee}"},
+                json={"start_date": "2024-07-01", "end_date": "2024-07-05", "vacation_type": "unpaid"}
+            )
+            response.raise_for_status()
+            # let the fan-out finish so events are timed one at a time
+            while sum(len(times) > n for times in active) < len(active):
+                await asyncio.sleep(0.001)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    for times in active:
+        for n, at in enumerate(times):
+            per_event[n].append((at - sent_at[n]) * 1000)
+    last_delivery = [max(times) for times in per_event]
+
+    return {
+        "connections": len(active),
+        "events": event_count,
+        "connect_seconds": round(connect_seconds, 2),
+        "delivery_ms": summarize([ms for times in per_event for ms in times]),
+        "fan_out_complete_ms": summarize(last_delivery),
+        "server_rss_idle_mb": rss_idle,
+        "server_rss_connected_mb": rss_connected,
+        "server_kb_per_connection": round((rss_connected - rss_idle) * 1024 / max(len(active), 1), 1),
+    }
+
+
+async def main(connections: int, event_count: int, port: int):
+    client, db = bench_db("sse")
+    await client.drop_database(db.name)
+
+    env = {
+        **os.environ,
+        "MONGO_URL": os.environ.get('BENCH_MONGO_URL', os.environ['MONGO_URL']),
+        "DB_NAME": db.name,
+        "EVENTS_MAX_CONNECTIONS": str(connections + 100),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR, env=env
+    )
+    try:
+        results = await run(f"http://127.0.0.1:{port}", connections, event_count, server.pid)
+        print(json.dumps(results, indent=2))
+    finally:
+        server.terminate()
+        server.wait()
+        await client.drop_database(db.name)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=2000)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(main(args.connections, args.events, args.port))
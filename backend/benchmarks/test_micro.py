@@ -0,0 +1,97 @@
+"""The micro benchmarks as pytest checks.
+
+Absolute times only mean something on the machine that recorded them, so
+the baseline comparison runs only when this host has its own baseline
+file (python -m benchmarks.micro --save) and fails when a case is slower
+than it by more than MICRO_THRESHOLD percent (default 50).
+
+What holds on any machine is how the optimised helpers compare with the
+implementations they replaced, timed side by side in the same run; each
+must stay at least its minimum speedup ahead.
+
+Usage (from backend/): pytest benchmarks/test_micro.py [-k check_overlap]
+"""
+import importlib.util
+import json
+import os
+import random
+from typing import List
+
+import pytest
+from pydantic import TypeAdapter
+
+from benchmarks.micro import BASELINE_PATH, build_cases, make_ranges, make_requests, measure, measure_against
+from benchmarks.overlap import legacy_check_overlap
+from benchmarks.work_days import rrule_work_days
+from models import VacationRequest
+from utils import calculate_work_days, calculate_work_days_batch, check_overlap
+
+THRESHOLD = float(os.environ.get('MICRO_THRESHOLD', 50))
+SPEEDUP_SIZE = 1000
+
+BASELINES = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+# datasets for the baseline cases, built only when there is a baseline to check
+_built = {}
+
+
+def _cases():
+    if not _built:
+        _built.update(build_cases())
+    return _built
+
+
+@pytest.mark.skipif(not BASELINES, reason=f"no baseline for this host: {BASELINE_PATH.name}")
+@pytest.mark.parametrize("case", sorted(BASELINES))
+def test_no_regression(case):
+    baseline = BASELINES[case]
+    cases = _cases()
+    if case not in cases:
+        pytest.skip("case no longer exists")
+    us = measure_against(cases[case], baseline, THRESHOLD, attempts=3)
+    assert us <= baseline * (1 + THRESHOLD / 100), (
+        f"{case}: {us:.1f} us per call, baseline {baseline} us (+{(us / baseline - 1) * 100:.0f}%)"
+    )
+
+
+def _speedup_pairs():
+    ranges = make_ranges(SPEEDUP_SIZE, random.Random(SPEEDUP_SIZE))
+    requests = make_requests(SPEEDUP_SIZE, random.Random(SPEEDUP_SIZE))
+    models = [VacationRequest(**r) for r in requests]
+    adapter = TypeAdapter(List[VacationRequest])
+    # id: (optimised, reference, minimum speedup); the minimums are well under what is measured
+    pairs = {
+        "calculate_work_days_batch": (
+            lambda: calculate_work_days_batch(ranges),
+            lambda: [calculate_work_days(s, e) for s, e in ranges], 1.5
+        ),
+        "check_overlap": (
+            lambda: check_overlap(requests, "2024-07-01", "2024-07-28", 2),
+            lambda: legacy_check_overlap(requests, "2024-07-01", "2024-07-28", 2), 4
+        ),
+        "VacationRequest.list_json": (
+            lambda: adapter.dump_json(models),
+            lambda: json.dumps([m.model_dump(mode="json") for m in models]).encode(), 1.2
+        ),
+    }
+    if importlib.util.find_spec("dateutil"):
+        pairs["calculate_work_days"] = (
+            lambda: [calculate_work_days(s, e) for s, e in ranges],
+            lambda: [rrule_work_days(s, e) for s, e in ranges], 4
+        )
+    return pairs
+
+
+SPEEDUP_PAIRS = _speedup_pairs()
+
+
+@pytest.mark.parametrize("name", sorted(SPEEDUP_PAIRS))
+def test_speedup(name):
+    optimised, reference, minimum = SPEEDUP_PAIRS[name]
+    speedup = 0.0
+    # the two timings are taken close together, so the load of the machine mostly cancels out
+    for _ in range(3):
+        speedup = max(speedup, measure(reference) / measure(optimised))
+        if speedup >= minimum:
+            break
+    assert speedup >= minimum, f"{name}: {speedup:.2f}x faster than the reference, expected {minimum}x"
+
@@ -0,0 +1,75 @@
+"""Onboarding throughput: per-row registration versus the chunked import pipeline.
+
+The per-row variant mirrors /auth/register and the old seed scripts:
+find_one, one bcrypt hash, then insert_one for the user and the balance.
+
+Usage: python -m benchmarks.user_import [--rows 2000] [--chunk-size 500]
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+
+from auth import password_hasher
+from database import ensure_indexes
+from user_import import import_users
+from benchmarks.common import bench_db
+
+
+def make_rows(prefix: str, count: int, department_id: str):
+    return [(i + 2, {
+        "login": f"{prefix}{i}", "password": f"password{i}", "role": "employee",
+        "full_name": f"Сотрудник {i}", "email": f"{prefix}{i}@example.com", "department_id": department_id,
+    }) for i in range(count)]
+
+
+async def per_row(db, rows):
+    year = datetime.now(timezone.utc).year
+    for _, row in rows:
+        if await db.users.find_one({"login": row["login"]}, {"_id": 0}):
+            continue
+        user_id = str(uuid.uuid4())
+        await db.users.insert_one({
+            "id": user_id, "login": row["login"], "password_hash": await password_hasher.hash(row["password"]),
+            "role": row["role"], "full_name": row["full_name"], "email": row["email"],
+            "department_id": row["department_id"], "manager_id": None,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        })
+        await db.vacation_balances.insert_one({
+            "id": str(uuid.uuid4()), "user_id": user_id, "year": year, "total_days": 28, "used_days": 0,
+        })
+
+
+async def main(rows: int, chunk_size: int):
+    client, db = bench_db("user_import")
+    await client.drop_database(db.name)
+    try:
+        await ensure_indexes(db)
+        department_id = str(uuid.uuid4())
+        await db.departments.insert_one({"id": department_id, "name": "Разработка", "max_simultaneous_vacations": 2})
+
+        started = time.perf_counter()
+        await per_row(db, make_rows("row", rows, department_id))
+        sequential = time.perf_counter() - started
+
+        report = await import_users(db, make_rows("bulk", rows, department_id), chunk_size)
+        print(json.dumps({
+            "rows": rows,
+            "hash_workers": password_hasher.workers,
+            "per_row": {"seconds": round(sequential, 2), "rows_per_sec": round(rows / sequential, 1)},
+            "import": {"seconds": report.seconds, "rows_per_sec": report.rows_per_sec, "created": report.created},
+        }, indent=2))
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+        password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.chunk_size))
@@ -0,0 +1,61 @@
+"""Working-day counting: prefix-sum production calendar versus the old rrule loop.
+
+Usage: python -m benchmarks.work_days [--ranges 100000]
+"""
+import argparse
+import json
+import random
+import time
+from datetime import date, timedelta
+
+from utils import calculate_work_days, calculate_work_days_batch
+from work_calendar import WorkCalendar
+
+
+def rrule_work_days(start_date_str: str, end_date_str: str) -> int:
+    """The previous implementation: materialize every weekday and count them"""
+    from dateutil import rrule
+    start = date.fromisoformat(start_date_str)
+    end = date.fromisoformat(end_date_str)
+    return len(list(rrule.rrule(
+        rrule.DAILY, dtstart=start, until=end,
+        byweekday=(rrule.MO, rrule.TU, rrule.WE, rrule.TH, rrule.FR)
+    )))
+
+
+def main(count: int):
+    rnd = random.Random(11)
+    ranges = []
+    for _ in range(count):
+        start = date(2023, 1, 1) + timedelta(days=rnd.randrange(3 * 365))
+        ranges.append((start.isoformat(), (start + timedelta(days=rnd.randrange(60))).isoformat()))
+
+    # weekends-only calendar must agree with rrule
+    weekends_only = WorkCalendar(holidays={y: set() for y in range(2023, 2027)})
+    results = {"ranges": count}
+
+    try:
+        started = time.perf_counter()
+        legacy = [rrule_work_days(s, e) for s, e in ranges]
+        results["rrule_us_per_range"] = round((time.perf_counter() - started) * 1e6 / count, 3)
+        assert legacy == [weekends_only.count(date.fromisoformat(s), date.fromisoformat(e)) for s, e in ranges]
+    except ImportError:
+        results["rrule_us_per_range"] = None
+
+    started = time.perf_counter()
+    single = [calculate_work_days(s, e) for s, e in ranges]
+    results["calendar_us_per_range"] = round((time.perf_counter() - started) * 1e6 / count, 3)
+
+    started = time.perf_counter()
+    batch = calculate_work_days_batch(ranges)
+    results["calendar_batch_us_per_range"] = round((time.perf_counter() - started) * 1e6 / count, 3)
+    assert single == batch
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ranges", type=int, default=100000)
+    args = parser.parse_args()
+    main(args.ranges)
@@ -0,0 +1,507 @@
+"""Caches for users, departments and balances, optionally shared between workers.
+
+Every process keeps a small LRU/TTL cache in memory. With CACHE_URL set to
+a redis:// URL, lookups that miss it go to a shared cache on Redis before
+MongoDB, so a new worker starts warm and hit rates do not drop as workers
+are added. Write handlers invalidate through this module: the entry is
+dropped here and in the shared cache, and a message on the invalidation
+channel makes the other workers drop their copies. CACHE_URL=memory://
+runs the same code with an in-process stand-in for Redis.
+
+Each shared entry has a generation counter that invalidation increments.
+A worker writes what it loaded back only if the counter is still the one it
+saw before loading, so a value read before another worker's write cannot
+be stored after that write's invalidation.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import orjson
+from bson import BSON
+from bson.codec_options import CodecOptions
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 60))
+DEPARTMENT_CACHE_TTL = float(os.environ.get('DEPARTMENT_CACHE_TTL', 300))
+BALANCE_CACHE_TTL = float(os.environ.get('BALANCE_CACHE_TTL', 30))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 10000))
+# redis://host:6379/0 for a cache shared by all workers, memory:// for the stand-in, empty for none
+CACHE_URL = os.environ.get('CACHE_URL', '')
+CACHE_KEY_PREFIX = os.environ.get('CACHE_KEY_PREFIX', 'vacationflow:')
+INVALIDATION_CHANNEL = CACHE_KEY_PREFIX + "invalidate"
+# Generation counters outlive any cached value by far, so a lookup never
+# sees one reset while it loads
+GENERATION_TTL = 86400
+# Seconds before resubscribing to the channel after a failure, doubling up to the maximum
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 30
+
+ALL_DEPARTMENTS = "__all__"
+
+_MISSING = object()
+# Tells this process's own broadcasts apart from the other workers'
+PROCESS_ID = uuid.uuid4().hex
+_CODEC_OPTIONS = CodecOptions(tz_aware=True)
+
+
+class TTLCache:
+    """LRU cache whose entries also expire after ttl seconds"""
+
+    def __init__(self, name: str, maxsize: int = CACHE_MAX_ENTRIES, ttl: float = 60):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # bumped on every invalidation, so a lookup can tell one happened while it read
+        self.generation = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: str):
+        self.generation += 1
+        if self._data.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self.generation += 1
+        self.invalidations += len(self._data)
+        self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class MemoryBackend:
+    """In-process stand-in for the Redis backend, for tests and single-worker runs"""
+    errors: Tuple[type, ...] = ()
+    name = "memory"
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[float, bytes]] = {}
+        self._generations: Dict[str, int] = {}
+        self._listeners: Dict[str, List[asyncio.Queue]] = {}
+
+    async def get(self, key: str) -> Tuple[Optional[bytes], int]:
+        """Value of key, or None, and the generation to pass to set"""
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._data.pop(key, None)
+            return None, self._generations.get(key, 0)
+        return entry[1], self._generations.get(key, 0)
+
+    async def set(self, key: str, value: bytes, ttl: float, generation: int) -> bool:
+        """Store value unless key was invalidated since get returned generation"""
+        if self._generations.get(key, 0) != generation:
+            return False
+        self._data[key] = (time.monotonic() + ttl, value)
+        return True
+
+    async def delete(self, keys: List[str]):
+        for key in keys:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._data.pop(key, None)
+
+    async def publish(self, channel: str, message: bytes):
+        for queue in self._listeners.get(channel, ()):
+            queue.put_nowait(message)
+
+    async def listen(self, channel: str) -> AsyncIterator[Optional[bytes]]:
+        """Messages published on channel, after a None once subscribed"""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._listeners.setdefault(channel, []).append(queue)
+        try:
+            yield None
+            while True:
+                yield await queue.get()
+        finally:
+            self._listeners[channel].remove(queue)
+
+    async def close(self):
+        self._data.clear()
+        self._generations.clear()
+
+
+# SET only while the generation key still holds what the reader saw
+_SET_IF_GENERATION = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[2] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[3])
+return 1
+"""
+
+
+class RedisBackend:
+    """Shared cache and invalidation channel on Redis, or any server speaking its protocol"""
+    name = "redis"
+
+    def __init__(self, url: str):
+        # optional dependency, only needed when CACHE_URL points at Redis
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        # the subscription waits for messages indefinitely, so it gets a connection without a read timeout
+        self._listener = redis.from_url(url, socket_connect_timeout=1, health_check_interval=30)
+        self.errors = (redis.RedisError, OSError)
+        self._set_if_generation = self._redis.register_script(_SET_IF_GENERATION)
+
+    @staticmethod
+    def _generation_key(key: str) -> str:
+        return key + ":gen"
+
+    async def get(self, key: str) -> Tuple[Optional[bytes], int]:
+        """Value of key, or None, and the generation to pass to set"""
+        value, generation = await self._redis.mget(key, self._generation_key(key))
+        return value, int(generation or 0)
+
+    async def set(self, key: str, value: bytes, ttl: float, generation: int) -> bool:
+        """Store value unless key was invalidated since get returned generation"""
+        stored = await self._set_if_generation(
+            keys=[key, self._generation_key(key)], args=[value, generation, max(1, int(ttl * 1000))]
+        )
+        return bool(stored)
+
+    async def delete(self, keys: List[str]):
+        if not keys:
+            return
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for key in keys:
+                pipe.incr(self._generation_key(key))
+                pipe.expire(self._generation_key(key), GENERATION_TTL)
+            pipe.delete(*keys)
+            await pipe.execute()
+
+    async def publish(self, channel: str, message: bytes):
+        await self._redis.publish(channel, message)
+
+    async def listen(self, channel: str) -> AsyncIterator[Optional[bytes]]:
+        """Messages published on channel, after a None once subscribed"""
+        pubsub = self._listener.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(channel)
+            yield None
+            async for message in pubsub.listen():
+                if message['type'] == 'message':
+                    yield message['data']
+        finally:
+            await pubsub.aclose()
+
+    async def close(self):
+        await self._redis.aclose()
+        await self._listener.aclose()
+
+
+user_cache = TTLCache("users", ttl=USER_CACHE_TTL)
+department_cache = TTLCache("departments", ttl=DEPARTMENT_CACHE_TTL)
+balance_cache = TTLCache("balances", ttl=BALANCE_CACHE_TTL)
+LOCAL_CACHES = {c.name: c for c in (user_cache, department_cache, balance_cache)}
+
+shared = None
+shared_stats = {"hits": 0, "misses": 0, "errors": 0, "received": 0}
+# Handlers of broadcast kinds, e.g. auth applies token revocations made by other workers
+_handlers: Dict[str, Callable[[dict], None]] = {}
+
+
+def configure(url: str = CACHE_URL):
+    """Select the shared backend; called once at startup"""
+    global shared
+    if url.startswith("memory://"):
+        shared = MemoryBackend()
+    elif url:
+        shared = RedisBackend(url)
+    else:
+        shared = None
+    return shared
+
+
+async def close():
+    global shared
+    if shared is not None:
+        await shared.close()
+        shared = None
+
+
+def _shared_failed(operation: str, error: Exception):
+    # the shared cache is an optimisation: requests carry on with MongoDB
+    shared_stats["errors"] += 1
+    logger.warning(f"Shared cache {operation} failed: {error}")
+
+
+def _shared_key(local: TTLCache, key: str) -> str:
+    return f"{CACHE_KEY_PREFIX}{local.name}:{key}"
+
+
+async def _lookup(local: TTLCache, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+    """Value from the local cache, then the shared one, then load(); None is never cached"""
+    value = local.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+    generation = local.generation
+    # held locally, since shutdown may reset the module's backend while this waits
+    backend = shared
+    # None when the shared generation is unknown, and then nothing is written back
+    shared_generation = None
+
+    if backend is not None:
+        try:
+            data, shared_generation = await backend.get(_shared_key(local, key))
+        except backend.errors as e:
+            _shared_failed("read", e)
+            data = None
+        if data is not None:
+            shared_stats["hits"] += 1
+            value = BSON(data).decode(_CODEC_OPTIONS)["v"]
+        else:
+            shared_stats["misses"] += 1
+
+    if value is _MISSING:
+        value = await load()
+        if value is None:
+            return None
+        if shared_generation is not None and local.generation == generation:
+            try:
+                if not await backend.set(_shared_key(local, key), BSON.encode({"v": value}), local.ttl,
+                                         shared_generation):
+                    # another worker invalidated the key meanwhile; its message may not be here yet
+                    return value
+            except backend.errors as e:
+                _shared_failed("write", e)
+    # an invalidation that arrived while reading wins over the value read before it
+    if local.generation == generation:
+        local.set(key, value)
+    return value
+
+
+async def _invalidate(local: TTLCache, keys: List[str], broadcast: bool = True):
+    """Drop keys here and in the shared cache, and tell the other workers to drop theirs.
+
+    Bumping the shared generations also stops any lookup already loading these
+    keys, in any worker, from storing what it read.
+    """
+    for key in keys:
+        local.invalidate(key)
+    backend = shared
+    if backend is None:
+        return
+    try:
+        await backend.delete([_shared_key(local, key) for key in keys])
+    except backend.errors as e:
+        _shared_failed("invalidation", e)
+    if broadcast:
+        await publish("invalidate", {"cache": local.name, "keys": keys})
+
+
+async def publish(kind: str, payload: dict):
+    """Send a message to the other workers; a no-op without a shared backend"""
+    backend = shared
+    if backend is None:
+        return
+    try:
+        await backend.publish(INVALIDATION_CHANNEL, orjson.dumps({"kind": kind, "origin": PROCESS_ID, **payload}))
+    except backend.errors as e:
+        _shared_failed("publish", e)
+
+
+def register_handler(kind: str, handler: Callable[[dict], None]):
+    _handlers[kind] = handler
+
+
+def _apply_invalidation(message: dict):
+    local = LOCAL_CACHES.get(message.get("cache"))
+    if local is not None:
+        for key in message.get("keys", ()):
+            local.invalidate(key)
+
+
+register_handler("invalidate", _apply_invalidation)
+
+
+def _dispatch(data: bytes):
+    message = orjson.loads(data)
+    if message.get("origin") == PROCESS_ID:
+        return
+    shared_stats["received"] += 1
+    handler = _handlers.get(message.get("kind"))
+    if handler is not None:
+        handler(message)
+
+
+async def listen_invalidations(on_reconnect: Optional[Callable[[], Awaitable[None]]] = None):
+    """Apply messages published by the other workers, resubscribing after any failure.
+
+    Messages sent while the subscription was down are lost, so on every
+    reconnect the local caches are dropped and on_reconnect reloads any
+    other state the messages keep current (token revocations).
+    """
+    backend = shared
+    if backend is None:
+        return
+    delay = RECONNECT_DELAY
+    reconnecting = False
+    while True:
+        try:
+            async for data in backend.listen(INVALIDATION_CHANNEL):
+                if data is None:
+                    # subscribed: nothing published from here on is missed
+                    delay = RECONNECT_DELAY
+                    if reconnecting:
+                        for local in LOCAL_CACHES.values():
+                            local.clear()
+                        if on_reconnect is not None:
+                            await on_reconnect()
+                        logger.info("Resubscribed to cache invalidations")
+                    continue
+                try:
+                    _dispatch(data)
+                except Exception as e:
+                    # one bad message must not cost the subscription
+                    logger.error(f"Failed to apply cache message: {e}")
+        except Exception as e:
+            _shared_failed("subscription", e)
+        reconnecting = True
+        # the shared cache was invalidated directly and still holds current values
+        for local in LOCAL_CACHES.values():
+            local.clear()
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+
+# Never cached: the shared cache is readable by anything that reaches Redis,
+# and login reads the users collection directly
+USER_SECRET_FIELDS = {"password_hash": 0}
+
+
+async def get_user(db, user_id: str) -> Optional[dict]:
+    """User document by id without its password hash, from the cache when possible"""
+    user = await _lookup(
+        user_cache, user_id, lambda: db.users.find_one({"id": user_id}, {"_id": 0, **USER_SECRET_FIELDS})
+    )
+    return dict(user) if user is not None else None
+
+
+async def get_department(db, department_id: str) -> Optional[dict]:
+    department = await _lookup(
+        department_cache, department_id, lambda: db.departments.find_one({"id": department_id}, {"_id": 0})
+    )
+    return dict(department) if department is not None else None
+
+
+async def get_departments(db) -> List[dict]:
+    async def load():
+        departments = await db.departments.find({}, {"_id": 0}).to_list(None)
+        for department in departments:
+            department_cache.set(department['id'], department)
+        return departments
+
+    return [dict(d) for d in await _lookup(department_cache, ALL_DEPARTMENTS, load)]
+
+
+async def get_balance(db, user_id: str, year: int) -> Optional[dict]:
+    """Balance of a user for a year; writers call invalidate_balance after changing it"""
+    balance = await _lookup(
+        balance_cache, f"{user_id}:{year}",
+        lambda: db.vacation_balances.find_one({"user_id": user_id, "year": year}, {"_id": 0})
+    )
+    return dict(balance) if balance is not None else None
+
+
+async def invalidate_user(user_id: str, broadcast: bool = True):
+    await _invalidate(user_cache, [user_id], broadcast)
+
+
+async def invalidate_department(department_id: Optional[str] = None, broadcast: bool = True):
+    keys = [department_id, ALL_DEPARTMENTS] if department_id else [ALL_DEPARTMENTS]
+    await _invalidate(department_cache, keys, broadcast)
+
+
+async def invalidate_balances(balances: List[Tuple[str, int]], broadcast: bool = True):
+    """Drop (user_id, year) balances after a write, once the write is committed"""
+    keys = sorted({f"{user_id}:{year}" for user_id, year in balances})
+    if keys:
+        await _invalidate(balance_cache, keys, broadcast)
+
+
+def cache_stats() -> Dict[str, dict]:
+    stats = {name: local.stats() for name, local in LOCAL_CACHES.items()}
+    if shared is not None:
+        lookups = shared_stats["hits"] + shared_stats["misses"]
+        stats["shared"] = {
+            "backend": shared.name,
+            **shared_stats,
+            "hit_ratio": round(shared_stats["hits"] / lookups, 3) if lookups else 0.0,
+        }
+    return stats
+
+
+async def _watch(collection, on_change: Callable[[dict], Awaitable[None]]):
+    async with collection.watch(full_document='updateLookup') as stream:
+        async for change in stream:
+            await on_change(change.get('fullDocument') or {})
+
+
+async def watch_changes(db):
+    """Invalidate on writes made by other processes, via change streams.
+
+    Change streams need a replica set; on a standalone server this logs once
+    and returns, leaving TTL expiry as the only source of freshness for
+    writes that do not go through this process. Every worker watches, so
+    these invalidations are not broadcast.
+    """
+    async def on_user_change(user: dict):
+        if user.get('id'):
+            await invalidate_user(user['id'], broadcast=False)
+        else:
+            user_cache.clear()
+
+    async def on_department_change(department: dict):
+        await invalidate_department(department.get('id'), broadcast=False)
+
+    async def on_balance_change(balance: dict):
+        if balance.get('user_id'):
+            await invalidate_balances([(balance['user_id'], balance['year'])], broadcast=False)
+        else:
+            balance_cache.clear()
+
+    try:
+        await asyncio.gather(
+            _watch(db.users, on_user_change),
+            _watch(db.departments, on_department_change),
+            _watch(db.vacation_balances, on_balance_change),
+        )
+    except PyMongoError as e:
+        logger.info(f"Change streams unavailable, cache relies on TTL: {e}")
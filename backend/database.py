@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Indexes match the query shapes used by the handlers in server.py.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("login", ASCENDING)], name="login_unique", unique=True),
+        IndexModel([("department_id", ASCENDING)], name="department_id"),
+    ],
+    "departments": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "vacation_balances": [
+        IndexModel([("user_id", ASCENDING), ("year", ASCENDING)], name="user_year_unique", unique=True),
+    ],
+    "vacation_requests": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # /vacation-requests/my and /vacation-requests/department, keyset paginated
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_created_at_id"),
+        # check-overlap and calendar: approved requests of department users in a date window
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING), ("start_at", ASCENDING), ("end_at", ASCENDING)],
+                   name="user_status_start_end"),
+        # /vacation-requests/all, keyset paginated
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        # /reports/vacations date filter
+        IndexModel([("start_date", ASCENDING)], name="start_date"),
+    ],
+    "department_occupancy": [
+        # overlap checks and heatmaps: one department, a range of days
+        IndexModel([("department_id", ASCENDING), ("date", ASCENDING)], name="department_date_unique", unique=True),
+    ],
+    "request_history": [
+        IndexModel([("request_id", ASCENDING), ("acted_at", ASCENDING)], name="request_acted_at"),
+    ],
+    "email_outbox": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("dedup_key", ASCENDING)], name="dedup_key_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt"),
+        # expired claims of workers that died while sending
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_lease_until"),
+        # delivered messages are kept for a month for troubleshooting
+        IndexModel([("sent_at", ASCENDING)], name="sent_at_ttl", expireAfterSeconds=30 * 24 * 3600),
+    ],
+    "stream_tickets": [
+        # unused tickets; redeeming one deletes it
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+INDEX_PROGRESS_INTERVAL = 2.0
+
+# IllegalOperation: transactions need a replica set or mongos
+TRANSACTIONS_UNSUPPORTED = 20
+
+_transactions_supported: Optional[bool] = None
+
+LOCKS_COLLECTION = "locks"
+
+
+async def _report_index_builds(db, interval: float = INDEX_PROGRESS_INTERVAL):
+    """Periodically log progress of index builds running on the server"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            ops = await db.client.admin.command({
+                "currentOp": True,
+                "$or": [
+                    {"command.createIndexes": {"$exists": True}},
+                    {"msg": {"$regex": "^Index Build"}},
+                ],
+            })
+        except OperationFailure:
+            # currentOp requires privileges we may not have; progress is best effort
+            return
+        for op in ops.get("inprog", []):
+            progress = op.get("progress")
+            if progress and progress.get("total"):
+                logger.info(
+                    f"Index build on {op.get('ns')}: {progress['done']}/{progress['total']} "
+                    f"({progress['done'] * 100 // progress['total']}%)"
+                )
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create all declared indexes, returning created index names per collection"""
+    reporter = asyncio.create_task(_report_index_builds(db))
+    created = {}
+    try:
+        for collection_name, indexes in INDEXES.items():
+            created[collection_name] = []
+            for index in indexes:
+                name = index.document["name"]
+                started = time.perf_counter()
+                try:
+                    await db[collection_name].create_indexes([index])
+                except OperationFailure as e:
+                    # e.g. duplicates in existing data prevent a unique index;
+                    # the API keeps working, so do not block startup on it
+                    logger.error(f"Failed to create index {collection_name}.{name}: {e}")
+                    continue
+                elapsed = (time.perf_counter() - started) * 1000
+                logger.info(f"Index {collection_name}.{name} ready in {elapsed:.0f} ms")
+                created[collection_name].append(name)
+    finally:
+        reporter.cancel()
+    return created
+
+
+async def run_in_transaction(client, operation: Callable[[Any], Awaitable[Any]]) -> Any:
+    """Run operation(session) in a transaction, retrying transient errors.
+
+    A standalone server rejects the first command of a transaction before
+    anything is written, so the operation is then run again with session=None
+    and later calls skip the attempt. Without a replica set the writes are
+    not atomic, only ordered.
+    """
+    global _transactions_supported
+    if _transactions_supported is not False:
+        try:
+            async with await client.start_session() as session:
+                result = await session.with_transaction(operation)
+            _transactions_supported = True
+            return result
+        except OperationFailure as e:
+            if e.code != TRANSACTIONS_UNSUPPORTED:
+                raise
+            _transactions_supported = False
+            logger.warning(f"Transactions unavailable, running multi-document writes without them: {e}")
+    return await operation(None)
+
+
+async def acquire_lock(db, name: str, seconds: float) -> Optional[str]:
+    """Take the named lock for up to seconds; returns the owner token, or None
+    while another process holds it. A holder that dies loses it on expiry."""
+    owner = uuid.uuid4().hex
+    now = datetime.now(timezone.utc)
+    try:
+        # a live lock matches nothing, and the upsert then collides on _id
+        await db[LOCKS_COLLECTION].update_one(
+            {"_id": name, "expires_at": {"$lte": now}},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return None
+    return owner
+
+
+async def release_lock(db, name: str, owner: str):
+    await db[LOCKS_COLLECTION].delete_one({"_id": name, "owner": owner})
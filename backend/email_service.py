@@ -1,60 +1,93 @@
 import os
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
 import logging
+from string import Template
+from typing import Tuple
 
 logger = logging.getLogger(__name__)
 
 SENDGRID_API_KEY = os.environ.get('SENDGRID_API_KEY', '')
+# Overrides the SendGrid API host, e.g. to point at a local stub sink in tests
+SENDGRID_API_HOST = os.environ.get('SENDGRID_API_HOST', '')
 SENDER_EMAIL = os.environ.get('SENDER_EMAIL', 'noreply@vacationflow.com')
 
-class EmailService:
-    def __init__(self):
-        if not SENDGRID_API_KEY:
-            logger.warning("SendGrid API key not configured")
-            self.enabled = False
-        else:
-            self.sg = SendGridAPIClient(SENDGRID_API_KEY)
-            self.enabled = True
-    
-    def send_vacation_status_email(self, to_email: str, employee_name: str, 
-                                   start_date: str, end_date: str, 
-                                   status: str, manager_comment: str = None):
-        """Send vacation request status notification"""
-        if not self.enabled:
-            logger.info(f"Email sending disabled. Would send to {to_email}: {status}")
-            return False
-        
-        status_ru = {
-            'approved': 'Одобрена',
-            'rejected': 'Отклонена',
-            'pending': 'На рассмотрении'
-        }.get(status, status)
-        
-        subject = f"Заявка на отпуск {status_ru}"
-        
-        html_content = f"""
+STATUS_NAMES = {
+    'approved': 'Одобрена',
+    'rejected': 'Отклонена',
+    'pending': 'На рассмотрении'
+}
+
+STATUS_COLORS = {
+    'approved': '#10B981',
+    'rejected': '#EF4444',
+}
+
+VACATION_STATUS_TEMPLATE = Template("""
         <html>
             <body style="font-family: Inter, sans-serif; line-height: 1.6; color: #0F172A;">
                 <div style="max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #E2E8F0; border-radius: 8px;">
                     <h2 style="color: #0F172A; margin-bottom: 20px;">Статус заявки на отпуск</h2>
                     
-                    <p>Здравствуйте, {employee_name}!</p>
+                    <p>Здравствуйте, $employee_name!</p>
                     
                     <div style="background: #F1F5F9; padding: 15px; border-radius: 4px; margin: 20px 0;">
-                        <p style="margin: 5px 0;"><strong>Даты отпуска:</strong> {start_date} - {end_date}</p>
-                        <p style="margin: 5px 0;"><strong>Статус:</strong> <span style="color: {'#10B981' if status == 'approved' else '#EF4444' if status == 'rejected' else '#F59E0B'}; font-weight: bold;">{status_ru}</span></p>
+                        <p style="margin: 5px 0;"><strong>Даты отпуска:</strong> $start_date - $end_date</p>
+                        <p style="margin: 5px 0;"><strong>Статус:</strong> <span style="color: $status_color; font-weight: bold;">$status_name</span></p>
                     </div>
                     
-                    {f'<div style="background: #FEF3C7; padding: 15px; border-radius: 4px; margin: 20px 0;"><p style="margin: 0;"><strong>Комментарий руководителя:</strong></p><p style="margin: 10px 0 0 0;">{manager_comment}</p></div>' if manager_comment else ''}
+                    $comment_block
                     
                     <p style="margin-top: 30px; color: #64748B; font-size: 14px;">Это автоматическое уведомление из системы VacationFlow.</p>
                 </div>
             </body>
         </html>
-        """
+        """)
+
+COMMENT_TEMPLATE = Template(
+    '<div style="background: #FEF3C7; padding: 15px; border-radius: 4px; margin: 20px 0;"><p style="margin: 0;"><strong>Комментарий руководителя:</strong></p><p style="margin: 10px 0 0 0;">$manager_comment</p></div>'
+)
+
+def render_vacation_status_email(employee_name: str, start_date: str, end_date: str,
+                                 status: str, manager_comment: str = None) -> Tuple[str, str]:
+    """Render subject and HTML body of a vacation status notification"""
+    status_name = STATUS_NAMES.get(status, status)
+    html_content = VACATION_STATUS_TEMPLATE.substitute(
+        employee_name=employee_name,
+        start_date=start_date,
+        end_date=end_date,
+        status_name=status_name,
+        status_color=STATUS_COLORS.get(status, '#F59E0B'),
+        comment_block=COMMENT_TEMPLATE.substitute(manager_comment=manager_comment) if manager_comment else ''
+    )
+    return f"Заявка на отпуск {status_name}", html_content
+
+class EmailService:
+    def __init__(self, api_key: str = SENDGRID_API_KEY, host: str = SENDGRID_API_HOST):
+        self.api_key = api_key
+        self.host = host
+        self.enabled = bool(api_key)
+        self._sg = None
+        if not self.enabled:
+            logger.warning("SendGrid API key not configured")
+    
+    @property
+    def sg(self):
+        """SendGrid client, imported and built on the first send so it stays off the startup path"""
+        if self._sg is None:
+            from sendgrid import SendGridAPIClient
+            if self.host:
+                self._sg = SendGridAPIClient(self.api_key, host=self.host)
+            else:
+                self._sg = SendGridAPIClient(self.api_key)
+        return self._sg
+    
+    def send_email(self, to_email: str, subject: str, html_content: str) -> bool:
+        """Send a pre-rendered email, returning whether it was accepted"""
+        if not self.enabled:
+            logger.info(f"Email sending disabled. Would send to {to_email}: {subject}")
+            return False
         
         try:
+            from sendgrid.helpers.mail import Mail
             message = Mail(
                 from_email=SENDER_EMAIL,
                 to_emails=to_email,
@@ -68,5 +101,14 @@ class EmailService:
         except Exception as e:
             logger.error(f"Failed to send email to {to_email}: {str(e)}")
             return False
+    
+    def send_vacation_status_email(self, to_email: str, employee_name: str, 
+                                   start_date: str, end_date: str, 
+                                   status: str, manager_comment: str = None):
+        """Send vacation request status notification"""
+        subject, html_content = render_vacation_status_email(
+            employee_name, start_date, end_date, status, manager_comment
+        )
+        return self.send_email(to_email, subject, html_content)
 
 email_service = EmailService()
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""Weak ETags for read-heavy endpoints, derived from per-scope version stamps.
+
+Handlers that write bump the scopes the write affects (a user's requests,
+a department's requests, all requests, departments, ...). A GET reads the
+stamps of the scopes it depends on, hashes them with the caller and the
+query string, and answers 304 Not Modified when the client already holds
+that tag, skipping the query and the serialization.
+
+Stamps are kept in MongoDB so every worker agrees on them. They are read
+before the data, so a write racing a GET can only leave the response with
+an older tag than its content, which costs one extra full response later,
+never a stale 304.
+"""
+import hashlib
+import uuid
+from typing import Iterable, List, Optional
+
+from fastapi import Request, Response
+from pymongo import UpdateOne
+
+VERSIONS_COLLECTION = "resource_versions"
+
+# Shared state must be revalidated on every use; the browser keeps the body
+# and the ETag and gets a bodiless 304 while nothing changed
+CACHE_CONTROL_REVALIDATE = "private, no-cache"
+
+ALL_REQUESTS = "vacation_requests"
+DEPARTMENTS = "departments"
+USERS = "users"
+# Balances edited directly; writes to requests change balances under ALL_REQUESTS
+BALANCES = "vacation_balances"
+
+
+def user_requests(user_id: str) -> str:
+    return f"vacation_requests:user:{user_id}"
+
+
+def department_requests(department_id: str) -> str:
+    return f"vacation_requests:department:{department_id}"
+
+
+def user_balance(user_id: str) -> str:
+    return f"vacation_balances:{user_id}"
+
+
+def request_scopes(user_id: str, department_id: Optional[str]) -> List[str]:
+    """Scopes changed by a write to one of user_id's requests (and so to their balance)"""
+    scopes = [ALL_REQUESTS, user_requests(user_id), user_balance(user_id)]
+    if department_id:
+        scopes.append(department_requests(department_id))
+    return scopes
+
+
+async def bump(db, scopes: Iterable[str], session=None):
+    """Give each scope a new stamp"""
+    scopes = list(dict.fromkeys(scopes))
+    if not scopes:
+        return
+    stamp = uuid.uuid4().hex
+    await db[VERSIONS_COLLECTION].bulk_write(
+        [UpdateOne({"_id": scope}, {"$set": {"v": stamp}}, upsert=True) for scope in scopes],
+        ordered=False, session=session
+    )
+
+
+async def compute_etag(db, request: Request, scopes: List[str], caller: str) -> str:
+    versions = {
+        doc['_id']: doc['v'] async for doc in db[VERSIONS_COLLECTION].find({"_id": {"$in": scopes}})
+    }
+    digest = hashlib.blake2b(digest_size=12)
+    for part in (caller, request.url.path, str(request.query_params), *(f"{s}={versions.get(s, 0)}" for s in scopes)):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison of etag against If-None-Match"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:]
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+async def conditional_get(db, request: Request, response: Response, scopes: List[str], caller: str,
+                          cache_control: str = CACHE_CONTROL_REVALIDATE) -> Optional[Response]:
+    """Tag the response; returns a 304 response to send instead when the client's copy is current"""
+    etag = await compute_etag(db, request, scopes, caller)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,229 @@
+"""Real-time vacation request events pushed to browsers over Server-Sent Events.
+
+Every connection subscribes to topics: its own requests, its department's
+requests for managers and all requests for HR. An event is encoded once
+and its bytes are put on the queue of every matching subscriber, so
+fan-out costs one dict lookup and one put per listener. Idle connections
+hold just a queue; one hub-wide task sends the keep-alive comments.
+
+Events come from the write handlers of this process, and from the other
+workers over the shared cache channel (see cache.py). When MongoDB change
+streams are available they come from the vacation_requests stream instead,
+which also covers writes made by scripts.
+"""
+import asyncio
+import logging
+import os
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+import orjson
+from pymongo.errors import PyMongoError
+
+import cache
+
+logger = logging.getLogger(__name__)
+
+EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 100))
+EVENTS_HEARTBEAT = float(os.environ.get('EVENTS_HEARTBEAT', 15))
+EVENTS_MAX_CONNECTIONS = int(os.environ.get('EVENTS_MAX_CONNECTIONS', 10000))
+# Browsers reconnect after this many milliseconds when a stream drops
+EVENTS_RETRY_MS = 5000
+
+HR_TOPIC = "hr"
+
+PING = b": ping\n\n"
+# Fields of a request sent with its events
+EVENT_FIELDS = ('id', 'user_id', 'start_date', 'end_date', 'vacation_type', 'status', 'work_days')
+
+
+def user_topic(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+def department_topic(department_id: str) -> str:
+    return f"department:{department_id}"
+
+
+def subscriber_topics(role: str, user_id: str, department_id: Optional[str]) -> List[str]:
+    topics = [user_topic(user_id)]
+    if role == 'manager' and department_id:
+        topics.append(department_topic(department_id))
+    if role == 'hr':
+        topics.append(HR_TOPIC)
+    return topics
+
+
+def request_event(request: dict, department_id: Optional[str], created: bool = False) -> dict:
+    """Event for a request that was just created or moved to its current status"""
+    event = {field: request.get(field) for field in EVENT_FIELDS}
+    event['department_id'] = department_id
+    event['type'] = "request.created" if created else f"request.{request['status']}"
+    return event
+
+
+def encode_event(event: dict) -> bytes:
+    return b"event: " + event['type'].encode() + b"\ndata: " + orjson.dumps(event) + b"\n\n"
+
+
+class Subscription:
+    __slots__ = ('topics', 'queue')
+
+    def __init__(self, topics: List[str], queue_size: int):
+        self.topics = topics
+        # None tells the stream to end
+        self.queue: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue(queue_size)
+
+    def close(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class EventHub:
+    """Topic-based fan-out of encoded events to subscriber queues"""
+
+    def __init__(self, queue_size: int = EVENTS_QUEUE_SIZE, heartbeat: float = EVENTS_HEARTBEAT,
+                 max_connections: int = EVENTS_MAX_CONNECTIONS):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.max_connections = max_connections
+        self._topics: Dict[str, Set[Subscription]] = {}
+        self._subscriptions: Set[Subscription] = set()
+        # set while the change stream feeds the hub, handlers then do not publish
+        self.change_stream = False
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    @property
+    def connections(self) -> int:
+        return len(self._subscriptions)
+
+    def full(self) -> bool:
+        return len(self._subscriptions) >= self.max_connections
+
+    def subscribe(self, topics: List[str]) -> Subscription:
+        subscription = Subscription(topics, self.queue_size)
+        self._subscriptions.add(subscription)
+        for topic in topics:
+            self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+        for topic in subscription.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[topic]
+
+    def _drop(self, subscription: Subscription):
+        """Cut off a subscriber that stopped reading; its browser reconnects and refetches"""
+        self.dropped += 1
+        self.unsubscribe(subscription)
+        subscription.close()
+
+    def publish(self, event: dict):
+        topics = [user_topic(event['user_id']), HR_TOPIC]
+        if event.get('department_id'):
+            topics.append(department_topic(event['department_id']))
+        subscribers = set()
+        for topic in topics:
+            subscribers.update(self._topics.get(topic, ()))
+        if not subscribers:
+            return
+        self.published += 1
+        data = encode_event(event)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(data)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                self._drop(subscription)
+
+    async def publish_local(self, events: List[dict]):
+        """Publish events of writes made by this process, unless the change stream carries them.
+
+        The other workers get them over the shared cache channel, when one is configured.
+        """
+        if self.change_stream:
+            return
+        for event in events:
+            self.publish(event)
+        await cache.publish("request_events", {"events": events})
+
+    def publish_remote(self, message: dict):
+        """Events another worker published with publish_local"""
+        if self.change_stream:
+            return
+        for event in message['events']:
+            self.publish(event)
+
+    async def stream(self, subscription: Subscription) -> AsyncIterator[bytes]:
+        try:
+            yield f"retry: {EVENTS_RETRY_MS}\n\n".encode()
+            while True:
+                data = await subscription.queue.get()
+                if data is None:
+                    return
+                yield data
+        finally:
+            self.unsubscribe(subscription)
+
+    async def run_heartbeat(self):
+        """Keep idle connections open through proxies with one timer for all of them"""
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            for subscription in list(self._subscriptions):
+                try:
+                    subscription.queue.put_nowait(PING)
+                except asyncio.QueueFull:
+                    self._drop(subscription)
+
+    def close_all(self):
+        """End every stream, so shutdown does not wait for clients to hang up"""
+        for subscription in list(self._subscriptions):
+            self.unsubscribe(subscription)
+            subscription.close()
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self._subscriptions),
+            "topics": len(self._topics),
+            "change_stream": self.change_stream,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+event_hub = EventHub()
+cache.register_handler("request_events", event_hub.publish_remote)
+
+
+async def watch_requests(db, hub: EventHub = event_hub):
+    """Feed the hub from the vacation_requests change stream.
+
+    Change streams need a replica set; on a standalone server this logs once
+    and returns, and the handlers keep publishing their own writes.
+    """
+    pipeline = [{"$match": {"$or": [
+        {"operationType": "insert"},
+        {"operationType": "update", "updateDescription.updatedFields.status": {"$exists": True}},
+    ]}}]
+    try:
+        async with db.vacation_requests.watch(pipeline, full_document='updateLookup') as stream:
+            hub.change_stream = True
+            async for change in stream:
+                request = change.get('fullDocument')
+                if not request:
+                    continue
+                owner = await cache.get_user(db, request['user_id'])
+                hub.publish(request_event(
+                    request, owner['department_id'] if owner else None, change['operationType'] == 'insert'
+                ))
+    except PyMongoError as e:
+        logger.info(f"Change streams unavailable, events come from this process only: {e}")
+    finally:
+        hub.change_stream = False
@@ -0,0 +1,340 @@
+"""Synthetic VacationFlow data at production scale, for load and capacity tests.
+
+Creates departments of uneven size, each with a head, team leads and
+employees, one balance per user and year, several years of requests
+(summer-heavy, mostly approved in the past, pending in the future) and
+their request_history records. The same --seed always gives the same data.
+
+Every user gets the same password hash, computed once, and documents go
+out in unordered insert_many batches, several at a time, while the next
+department is generated. Indexes are built once at the end, and
+department_occupancy is rebuilt from the requests.
+
+Usage: python generate_data.py --users 100000 [--departments 200] [--years 3] [--seed 42] [--drop]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from auth import hash_password
+from database import ensure_indexes
+from utils import calculate_work_days, to_bson_date
+import occupancy
+
+logger = logging.getLogger(__name__)
+
+GENERATED_COLLECTIONS = (
+    "departments", "users", "vacation_balances", "vacation_requests", "request_history",
+    occupancy.OCCUPANCY_COLLECTION, "resource_versions",
+)
+
+DEFAULT_PASSWORD = "password123"
+# Employees per team lead
+TEAM_SIZE = 8
+
+DEPARTMENT_NAMES = [
+    "Разработка", "Продажи", "Маркетинг", "Бухгалтерия", "Логистика", "Поддержка", "Закупки",
+    "Юридический отдел", "Аналитика", "Производство", "Склад", "Качество", "Безопасность", "Администрация",
+]
+FIRST_NAMES = [
+    "Александр", "Дмитрий", "Максим", "Сергей", "Андрей", "Алексей", "Иван", "Михаил", "Никита", "Егор",
+    "Анна", "Мария", "Елена", "Ольга", "Наталья", "Екатерина", "Татьяна", "Ирина", "Светлана", "Юлия",
+]
+LAST_NAMES = [
+    "Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов", "Новиков",
+    "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов", "Егоров", "Павлов", "Козлов",
+]
+
+# Share of vacation starts per month: summer and the New Year holidays dominate
+MONTH_WEIGHTS = [4, 3, 5, 6, 10, 16, 18, 16, 7, 5, 4, 6]
+DURATIONS = [3, 5, 7, 10, 14, 21, 28]
+DURATION_WEIGHTS = [10, 20, 25, 15, 22, 6, 2]
+# Decided requests in the past
+PAST_STATUSES = ["approved", "rejected", "cancelled"]
+PAST_STATUS_WEIGHTS = [82, 7, 11]
+
+
+def _uuid(rnd: random.Random) -> str:
+    return str(uuid.UUID(int=rnd.getrandbits(128), version=4))
+
+
+def _department_sizes(rnd: random.Random, users: int, departments: int) -> List[int]:
+    """Long-tailed department sizes summing to users, at least 2 people each"""
+    weights = [rnd.lognormvariate(0, 0.8) for _ in range(departments)]
+    total = sum(weights)
+    sizes = [max(2, int(users * w / total)) for w in weights]
+    sizes[sizes.index(max(sizes))] += users - sum(sizes)
+    return sizes
+
+
+class BulkWriter:
+    """Buffers documents per collection and keeps a few insert_many calls in flight"""
+
+    def __init__(self, db, batch_size: int, concurrency: int):
+        self.db = db
+        self.batch_size = batch_size
+        self._slots = asyncio.Semaphore(concurrency)
+        self._buffers: Dict[str, List[dict]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.counts: Dict[str, int] = {}
+
+    async def add(self, collection: str, doc: dict):
+        buffer = self._buffers.setdefault(collection, [])
+        buffer.append(doc)
+        if len(buffer) >= self.batch_size:
+            await self._flush(collection)
+
+    async def _flush(self, collection: str):
+        docs = self._buffers.pop(collection, [])
+        if not docs:
+            return
+        # waiting for a slot here holds generation back when the database lags
+        await self._slots.acquire()
+        task = asyncio.create_task(self._insert(collection, docs))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _insert(self, collection: str, docs: List[dict]):
+        try:
+            await self.db[collection].insert_many(docs, ordered=False)
+            self.counts[collection] = self.counts.get(collection, 0) + len(docs)
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        for collection in list(self._buffers):
+            await self._flush(collection)
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+
+
+class DataGenerator:
+    def __init__(self, writer: BulkWriter, seed: int, years: int, requests_per_year: float,
+                 password_hash: str, today: Optional[date] = None):
+        self.writer = writer
+        self.rnd = random.Random(seed)
+        self.today = today or datetime.now(timezone.utc).date()
+        # fixed for the run, so the same seed and day give the same timestamps
+        self.now = datetime(self.today.year, self.today.month, self.today.day, tzinfo=timezone.utc)
+        self.years = list(range(self.today.year - years + 1, self.today.year + 1))
+        self.requests_per_year = requests_per_year
+        self.password_hash = password_hash
+        self.user_number = 0
+
+    def _user(self, department_id: str, role: str, manager_id: Optional[str]) -> dict:
+        self.user_number += 1
+        login = f"user{self.user_number:06d}"
+        rnd = self.rnd
+        last_name = rnd.choice(LAST_NAMES)
+        first_name = rnd.choice(FIRST_NAMES)
+        if first_name.endswith(("а", "я")):
+            last_name += "а"
+        return {
+            "id": _uuid(rnd),
+            "login": login,
+            "password_hash": self.password_hash,
+            "role": role,
+            "full_name": f"{last_name} {first_name}",
+            "email": f"{login}@example.com",
+            "department_id": department_id,
+            "manager_id": manager_id,
+            "created_at": datetime(self.years[0], 1, 1, tzinfo=timezone.utc) - timedelta(days=rnd.randrange(1, 2000)),
+        }
+
+    def _request(self, user: dict, year: int) -> dict:
+        rnd = self.rnd
+        month = rnd.choices(range(1, 13), MONTH_WEIGHTS)[0]
+        start = date(year, month, rnd.randint(1, 28))
+        end = start + timedelta(days=rnd.choices(DURATIONS, DURATION_WEIGHTS)[0] - 1)
+        created_at = datetime(start.year, start.month, start.day, tzinfo=timezone.utc) - timedelta(
+            days=rnd.randint(7, 60), minutes=rnd.randrange(24 * 60)
+        )
+        # requests submitted "in the future" relative to today are not created yet
+        created_at = min(created_at, self.now - timedelta(minutes=rnd.randrange(1, 7 * 24 * 60)))
+
+        if start > self.today and rnd.random() < 0.5:
+            status = "pending"
+        elif start > self.today:
+            status = rnd.choices(["approved", "rejected"], [9, 1])[0]
+        else:
+            status = rnd.choices(PAST_STATUSES, PAST_STATUS_WEIGHTS)[0]
+        # decisions take hours to days, with a long tail
+        updated_at = created_at if status == "pending" else min(
+            created_at + timedelta(hours=rnd.lognormvariate(2.5, 1.0)), self.now
+        )
+
+        vacation_type = "annual" if rnd.random() < 0.9 else "unpaid"
+        work_days = calculate_work_days(start.isoformat(), end.isoformat())
+        reserved = work_days if status == "pending" and vacation_type == "annual" else 0
+        return {
+            "id": _uuid(rnd),
+            "user_id": user['id'],
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+            "vacation_type": vacation_type,
+            "status": status,
+            "comment": None,
+            "manager_comment": None,
+            "work_days": work_days,
+            "reserved_days": reserved,
+            "balance_year": year if reserved else None,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "start_at": to_bson_date(start.isoformat()),
+            "end_at": to_bson_date(end.isoformat()),
+        }
+
+    async def _history(self, request: dict, user: dict):
+        if request['status'] == 'pending':
+            return
+        await self.writer.add("request_history", {
+            "id": _uuid(self.rnd),
+            "request_id": request['id'],
+            "action": request['status'],
+            "comment": "Отпуск отменён" if request['status'] == 'cancelled' else None,
+            "acted_by": user['id'] if request['status'] == 'cancelled' else (user['manager_id'] or user['id']),
+            "acted_at": request['updated_at'],
+        })
+
+    async def _employee_data(self, user: dict):
+        rnd = self.rnd
+        for year in self.years:
+            used = reserved = 0
+            # Poisson-like number of requests per year
+            count = min(int(rnd.expovariate(1 / self.requests_per_year) + 0.5), 8)
+            for _ in range(count):
+                request = self._request(user, year)
+                if request['vacation_type'] == 'annual':
+                    if request['status'] == 'approved':
+                        used += request['work_days']
+                    reserved += request['reserved_days']
+                await self.writer.add("vacation_requests", request)
+                await self._history(request, user)
+            total = rnd.choices([28, 31, 35], [85, 10, 5])[0]
+            await self.writer.add("vacation_balances", {
+                "id": _uuid(rnd),
+                "user_id": user['id'],
+                "year": year,
+                # balances are never overdrawn, as the API guarantees
+                "total_days": max(total, used + reserved),
+                "used_days": used,
+                "reserved_days": reserved,
+                "created_at": datetime(year, 1, 1, tzinfo=timezone.utc),
+            })
+
+    async def department(self, number: int, size: int, hr: bool = False):
+        rnd = self.rnd
+        base_name = "HR" if hr else DEPARTMENT_NAMES[number % len(DEPARTMENT_NAMES)]
+        department = {
+            "id": _uuid(rnd),
+            "name": base_name if hr or number < len(DEPARTMENT_NAMES) else f"{base_name} {number // len(DEPARTMENT_NAMES) + 1}",
+            "max_simultaneous_vacations": max(1, min(10, size // 6 + rnd.randint(0, 2))),
+            "created_at": datetime(self.years[0] - 1, 1, 1, tzinfo=timezone.utc),
+        }
+        await self.writer.add("departments", department)
+
+        head = self._user(department['id'], "hr" if hr else "manager", None)
+        members = [head]
+        leads = [head]
+        if not hr:
+            # one team lead per TEAM_SIZE employees in larger departments
+            for _ in range(max(0, (size - 1) // (TEAM_SIZE + 1) if size > TEAM_SIZE + 1 else 0)):
+                lead = self._user(department['id'], "manager", head['id'])
+                leads.append(lead)
+                members.append(lead)
+        for i in range(size - len(members)):
+            members.append(self._user(department['id'], "hr" if hr else "employee", leads[i % len(leads)]['id']))
+
+        for user in members:
+            await self.writer.add("users", user)
+            await self._employee_data(user)
+
+
+async def generate(db, users: int, departments: int, years: int, requests_per_year: float, seed: int,
+                   batch_size: int, concurrency: int, password: str, build_occupancy: bool = True) -> dict:
+    started = time.perf_counter()
+    writer = BulkWriter(db, batch_size, concurrency)
+    generator = DataGenerator(writer, seed, years, requests_per_year, hash_password(password))
+
+    # HR gets about 1% of the staff, the rest is spread over the other departments
+    hr_size = max(2, users // 100)
+    sizes = _department_sizes(generator.rnd, users - hr_size, max(1, departments - 1))
+    await generator.department(0, hr_size, hr=True)
+    for number, size in enumerate(sizes):
+        await generator.department(number, size)
+        if number % 10 == 9:
+            logger.info(f"Generated {number + 1}/{len(sizes)} departments, {generator.user_number} users, "
+                        f"{time.perf_counter() - started:.0f}s")
+    await writer.close()
+    generated = time.perf_counter() - started
+
+    logger.info("Building indexes")
+    await ensure_indexes(db)
+    indexed = time.perf_counter() - started
+    if build_occupancy:
+        logger.info("Building department occupancy")
+        await occupancy.rebuild(db)
+
+    total = time.perf_counter() - started
+    return {
+        "seed": seed,
+        "years": generator.years,
+        "documents": writer.counts,
+        "insert_seconds": round(generated, 1),
+        "index_seconds": round(indexed - generated, 1),
+        "occupancy_seconds": round(total - indexed, 1),
+        "total_seconds": round(total, 1),
+        "documents_per_sec": round(sum(writer.counts.values()) / generated, 0) if generated else 0,
+    }
+
+
+async def main(args):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[args.db or os.environ['DB_NAME']]
+    try:
+        if args.drop:
+            for collection in GENERATED_COLLECTIONS:
+                await db.drop_collection(collection)
+        elif await db.users.find_one({}, {"_id": 1}):
+            raise SystemExit(f"База {db.name} не пуста; укажите --drop, чтобы пересоздать данные")
+        report = await generate(
+            db, args.users, args.departments, args.years, args.requests_per_year, args.seed,
+            args.batch_size, args.concurrency, args.password, not args.no_occupancy
+        )
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f"Пароль всех пользователей: {args.password}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--departments", type=int, default=None, help="default: one per 500 users")
+    parser.add_argument("--years", type=int, default=3, help="years of history up to the current one")
+    parser.add_argument("--requests-per-year", type=float, default=2.5, help="mean requests per user and year")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=4, help="insert_many calls in flight")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD)
+    parser.add_argument("--db", help="database name, default DB_NAME from .env")
+    parser.add_argument("--drop", action="store_true", help="drop the generated collections first")
+    parser.add_argument("--no-occupancy", action="store_true", help="skip rebuilding department_occupancy")
+    args = parser.parse_args()
+    if args.departments is None:
+        args.departments = max(2, math.ceil(args.users / 500))
+    asyncio.run(main(args))
@@ -0,0 +1,424 @@
+"""Request-level performance metrics in Prometheus text format.
+
+An ASGI middleware times every request by route and opens a per-request
+RequestStats in a context variable. The Motor command listener, the
+password hasher and the email sender add their time to it: DB round trips,
+documents returned, bcrypt and email time. The totals feed histograms
+exposed on /metrics. With SERVER_TIMING=1 they are also sent back in a
+Server-Timing header, which browser dev tools show next to each request.
+A handler with a DB round-trip count that grows with the page size is an
+N+1 pattern.
+
+Motor runs commands on a thread pool but copies the caller's context, so
+the listener sees the stats of the request that issued the command. Those
+threads run concurrently for one request (asyncio.gather), so RequestStats
+and the listener's own state are updated under locks.
+
+Each worker process keeps its own series. With PROMETHEUS_MULTIPROC_DIR set
+(named after prometheus_client's multiprocess mode, which works the same
+way) every worker saves a snapshot of its metrics there every few seconds,
+and /metrics, whichever worker answers it, adds up the counters and
+histograms of all of them and lists the gauges of live workers by pid.
+Counts of workers that exited stay in the sums. Start with an empty
+directory, e.g. a tmpfs.
+"""
+import asyncio
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0').lower() in ('1', 'true', 'yes')
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+SNAPSHOT_INTERVAL = float(os.environ.get('METRICS_SNAPSHOT_INTERVAL', 5))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+# Commands whose replies carry documents in cursor batches
+CURSOR_COMMANDS = ('find', 'aggregate', 'getMore')
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metric:
+    kind = ""
+    # gauges describe a worker's present state, so exited workers drop out
+    live_only = False
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def expose(self) -> List[str]:
+        return self.header() + self.samples()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def snapshot(self) -> object:
+        """This process's state, as JSON"""
+        raise NotImplementedError
+
+    def merged_samples(self, snapshots: List[Tuple[int, object]]) -> List[str]:
+        """Samples of several processes' (pid, snapshot) pairs"""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _format(self, values) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in values]
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self._format(values)
+
+    def snapshot(self) -> object:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merged_samples(self, snapshots: List[Tuple[int, object]]) -> List[str]:
+        totals: Dict[Tuple[str, ...], float] = {}
+        for _, snapshot in snapshots:
+            for key, value in snapshot:
+                totals[tuple(key)] = totals.get(tuple(key), 0) + value
+        return self._format(totals.items())
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets
+        # per label set: counts per bucket (the last one is +Inf), sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1][0] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total[0]) for key, (counts, total) in self._series.items()]
+        return self._format(series)
+
+    def snapshot(self) -> object:
+        with self._lock:
+            return [[list(key), list(counts), total[0]] for key, (counts, total) in self._series.items()]
+
+    def merged_samples(self, snapshots: List[Tuple[int, object]]) -> List[str]:
+        merged: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        for _, snapshot in snapshots:
+            for key, counts, total in snapshot:
+                series = merged.setdefault(tuple(key), ([0] * (len(self.buckets) + 1), [0.0]))
+                for i, count in enumerate(counts):
+                    series[0][i] += count
+                series[1][0] += total
+        return self._format([(key, counts, total[0]) for key, (counts, total) in merged.items()])
+
+    def _format(self, series) -> List[str]:
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Gauge(Metric):
+    """Value read at scrape time from a callback returning a number or {label value: number}"""
+    kind = "gauge"
+    live_only = True
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], object], label: Optional[str] = None):
+        super().__init__(name, help_text, (label,) if label else ())
+        self.read = read
+
+    def samples(self) -> List[str]:
+        value = self.read()
+        if isinstance(value, dict):
+            return [f"{self.name}{_format_labels(self.labels, (key,))} {v}" for key, v in value.items()]
+        return [f"{self.name} {value}"]
+
+    def snapshot(self) -> object:
+        return self.read()
+
+    def merged_samples(self, snapshots: List[Tuple[int, object]]) -> List[str]:
+        # one series per worker: a queue depth or hit ratio of one process does not add up
+        lines = []
+        labels = self.labels + ("pid",)
+        for pid, value in snapshots:
+            if isinstance(value, dict):
+                lines.extend(f"{self.name}{_format_labels(labels, (key, pid))} {v}" for key, v in value.items())
+            else:
+                lines.append(f"{self.name}{_format_labels(('pid',), (pid,))} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self, multiproc_dir: Optional[str] = MULTIPROC_DIR):
+        self._metrics: Dict[str, Metric] = {}
+        self.multiproc_dir = Path(multiproc_dir) if multiproc_dir else None
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def expose(self) -> str:
+        if self.multiproc_dir is not None:
+            return self._expose_merged()
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+    def save_snapshot(self):
+        """Write this process's metrics for the worker that answers the next scrape"""
+        self.multiproc_dir.mkdir(parents=True, exist_ok=True)
+        path = self.multiproc_dir / f"{os.getpid()}.json"
+        data = {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+        # replaced in one step, so a reader never sees half a file
+        temp = path.with_suffix(".tmp")
+        temp.write_text(json.dumps(data))
+        os.replace(temp, path)
+
+    def _expose_merged(self) -> str:
+        self.save_snapshot()
+        snapshots = []
+        for path in self.multiproc_dir.glob("*.json"):
+            try:
+                snapshots.append((int(path.stem), json.loads(path.read_text())))
+            except (OSError, ValueError):
+                continue
+        live = {pid for pid, _ in snapshots if _alive(pid)}
+        lines = []
+        for name, metric in list(self._metrics.items()):
+            series = [(pid, data[name]) for pid, data in snapshots
+                      if name in data and (pid in live or not metric.live_only)]
+            lines.extend(metric.header() + metric.merged_samples(series))
+        return "\n".join(lines) + "\n"
+
+    async def run_snapshots(self, interval: float = SNAPSHOT_INTERVAL):
+        """Save snapshots periodically; the last one is written on cancellation"""
+        try:
+            while True:
+                try:
+                    self.save_snapshot()
+                except OSError as e:
+                    logger.warning(f"Failed to save metrics snapshot: {e}")
+                await asyncio.sleep(interval)
+        finally:
+            try:
+                self.save_snapshot()
+            except OSError:
+                pass
+
+
+registry = Registry()
+
+http_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Time to the last byte of the response", ("method", "route", "status")
+))
+http_db_commands = registry.register(Histogram(
+    "http_request_db_commands", "MongoDB round trips per request", ("route",), COUNT_BUCKETS
+))
+http_db_seconds = registry.register(Histogram(
+    "http_request_db_seconds", "Time spent in MongoDB commands per request", ("route",)
+))
+db_duration = registry.register(Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency", ("command", "collection")
+))
+db_documents = registry.register(Counter(
+    "mongodb_documents_returned_total", "Documents returned by find, aggregate and getMore", ("command", "collection")
+))
+db_failures = registry.register(Counter(
+    "mongodb_command_failures_total", "Failed MongoDB commands", ("command", "collection")
+))
+password_hash_duration = registry.register(Histogram(
+    "password_hash_duration_seconds", "bcrypt hashing and verification in the worker pool", ("operation",)
+))
+email_duration = registry.register(Histogram(
+    "email_send_duration_seconds", "Email delivery calls", ("result",)
+))
+
+
+class RequestStats:
+    __slots__ = ('db_commands', 'db_seconds', 'documents', 'bcrypt_seconds', 'email_seconds', '_lock')
+
+    def __init__(self):
+        self.db_commands = 0
+        self.db_seconds = 0.0
+        self.documents = 0
+        self.bcrypt_seconds = 0.0
+        self.email_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, **amounts: float):
+        """Add to the named totals; called from the event loop and Motor's threads"""
+        with self._lock:
+            for field, amount in amounts.items():
+                setattr(self, field, getattr(self, field) + amount)
+
+    def server_timing(self, total: float) -> str:
+        parts = [
+            f"app;dur={total * 1000:.1f}",
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_commands} queries, {self.documents} docs"',
+        ]
+        if self.bcrypt_seconds:
+            parts.append(f"bcrypt;dur={self.bcrypt_seconds * 1000:.1f}")
+        if self.email_seconds:
+            parts.append(f"email;dur={self.email_seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def observe_password_hash(operation: str, seconds: float):
+    password_hash_duration.observe(seconds, operation)
+    stats = _current.get()
+    if stats is not None:
+        stats.add(bcrypt_seconds=seconds)
+
+
+def observe_email(ok: bool, seconds: float):
+    email_duration.observe(seconds, "sent" if ok else "failed")
+    stats = _current.get()
+    if stats is not None:
+        stats.add(email_seconds=seconds)
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Motor/PyMongo command listener feeding the DB metrics"""
+
+    def __init__(self):
+        self._collections: Dict[Tuple[int, object], str] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == 'getMore':
+            collection = event.command.get('collection')
+        with self._lock:
+            self._collections[(event.request_id, event.connection_id)] = (
+                collection if isinstance(collection, str) else ""
+            )
+
+    def _finish(self, event) -> Tuple[str, float]:
+        with self._lock:
+            collection = self._collections.pop((event.request_id, event.connection_id), "")
+        seconds = event.duration_micros / 1e6
+        db_duration.observe(seconds, event.command_name, collection)
+        stats = _current.get()
+        if stats is not None:
+            stats.add(db_commands=1, db_seconds=seconds)
+        return collection, seconds
+
+    def succeeded(self, event):
+        collection, _ = self._finish(event)
+        if event.command_name in CURSOR_COMMANDS:
+            cursor = event.reply.get('cursor') or {}
+            count = len(cursor.get('firstBatch') or cursor.get('nextBatch') or ())
+            if count:
+                db_documents.inc(event.command_name, collection, amount=count)
+                stats = _current.get()
+                if stats is not None:
+                    stats.add(documents=count)
+
+    def failed(self, event):
+        collection, _ = self._finish(event)
+        db_failures.inc(event.command_name, collection)
+
+
+command_timer = CommandTimer()
+
+
+class MetricsMiddleware:
+    """Times requests by route template, so /vacation-requests/{request_id} is one series"""
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+                if self.server_timing:
+                    headers = list(message.get('headers', []))
+                    headers.append((b"server-timing", stats.server_timing(time.perf_counter() - started).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = scope.get('route')
+            # unmatched paths share one series, so scanners cannot blow up the label set
+            route = getattr(route, 'path', None) or "unmatched"
+            http_duration.observe(time.perf_counter() - started, scope['method'], route, str(status[0]))
+            http_db_commands.observe(stats.db_commands, route)
+            http_db_seconds.observe(stats.db_seconds, route)
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from database import acquire_lock, ensure_indexes, release_lock
+from utils import to_bson_date
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+# Longest a startup migration may hold its lock before another worker takes over
+MIGRATION_LOCK_SECONDS = 600
+
+# Timestamps written as ISO strings before they were stored as BSON dates
+TIMESTAMP_FIELDS = {
+    "users": ["created_at"],
+    "departments": ["created_at"],
+    "vacation_balances": ["created_at"],
+    "vacation_requests": ["created_at", "updated_at"],
+    "request_history": ["acted_at"],
+}
+
+async def backfill_request_dates(db) -> int:
+    """Add native start_at/end_at dates to requests that only have the string dates"""
+    cursor = db.vacation_requests.find(
+        {"$or": [{"start_at": {"$exists": False}}, {"end_at": {"$exists": False}}]},
+        {"_id": 1, "start_date": 1, "end_date": 1}
+    )
+
+    updated = 0
+    batch = []
+    async for req in cursor:
+        batch.append(UpdateOne(
+            {"_id": req['_id']},
+            {"$set": {"start_at": to_bson_date(req['start_date']), "end_at": to_bson_date(req['end_date'])}}
+        ))
+        if len(batch) >= BATCH_SIZE:
+            updated += (await db.vacation_requests.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await db.vacation_requests.bulk_write(batch, ordered=False)).modified_count
+
+    return updated
+
+async def convert_timestamps(db) -> dict:
+    """Turn string timestamps into BSON dates in place, on the server"""
+    converted = {}
+    for collection, fields in TIMESTAMP_FIELDS.items():
+        for field in fields:
+            result = await db[collection].update_many(
+                {field: {"$type": "string"}},
+                [{"$set": {field: {"$toDate": f"${field}"}}}]
+            )
+            converted[f"{collection}.{field}"] = result.modified_count
+    return converted
+
+async def unmigrated_fields(db) -> list:
+    """Fields backfill_request_dates or convert_timestamps still have work on"""
+    pending = []
+    if await db.vacation_requests.count_documents(
+        {"$or": [{"start_at": {"$exists": False}}, {"end_at": {"$exists": False}}]}, limit=1
+    ):
+        pending.append("vacation_requests.start_at/end_at")
+    for collection, fields in TIMESTAMP_FIELDS.items():
+        for field in fields:
+            if await db[collection].count_documents({field: {"$type": "string"}}, limit=1):
+                pending.append(f"{collection}.{field}")
+    return pending
+
+async def migrate_if_needed(db):
+    """Run the migration at startup when data from before it is left.
+
+    Calendar and range queries only see requests with start_at/end_at, so
+    this cannot wait for someone to run the script; one worker migrates
+    under a lock, the others leave it to that one.
+    """
+    try:
+        pending = await unmigrated_fields(db)
+        if not pending:
+            return
+        owner = await acquire_lock(db, "migrate_dates", MIGRATION_LOCK_SECONDS)
+        if owner is None:
+            return
+        try:
+            logger.info(f"Migrating {', '.join(pending)}")
+            updated = await backfill_request_dates(db)
+            converted = sum((await convert_timestamps(db)).values())
+            logger.info(f"Migration done: {updated} requests given start_at/end_at, {converted} timestamps converted")
+        finally:
+            await release_lock(db, "migrate_dates", owner)
+    except PyMongoError as e:
+        logger.error(f"Startup migration failed, run migrate_dates.py: {e}")
+
+async def migrate():
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.environ['DB_NAME']]
+
+    updated = await backfill_request_dates(db)
+    print(f"Заявок с добавленными датами start_at/end_at: {updated}")
+
+    for field, count in (await convert_timestamps(db)).items():
+        print(f"{field}: преобразовано в даты {count}")
+
+    await ensure_indexes(db)
+    print("Индексы обновлены")
+
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
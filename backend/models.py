@@ -25,6 +25,33 @@ class UserCreate(BaseModel):
     department_id: str
     manager_id: Optional[str] = None
 
+class UserImportRow(BaseModel):
+    """One row of an HR export; the department is given by id or by name"""
+    login: str
+    password: str
+    role: str = "employee"
+    full_name: str
+    email: EmailStr
+    department_id: Optional[str] = None
+    department: Optional[str] = None
+    manager_id: Optional[str] = None
+    total_days: int = 28
+
+class UserImportError(BaseModel):
+    line: int
+    login: Optional[str] = None
+    error: str
+
+class UserImportReport(BaseModel):
+    rows: int = 0
+    created: int = 0
+    existing: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    errors: List[UserImportError] = []
+    seconds: float = 0.0
+    rows_per_sec: float = 0.0
+
 class UserResponse(BaseModel):
     id: str
     login: str
@@ -62,6 +89,8 @@ class VacationBalance(BaseModel):
     year: int
     total_days: int = 28
     used_days: int = 0
+    # days held by pending requests
+    reserved_days: int = 0
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class VacationBalanceCreate(BaseModel):
@@ -85,6 +114,9 @@ class VacationRequest(BaseModel):
     comment: Optional[str] = None
     manager_comment: Optional[str] = None
     work_days: int = 0
+    # days held on the balance of balance_year while the request is pending
+    reserved_days: int = 0
+    balance_year: Optional[int] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -98,6 +130,19 @@ class VacationRequestUpdate(BaseModel):
     status: str
     manager_comment: Optional[str] = None
 
+class VacationRequestBulkUpdate(BaseModel):
+    request_ids: List[str] = Field(min_length=1, max_length=1000)
+    status: str
+    manager_comment: Optional[str] = None
+
+class BulkSkippedRequest(BaseModel):
+    id: str
+    reason: str
+
+class VacationRequestBulkResult(BaseModel):
+    updated: List[str]
+    skipped: List[BulkSkippedRequest]
+
 class RequestHistory(BaseModel):
     model_config = ConfigDict(extra="ignore")
     
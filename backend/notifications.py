@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from email_service import EmailService, email_service, render_vacation_status_email
+import metrics
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = "email_outbox"
+DUPLICATE_KEY = 11000
+
+
+class NotificationQueue:
+    """Background email delivery backed by a Mongo outbox.
+
+    Messages are rendered once and persisted in the outbox before they are
+    handed to the in-process queue, so nothing is lost on restart: the sweeper
+    re-queues pending messages and retries failed sends with backoff.
+
+    Several workers share one outbox, so a message is sent only by the worker
+    that claims it: the claim moves it from pending to sending with a lease.
+    Failed sends go back to pending, and the sweeper returns messages whose
+    lease ran out (their worker died mid-send) to pending as well.
+    """
+
+    def __init__(self, db, sender: EmailService = email_service, batch_size: int = 50,
+                 batch_window: float = 0.2, concurrency: int = 8, max_attempts: int = 5,
+                 backoff_base: float = 5.0, sweep_interval: float = 30.0, lease_seconds: float = 120.0):
+        self.db = db
+        self.sender = sender
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.sweep_interval = sweep_interval
+        self.lease_seconds = lease_seconds
+        # marks this process's claims in the outbox
+        self.owner = uuid.uuid4().hex
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued_ids = set()
+        self._tasks: List[asyncio.Task] = []
+        self.sent = 0
+        self.failed = 0
+        self.deduplicated = 0
+
+    @property
+    def outbox(self):
+        return self.db[OUTBOX_COLLECTION]
+
+    def _put(self, message: dict):
+        if message['id'] in self._queued_ids:
+            return
+        self._queued_ids.add(message['id'])
+        self._queue.put_nowait(message)
+
+    @staticmethod
+    def _new_message(dedup_key: str, to_email: str, subject: str, html_content: str, now: datetime) -> dict:
+        return {
+            "id": str(uuid.uuid4()),
+            "dedup_key": dedup_key,
+            "to_email": to_email,
+            "subject": subject,
+            "html_content": html_content,
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+        }
+
+    async def enqueue(self, dedup_key: str, to_email: str, subject: str, html_content: str) -> bool:
+        """Persist a message and schedule delivery; returns False for duplicates"""
+        message = self._new_message(dedup_key, to_email, subject, html_content, datetime.now(timezone.utc))
+        try:
+            await self.outbox.insert_one(message)
+        except DuplicateKeyError:
+            self.deduplicated += 1
+            logger.info(f"Skipping duplicate notification {dedup_key}")
+            return False
+
+        message.pop("_id", None)
+        if self._queue is not None:
+            self._put(message)
+        return True
+
+    async def enqueue_many(self, messages: List[Tuple[str, str, str, str]]) -> int:
+        """Persist (dedup_key, to_email, subject, html_content) tuples with one insert.
+
+        Returns the number of new messages; duplicates are skipped like in enqueue.
+        """
+        if not messages:
+            return 0
+        now = datetime.now(timezone.utc)
+        docs = [self._new_message(*message, now) for message in messages]
+        try:
+            await self.outbox.insert_many(docs, ordered=False)
+            inserted = docs
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            duplicates = {error['index'] for error in errors if error['code'] == DUPLICATE_KEY}
+            if len(duplicates) < len(errors):
+                raise
+            self.deduplicated += len(duplicates)
+            logger.info(f"Skipping {len(duplicates)} duplicate notifications")
+            inserted = [doc for i, doc in enumerate(docs) if i not in duplicates]
+
+        for message in inserted:
+            message.pop("_id", None)
+            if self._queue is not None:
+                self._put(message)
+        return len(inserted)
+
+    @staticmethod
+    def vacation_status_message(request_id: str, history_id: str, to_email: str, employee_name: str,
+                                start_date: str, end_date: str, status: str,
+                                manager_comment: str = None) -> Tuple[str, str, str, str]:
+        """Message for one status change; keyed by its request_history entry, so a
+        request that returns to an earlier status is notified again"""
+        subject, html_content = render_vacation_status_email(
+            employee_name, start_date, end_date, status, manager_comment
+        )
+        return f"vacation-status:{request_id}:{status}:{history_id}", to_email, subject, html_content
+
+    async def enqueue_vacation_status(self, request_id: str, history_id: str, to_email: str, employee_name: str,
+                                      start_date: str, end_date: str, status: str,
+                                      manager_comment: str = None) -> bool:
+        return await self.enqueue(*self.vacation_status_message(
+            request_id, history_id, to_email, employee_name, start_date, end_date, status, manager_comment
+        ))
+
+    async def _next_batch(self) -> List[dict]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.batch_window
+        while len(batch) < self.batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _send(self, message: dict, semaphore: asyncio.Semaphore) -> bool:
+        # one API call per message: each body is rendered for its recipient, so
+        # batches share the outbox reads and writes, not the SendGrid request
+        async with semaphore:
+            started = time.perf_counter()
+            ok = await asyncio.to_thread(
+                self.sender.send_email, message['to_email'], message['subject'], message['html_content']
+            )
+            if self.sender.enabled:
+                metrics.observe_email(ok, time.perf_counter() - started)
+            return ok
+
+    async def _claim(self, message: dict, now: datetime) -> Optional[dict]:
+        """Take a due message for this worker; None when another worker has it or it is done"""
+        return await self.outbox.find_one_and_update(
+            {"id": message['id'], "status": "pending", "next_attempt_at": {"$lte": now}},
+            {"$set": {
+                "status": "sending",
+                "lease_until": now + timedelta(seconds=self.lease_seconds),
+                "owner": self.owner
+            }},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _release(self, ids: List[str]):
+        """Hand this worker's unfinished claims back to the outbox"""
+        if ids:
+            await self.outbox.update_many(
+                {"id": {"$in": ids}, "status": "sending", "owner": self.owner},
+                {"$set": {"status": "pending"}, "$unset": {"lease_until": "", "owner": ""}}
+            )
+
+    def _result_update(self, message: dict, ok: bool, now: datetime) -> UpdateOne:
+        attempts = message['attempts'] + 1
+        if ok:
+            self.sent += 1
+            update = {"status": "sent", "attempts": attempts, "sent_at": now}
+        elif not self.sender.enabled:
+            update = {"status": "skipped", "attempts": attempts}
+        elif attempts >= self.max_attempts:
+            self.failed += 1
+            update = {"status": "failed", "attempts": attempts}
+        else:
+            delay = self.backoff_base * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+            update = {"status": "pending", "attempts": attempts, "next_attempt_at": now + timedelta(seconds=delay)}
+        # only while the claim is still ours; after a lease expiry the message belongs to someone else
+        return UpdateOne(
+            {"id": message['id'], "status": "sending", "owner": self.owner},
+            {"$set": update, "$unset": {"lease_until": "", "owner": ""}}
+        )
+
+    async def _worker(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            batch = await self._next_batch()
+            claimed = []
+            try:
+                now = datetime.now(timezone.utc)
+                claims = await asyncio.gather(*(self._claim(m, now) for m in batch))
+                claimed = [message for message in claims if message is not None]
+                if claimed:
+                    results = await asyncio.gather(*(self._send(m, semaphore) for m in claimed))
+                    now = datetime.now(timezone.utc)
+                    await self.outbox.bulk_write(
+                        [self._result_update(m, ok, now) for m, ok in zip(claimed, results)],
+                        ordered=False
+                    )
+            except Exception as e:
+                logger.error(f"Notification batch failed: {str(e)}")
+                try:
+                    await self._release([m['id'] for m in claimed])
+                except Exception as e:
+                    logger.error(f"Failed to release notification claims: {str(e)}")
+            finally:
+                for message in batch:
+                    self._queued_ids.discard(message['id'])
+
+    async def _sweeper(self):
+        """Re-queue pending messages that are due, including those left over from a restart"""
+        while True:
+            try:
+                now = datetime.now(timezone.utc)
+                expired = await self.outbox.update_many(
+                    {"status": "sending", "lease_until": {"$lte": now}},
+                    {"$set": {"status": "pending"}, "$unset": {"lease_until": "", "owner": ""}}
+                )
+                if expired.modified_count:
+                    logger.warning(f"Re-queued {expired.modified_count} notifications whose sender lease expired")
+                due = self.outbox.find(
+                    {"status": "pending", "next_attempt_at": {"$lte": now}},
+                    {"_id": 0}
+                ).sort("next_attempt_at", 1).limit(self.batch_size * 10)
+                async for message in due:
+                    self._put(message)
+            except Exception as e:
+                logger.error(f"Notification sweep failed: {str(e)}")
+            await asyncio.sleep(self.sweep_interval)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()), asyncio.create_task(self._sweeper())]
+
+    async def stop(self, timeout: float = 5.0):
+        """Give queued messages a chance to go out, then stop; leftovers stay in the outbox"""
+        if not self._tasks:
+            return
+        waited = 0.0
+        while self._queued_ids and waited < timeout:
+            await asyncio.sleep(0.1)
+            waited += 0.1
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        try:
+            # sends cut off by the cancellation go to the next worker without waiting for the lease
+            await self.outbox.update_many(
+                {"status": "sending", "owner": self.owner},
+                {"$set": {"status": "pending"}, "$unset": {"lease_until": "", "owner": ""}}
+            )
+        except Exception as e:
+            logger.error(f"Failed to release notification claims: {str(e)}")
+        self._tasks = []
+        self._queue = None
+        self._queued_ids.clear()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": len(self._queued_ids),
+            "sent": self.sent,
+            "failed": self.failed,
+            "deduplicated": self.deduplicated,
+        }
@@ -0,0 +1,252 @@
+"""Per-department daily occupancy, maintained as approved requests change.
+
+One document per department and day on which someone is off:
+{department_id, date, requests: [{id, user_id}], count}. Overlap checks and
+heatmaps read a date range of it instead of sweeping vacation_requests.
+A department whose update failed is marked dirty and rebuilt in the
+background by whichever worker takes its lock first.
+
+Usage: python occupancy.py [--department DEPARTMENT_ID]   # rebuild from requests
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from database import acquire_lock, release_lock, run_in_transaction
+from utils import build_occupancy_segments, to_bson_date
+
+logger = logging.getLogger(__name__)
+
+OCCUPANCY_COLLECTION = "department_occupancy"
+REBUILD_BATCH_SIZE = 1000
+# Longest a startup rebuild may hold its lock before another worker takes over
+REBUILD_LOCK_SECONDS = 600
+DIRTY_COLLECTION = "occupancy_dirty"
+# Seconds between passes over the dirty departments
+REPAIR_INTERVAL = float(os.environ.get('OCCUPANCY_REPAIR_INTERVAL', 10))
+
+# Marks that could not be stored either; retried by this worker's repair loop
+_dirty: Set[str] = set()
+
+
+def _days(start_date: str, end_date: str) -> List[datetime]:
+    day, last = to_bson_date(start_date), to_bson_date(end_date)
+    days = []
+    while day <= last:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def _without(request_id: str) -> dict:
+    return {"$filter": {
+        "input": {"$ifNull": ["$requests", []]},
+        "cond": {"$ne": ["$$this.id", request_id]}
+    }}
+
+
+def occupancy_updates(department_id: str, request: dict, approved: bool) -> List[UpdateOne]:
+    """Per-day updates that add (approved=True) or remove a request.
+
+    Updates are pipelines that first drop the request from the day, so
+    replaying them, e.g. after a retry, leaves the same result.
+    """
+    entries = _without(request['id'])
+    if approved:
+        entries = {"$concatArrays": [entries, [{"id": request['id'], "user_id": request['user_id']}]]}
+    pipeline = [
+        {"$set": {"requests": entries}},
+        {"$set": {"count": {"$size": "$requests"}}},
+    ]
+    return [
+        UpdateOne({"department_id": department_id, "date": day}, pipeline, upsert=approved)
+        for day in _days(request['start_date'], request['end_date'])
+    ]
+
+
+async def record(db, changes: List[Tuple[str, dict]], approved: bool, session=None):
+    """Add (department_id, request) pairs to their days, or remove requests no longer approved"""
+    updates = [
+        update for department_id, request in changes
+        for update in occupancy_updates(department_id, request, approved)
+    ]
+    if not updates:
+        return
+    await db[OCCUPANCY_COLLECTION].bulk_write(updates, ordered=False, session=session)
+    if not approved:
+        # days nobody is off any more are not kept
+        for department_id, request in changes:
+            await db[OCCUPANCY_COLLECTION].delete_many({
+                "department_id": department_id,
+                "date": {"$gte": to_bson_date(request['start_date']), "$lte": to_bson_date(request['end_date'])},
+                "count": 0,
+            }, session=session)
+
+
+async def mark_dirty(db, department_ids: Iterable[str]):
+    """Queue departments whose occupancy missed an update for a rebuild.
+
+    Each mark gets a new token, so a mark made while a rebuild runs outlives
+    that rebuild and causes another one.
+    """
+    department_ids = set(department_ids)
+    _dirty.update(department_ids)
+    try:
+        for department_id in department_ids:
+            await db[DIRTY_COLLECTION].update_one(
+                {"_id": department_id},
+                {"$set": {"token": uuid.uuid4().hex, "marked_at": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+    except PyMongoError as e:
+        logger.error(f"Failed to mark department occupancy for rebuild, retrying later: {e}")
+        return
+    _dirty.difference_update(department_ids)
+
+
+async def repair_dirty(db) -> int:
+    """Rebuild the departments marked dirty; returns how many were rebuilt"""
+    if _dirty:
+        await mark_dirty(db, set(_dirty))
+    repaired = 0
+    async for mark in db[DIRTY_COLLECTION].find({}):
+        lock = f"occupancy_rebuild:{mark['_id']}"
+        owner = await acquire_lock(db, lock, REBUILD_LOCK_SECONDS)
+        if owner is None:
+            continue
+        try:
+            await rebuild(db, mark['_id'])
+            # a newer mark means a change the rebuild may have missed
+            await db[DIRTY_COLLECTION].delete_one({"_id": mark['_id'], "token": mark['token']})
+            repaired += 1
+        finally:
+            await release_lock(db, lock, owner)
+    return repaired
+
+
+async def run_repairs(db):
+    """Keep rebuilding dirty departments until cancelled"""
+    while True:
+        try:
+            repaired = await repair_dirty(db)
+            if repaired:
+                logger.info(f"Department occupancy rebuilt for {repaired} departments after failed updates")
+        except PyMongoError as e:
+            logger.error(f"Department occupancy repair failed: {e}")
+        await asyncio.sleep(REPAIR_INTERVAL)
+
+
+async def occupied_days(db, department_id: str, start_date: str, end_date: str,
+                        min_count: int = 1, with_users: bool = True) -> List[dict]:
+    """Days in [start_date, end_date] with at least min_count approved requests, in date order"""
+    query = {
+        "department_id": department_id,
+        "date": {"$gte": to_bson_date(start_date), "$lte": to_bson_date(end_date)},
+    }
+    if min_count > 1:
+        query["count"] = {"$gte": min_count}
+    projection = {"_id": 0, "date": 1, "count": 1}
+    if with_users:
+        projection["requests.user_id"] = 1
+    return await db[OCCUPANCY_COLLECTION].find(query, projection).sort("date", 1).to_list(None)
+
+
+async def rebuild(db, department_id: Optional[str] = None) -> Dict[str, int]:
+    """Recompute occupancy from approved requests; returns stored days per department"""
+    match = {"department_id": department_id} if department_id else {}
+    pipeline = [
+        {"$match": match},
+        {"$project": {"_id": 0, "id": 1, "department_id": 1}},
+        {"$lookup": {
+            "from": "vacation_requests",
+            "localField": "id",
+            "foreignField": "user_id",
+            "pipeline": [
+                {"$match": {"status": "approved"}},
+                {"$project": {"_id": 0, "id": 1, "user_id": 1, "start_date": 1, "end_date": 1, "status": 1}},
+            ],
+            "as": "requests"
+        }},
+    ]
+    by_department: Dict[str, List[dict]] = {}
+    async for user in db.users.aggregate(pipeline):
+        by_department.setdefault(user['department_id'], []).extend(user['requests'])
+    if department_id:
+        by_department.setdefault(department_id, [])
+
+    stored = {}
+    for dept_id, requests in by_department.items():
+        docs = []
+        for first_day, last_day, entries in build_occupancy_segments(
+            requests, key=lambda r: {"id": r['id'], "user_id": r['user_id']}
+        ):
+            for day in _days(first_day.isoformat(), last_day.isoformat()):
+                docs.append({"department_id": dept_id, "date": day, "requests": entries, "count": len(entries)})
+
+        async def replace(session, dept_id=dept_id, docs=docs):
+            await db[OCCUPANCY_COLLECTION].delete_many({"department_id": dept_id}, session=session)
+            for i in range(0, len(docs), REBUILD_BATCH_SIZE):
+                await db[OCCUPANCY_COLLECTION].insert_many(
+                    [dict(doc) for doc in docs[i:i + REBUILD_BATCH_SIZE]], session=session
+                )
+
+        await run_in_transaction(db.client, replace)
+        stored[dept_id] = len(docs)
+    return stored
+
+
+async def _needs_rebuild(db) -> bool:
+    if await db[OCCUPANCY_COLLECTION].find_one({}, {"_id": 1}):
+        return False
+    return bool(await db.vacation_requests.find_one({"status": "approved"}, {"_id": 1}))
+
+
+async def rebuild_if_empty(db):
+    """Populate the collection on first start after upgrading; with several
+    workers starting at once only the one holding the lock does it"""
+    if not await _needs_rebuild(db):
+        return
+    owner = await acquire_lock(db, "occupancy_rebuild", REBUILD_LOCK_SECONDS)
+    if owner is None:
+        return
+    try:
+        # another worker may have finished between the check and the lock
+        if not await _needs_rebuild(db):
+            return
+        started = time.perf_counter()
+        stored = await rebuild(db)
+        logger.info(f"Department occupancy built for {len(stored)} departments in {time.perf_counter() - started:.1f}s")
+    finally:
+        await release_lock(db, "occupancy_rebuild", owner)
+
+
+async def main(department_id: Optional[str]):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        started = time.perf_counter()
+        stored = await rebuild(db, department_id)
+        print(f"Пересчитано отделов: {len(stored)}, дней: {sum(stored.values())} "
+              f"за {time.perf_counter() - started:.1f} с")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--department", help="rebuild a single department")
+    args = parser.parse_args()
+    asyncio.run(main(args.department))
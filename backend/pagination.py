@@ -0,0 +1,106 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple, Union
+
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 5000
+STREAM_CHUNK_SIZE = 500
+
+# Newest first; id breaks ties between requests created in the same instant
+KEYSET_SORT = [("created_at", -1), ("id", -1)]
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(doc: dict) -> str:
+    """Opaque cursor pointing right after the given document"""
+    created_at = doc['created_at']
+    # documents not yet converted by migrate_dates.py keep an ISO string
+    position = [created_at, doc['id'], "str"] if isinstance(created_at, str) else [created_at.isoformat(), doc['id']]
+    raw = json.dumps(position).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[Union[datetime, str], str]:
+    try:
+        created_at, doc_id, *kind = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if kind == ["str"]:
+            return str(created_at), doc_id
+        # created_at is a BSON date, compared as such
+        return datetime.fromisoformat(created_at), doc_id
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Неверный курсор пагинации")
+
+
+def keyset_query(query: dict, after: Optional[str]) -> dict:
+    """Restrict query to documents that sort after the cursor"""
+    if not after:
+        return query
+    created_at, doc_id = decode_cursor(after)
+    position = {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": doc_id}},
+    ]}
+    if isinstance(created_at, datetime):
+        # strings sort below every date and $lt only compares within a type
+        position["$or"].append({"created_at": {"$type": "string"}})
+    return {"$and": [query, position]} if query else position
+
+
+def find_keyset(collection, query: dict, after: Optional[str] = None, limit: Optional[int] = None,
+                projection: Optional[dict] = None):
+    cursor = collection.find(keyset_query(query, after), projection or {"_id": 0}).sort(KEYSET_SORT)
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+async def fetch_page(collection, query: dict, after: Optional[str], limit: Optional[int],
+                     projection: Optional[dict] = None) -> Tuple[List[dict], Optional[str]]:
+    """Fetch one page and the cursor of the next one (None on the last page)"""
+    limit = limit or DEFAULT_PAGE_SIZE
+    docs = await find_keyset(collection, query, after, limit + 1, projection).to_list(limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, encode_cursor(docs[-1])
+    return docs, None
+
+
+async def fetch_aggregate_page(collection, pipeline: List[dict], limit: Optional[int]) -> Tuple[List[dict], Optional[str]]:
+    """Like fetch_page for an aggregation whose output is already in KEYSET_SORT order"""
+    limit = limit or DEFAULT_PAGE_SIZE
+    docs = await collection.aggregate(pipeline + [{"$limit": limit + 1}]).to_list(limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, encode_cursor(docs[-1])
+    return docs, None
+
+
+async def iter_chunks(cursor, size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[List[dict]]:
+    """Group documents of a Motor cursor into lists as they arrive"""
+    chunk = []
+    async for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def _encode_ndjson(chunks: AsyncIterator[List[dict]],
+                         enrich: Optional[Callable[[List[dict]], Awaitable[List[dict]]]]):
+    async for chunk in chunks:
+        if enrich:
+            chunk = await enrich(chunk)
+        yield b"".join(orjson.dumps(doc, default=str) + b"\n" for doc in chunk)
+
+
+def ndjson_response(cursor, enrich: Optional[Callable[[List[dict]], Awaitable[List[dict]]]] = None) -> StreamingResponse:
+    """Stream a Motor cursor as newline-delimited JSON, one chunk at a time"""
+    return StreamingResponse(_encode_ndjson(iter_chunks(cursor), enrich), media_type="application/x-ndjson")
@@ -3,7 +3,7 @@ from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
 from pathlib import Path
-from auth import hash_password
+from auth import password_hasher
 from datetime import datetime, timezone
 import uuid
 
@@ -24,9 +24,9 @@ async def seed_database():
     print("Очистка базы данных завершена")
     
     departments = [
-        {"id": str(uuid.uuid4()), "name": "Разработка", "max_simultaneous_vacations": 2, "created_at": datetime.now(timezone.utc).isoformat()},
-        {"id": str(uuid.uuid4()), "name": "Продажи", "max_simultaneous_vacations": 2, "created_at": datetime.now(timezone.utc).isoformat()},
-        {"id": str(uuid.uuid4()), "name": "HR", "max_simultaneous_vacations": 1, "created_at": datetime.now(timezone.utc).isoformat()},
+        {"id": str(uuid.uuid4()), "name": "Разработка", "max_simultaneous_vacations": 2, "created_at": datetime.now(timezone.utc)},
+        {"id": str(uuid.uuid4()), "name": "Продажи", "max_simultaneous_vacations": 2, "created_at": datetime.now(timezone.utc)},
+        {"id": str(uuid.uuid4()), "name": "HR", "max_simultaneous_vacations": 1, "created_at": datetime.now(timezone.utc)},
     ]
     
     await db.departments.insert_many(departments)
@@ -43,86 +43,90 @@ async def seed_database():
         {
             "id": str(uuid.uuid4()),
             "login": "hr_admin",
-            "password_hash": hash_password("password123"),
+            "password": "password123",
             "role": "hr",
             "full_name": "Елена Смирнова",
             "email": "hr@example.com",
             "department_id": hr_dept_id,
             "manager_id": None,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         },
         
         {
             "id": dev_manager_id,
             "login": "dev_manager",
-            "password_hash": hash_password("password123"),
+            "password": "password123",
             "role": "manager",
             "full_name": "Алексей Иванов",
             "email": "dev_manager@example.com",
             "department_id": dev_dept_id,
             "manager_id": None,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         },
         
         {
             "id": sales_manager_id,
             "login": "sales_manager",
-            "password_hash": hash_password("password123"),
+            "password": "password123",
             "role": "manager",
             "full_name": "Мария Петрова",
             "email": "sales_manager@example.com",
             "department_id": sales_dept_id,
             "manager_id": None,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         },
         
         {
             "id": str(uuid.uuid4()),
             "login": "developer1",
-            "password_hash": hash_password("password123"),
+            "password": "password123",
             "role": "employee",
             "full_name": "Дмитрий Соколов",
             "email": "dev1@example.com",
             "department_id": dev_dept_id,
             "manager_id": dev_manager_id,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         },
         {
             "id": str(uuid.uuid4()),
             "login": "developer2",
-            "password_hash": hash_password("password123"),
+            "password": "password123",
             "role": "employee",
             "full_name": "Анна Кузнецова",
             "email": "dev2@example.com",
             "department_id": dev_dept_id,
             "manager_id": dev_manager_id,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         },
         
         {
             "id": str(uuid.uuid4()),
             "login": "sales1",
-            "password_hash": hash_password("password123"),
+            "password": "password123",
             "role": "employee",
             "full_name": "Сергей Морозов",
             "email": "sales1@example.com",
             "department_id": sales_dept_id,
             "manager_id": sales_manager_id,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         },
         {
             "id": str(uuid.uuid4()),
             "login": "sales2",
-            "password_hash": hash_password("password123"),
+            "password": "password123",
             "role": "employee",
             "full_name": "Ольга Новикова",
             "email": "sales2@example.com",
             "department_id": sales_dept_id,
             "manager_id": sales_manager_id,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         },
     ]
     
+    hashes = await asyncio.gather(*(password_hasher.hash(user.pop("password")) for user in users))
+    for user, password_hash in zip(users, hashes):
+        user["password_hash"] = password_hash
+
     await db.users.insert_many(users)
     print(f"Создано {len(users)} пользователей")
     
@@ -136,7 +140,7 @@ async def seed_database():
             "year": current_year,
             "total_days": 28,
             "used_days": 0,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         })
     
     await db.vacation_balances.insert_many(balances)
@@ -150,6 +154,7 @@ async def seed_database():
     print("Сотрудник: логин='sales1', пароль='password123'")
     
     client.close()
+    password_hasher.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(seed_database())
\ No newline at end of file
@@ -4,7 +4,8 @@ from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
 from pathlib import Path
-from auth import hash_password
+from auth import password_hasher
+from user_import import import_users
 from datetime import datetime, timezone
 import uuid
 
@@ -22,16 +23,12 @@ async def seed_test_data():
         {"name": "HR", "max_simultaneous_vacations": 1},
     ]
 
-    dept_map = {}
+    # users below refer to departments by name
     for dept in departments:
-        existing = await db.departments.find_one({"name": dept["name"]})
-        if not existing:
+        if not await db.departments.find_one({"name": dept["name"]}):
             dept["id"] = str(uuid.uuid4())
-            dept["created_at"] = datetime.now(timezone.utc).isoformat()
+            dept["created_at"] = datetime.now(timezone.utc)
             await db.departments.insert_one(dept)
-            dept_map[dept["name"]] = dept["id"]
-        else:
-            dept_map[dept["name"]] = existing["id"]
 
     users = [
         {"login": "hr_admin", "password": "password123", "role": "hr", "full_name": "Елена Смирнова", "email": "hr@example.com", "department": "HR"},
@@ -39,24 +36,12 @@ async def seed_test_data():
         {"login": "sales_manager", "password": "password123", "role": "manager", "full_name": "Мария Петрова", "email": "sales_manager@example.com", "department": "Продажи"},
     ]
 
-    for u in users:
-        existing = await db.users.find_one({"login": u["login"]})
-        if not existing:
-            user_doc = {
-                "id": str(uuid.uuid4()),
-                "login": u["login"],
-                "password_hash": hash_password(u["password"]),
-                "role": u["role"],
-                "full_name": u["full_name"],
-                "email": u["email"],
-                "department_id": dept_map[u["department"]],
-                "manager_id": None,
-                "created_at": datetime.now(timezone.utc).isoformat()
-            }
-            await db.users.insert_one(user_doc)
-    
+    report = await import_users(db, enumerate(users, start=1))
+    print(f"Создано пользователей: {report.created}")
+
     print("Тестовые данные созданы (если их ещё не было)")
     client.close()
+    password_hasher.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(seed_test_data())
@@ -0,0 +1,42 @@
+"""JSON responses for documents the API reads back from its own database.
+
+FastAPI validates a handler's return value against the response_model and
+then walks it once more to make it JSON-compatible. For list endpoints
+returning thousands of rows that were validated when they were written,
+this is most of the request time. Such handlers project the documents onto
+the model's fields instead and dump them with orjson, which encodes
+datetimes natively.
+"""
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+
+
+@lru_cache(maxsize=None)
+def _fields(model: Type[BaseModel], extra: Tuple[str, ...]) -> Tuple[Tuple[str, ...], Dict[str, object]]:
+    defaults = {
+        name: field.default for name, field in model.model_fields.items()
+        if not field.is_required() and field.default_factory is None
+    }
+    return tuple(model.model_fields) + extra, defaults
+
+
+def project(docs: Iterable[dict], model: Type[BaseModel], extra: Tuple[str, ...] = ()) -> List[dict]:
+    """Documents reduced to the fields of model (plus extra), missing ones set to their defaults.
+
+    Values are not validated: only use it on documents the API wrote itself.
+    """
+    fields, defaults = _fields(model, extra)
+    return [{name: doc[name] if name in doc else defaults.get(name) for name in fields} for doc in docs]
+
+
+def json_response(content, response: Optional[Response] = None, status_code: int = 200) -> Response:
+    """content dumped with orjson, keeping headers already set on the endpoint's response"""
+    result = Response(orjson.dumps(content), status_code=status_code, media_type="application/json")
+    if response is not None:
+        # FastAPI only merges these into responses it builds itself
+        result.headers.raw.extend(response.headers.raw)
+    return result
@@ -1,35 +1,125 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response
 from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import PyMongoError
 from datetime import date
 import os
+import io
+import asyncio
+import tempfile
+import time
+import uuid
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import List, Optional
 from datetime import datetime, timezone
-from io import BytesIO
 
 from models import (
     User, UserCreate, UserResponse, LoginRequest, LoginResponse,
     Department, DepartmentCreate,
     VacationBalance, VacationBalanceCreate, VacationBalanceUpdate,
     VacationRequest, VacationRequestCreate, VacationRequestUpdate,
-    RequestHistory, OverlapWarning
+    VacationRequestBulkUpdate, VacationRequestBulkResult, BulkSkippedRequest,
+    RequestHistory, OverlapWarning, UserImportReport
+)
+from auth import (
+    password_hasher, create_access_token, get_current_user, user_claims,
+    load_token_versions, revoke_user_tokens, issue_stream_ticket, redeem_stream_ticket, STREAM_TICKET_TTL
+)
+from notifications import NotificationQueue
+from utils import calculate_work_days, iter_csv, iter_xlsx, to_bson_date
+from database import ensure_indexes, run_in_transaction
+from migrate_dates import migrate_if_needed
+from balances import (
+    adjust_balance, available_days, current_year, request_balance_change, request_balance_year
+)
+from user_import import detect_format, import_users, read_rows
+import occupancy
+import analytics
+import auth
+import cache
+import etags
+import events
+from events import event_hub
+import metrics
+from serialization import json_response, project
+from pagination import (
+    DEFAULT_PAGE_SIZE, KEYSET_SORT, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER,
+    fetch_aggregate_page, fetch_page, find_keyset, iter_chunks, keyset_query, ndjson_response
 )
-from auth import hash_password, verify_password, create_access_token, get_current_user
-from email_service import email_service
-from utils import calculate_work_days, export_to_csv, check_overlap
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Token revocations and cache invalidations reach the other workers only through Redis
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+# Connected in lifespan, so importing the app (each worker, scripts, benchmarks) opens no connections
+client: Optional[AsyncIOMotorClient] = None
+db = None
+notification_queue = NotificationQueue(None)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Connect to MongoDB and start the background services, timing each step"""
+    global client, db
+    timings = app.state.startup_timings = {}
+    started = step_started = time.perf_counter()
+
+    def step(name: str):
+        nonlocal step_started
+        now = time.perf_counter()
+        timings[name] = round((now - step_started) * 1000, 1)
+        step_started = now
+
+    # timestamps are stored as BSON dates and read back as aware UTC datetimes
+    client = AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=[metrics.command_timer])
+    db = client[os.environ['DB_NAME']]
+    notification_queue.db = db
+    auth.db = db
+    step("mongo_client")
+    if not isinstance(cache.configure(), cache.RedisBackend) and WEB_CONCURRENCY > 1:
+        raise RuntimeError(f"WEB_CONCURRENCY={WEB_CONCURRENCY} needs CACHE_URL pointing at Redis, "
+                           "otherwise revoked tokens stay valid in the other workers")
+    step("shared_cache")
+    await ensure_indexes(db)
+    step("indexes")
+    await load_token_versions(db)
+    step("token_versions")
+    notification_queue.start()
+    step("notification_queue")
+    tasks = [
+        asyncio.create_task(cache.watch_changes(db)),
+        asyncio.create_task(cache.listen_invalidations(on_reconnect=lambda: load_token_versions(db))),
+        asyncio.create_task(migrate_if_needed(db)),
+        asyncio.create_task(occupancy.rebuild_if_empty(db)),
+        asyncio.create_task(occupancy.run_repairs(db)),
+        asyncio.create_task(event_hub.run_heartbeat()),
+        asyncio.create_task(events.watch_requests(db)),
+    ]
+    if metrics.registry.multiproc_dir is not None:
+        tasks.append(asyncio.create_task(metrics.registry.run_snapshots()))
+    step("background_tasks")
+    logger.info(f"Started in {(time.perf_counter() - started) * 1000:.0f} ms: "
+                + ", ".join(f"{name} {ms} ms" for name, ms in timings.items()))
+
+    yield
 
-app = FastAPI(title="VacationFlow API")
+    for task in tasks:
+        task.cancel()
+    event_hub.close_all()
+    await notification_queue.stop()
+    await cache.close()
+    client.close()
+    password_hasher.shutdown()
+
+
+app = FastAPI(title="VacationFlow API", lifespan=lifespan)
 
 from fastapi.middleware.cors import CORSMiddleware
 origins = os.environ.get("CORS_ORIGINS", "http://localhost:3000").split(",")
@@ -40,7 +130,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
+# Outermost, so the timings include CORS handling
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Bearer token Prometheus must send to /metrics; unset keeps the endpoint closed
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
 
 api_router = APIRouter(prefix="/api")
 
@@ -51,6 +147,25 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+async def get_department_id(current_user: dict) -> str:
+    """Caller's department from the token, falling back to the database for older tokens"""
+    if current_user.get('department_id'):
+        return current_user['department_id']
+    user = await cache.get_user(db, current_user['sub'])
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    return user['department_id']
+
+
+def overlapping_range_query(start_date: str, end_date: str) -> dict:
+    """Requests intersecting [start_date, end_date], served by the start_at/end_at index"""
+    try:
+        start = to_bson_date(start_date)
+        end = to_bson_date(end_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный формат даты")
+    return {"start_at": {"$lte": end}, "end_at": {"$gte": start}}
+
 
 @api_router.post("/auth/register", response_model=UserResponse)
 async def register(user_data: UserCreate):
@@ -61,7 +176,7 @@ async def register(user_data: UserCreate):
         raise HTTPException(status_code=400, detail="Пользователь уже существует")
     
 
-    password_hash = hash_password(user_data.password)
+    password_hash = await password_hasher.hash(user_data.password)
     
 
     user = User(
@@ -75,15 +190,14 @@ async def register(user_data: UserCreate):
     )
     
     user_dict = user.model_dump()
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
     
     await db.users.insert_one(user_dict)
+    await cache.invalidate_user(user.id)
+    await etags.bump(db, [etags.USERS])
     
     current_year = datetime.now(timezone.utc).year
     balance = VacationBalance(user_id=user.id, year=current_year, total_days=28)
-    balance_dict = balance.model_dump()
-    balance_dict['created_at'] = balance_dict['created_at'].isoformat()
-    await db.vacation_balances.insert_one(balance_dict)
+    await db.vacation_balances.insert_one(balance.model_dump())
     
     return UserResponse(**user.model_dump())
 
@@ -91,26 +205,58 @@ async def register(user_data: UserCreate):
 async def login(credentials: LoginRequest):
     """Авторизация пользователя"""
     user = await db.users.find_one({"login": credentials.login}, {"_id": 0})
-    if not user or not verify_password(credentials.password, user['password_hash']):
+    if not user or not await password_hasher.verify(credentials.password, user['password_hash']):
         raise HTTPException(status_code=401, detail="Неверный логин или пароль")
     
-    token = create_access_token({"sub": user['id'], "role": user['role']})
+    token = create_access_token(user_claims(user))
     
     return LoginResponse(
         token=token,
         user=UserResponse(**user)
     )
 
+@api_router.post("/auth/logout-all")
+async def logout_all(current_user: dict = Depends(get_current_user)):
+    """Отозвать все выданные токены текущего пользователя"""
+    await revoke_user_tokens(db, current_user['sub'])
+    return {"status": "revoked"}
+
 @api_router.get("/auth/me", response_model=UserResponse)
 async def get_me(current_user: dict = Depends(get_current_user)):
     """Получить информацию о текущем пользователе"""
-    user = await db.users.find_one({"id": current_user['sub']}, {"_id": 0})
+    user = await cache.get_user(db, current_user['sub'])
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
     return UserResponse(**user)
 
 
+# ============= USER IMPORT =============
+
+IMPORT_SPOOL_SIZE = 8 * 2 ** 20
+
+@api_router.post("/users/import", response_model=UserImportReport)
+async def import_users_endpoint(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|jsonl)$"),
+    year: Optional[int] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Массовый импорт сотрудников из CSV или JSONL (только для HR)"""
+    if current_user['role'] != 'hr':
+        raise HTTPException(status_code=403, detail="Доступ запрещён")
+
+    fmt = format or detect_format(content_type=request.headers.get('content-type'))
+    # Large exports spill to disk instead of being held in memory
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE) as spool:
+        async for piece in request.stream():
+            spool.write(piece)
+        spool.seek(0)
+        with io.TextIOWrapper(spool, encoding='utf-8-sig', newline='') as f:
+            report = await import_users(db, read_rows(f, fmt), year=year)
+    logger.info(f"User import by {current_user['sub']}: {report.created} created in {report.seconds}s")
+    return report
+
 # ============= DEPARTMENT ENDPOINTS =============
 
 @api_router.post("/departments", response_model=Department)
@@ -120,43 +266,61 @@ async def create_department(dept_data: DepartmentCreate, current_user: dict = De
         raise HTTPException(status_code=403, detail="Доступ запрещён")
     
     dept = Department(name=dept_data.name, max_simultaneous_vacations=dept_data.max_simultaneous_vacations)
-    dept_dict = dept.model_dump()
-    dept_dict['created_at'] = dept_dict['created_at'].isoformat()
-    
-    await db.departments.insert_one(dept_dict)
+    await db.departments.insert_one(dept.model_dump())
+    await cache.invalidate_department(dept.id)
+    await etags.bump(db, [etags.DEPARTMENTS])
     return dept
 
 @api_router.get("/departments", response_model=List[Department])
-async def get_departments(current_user: dict = Depends(get_current_user)):
+async def get_departments(
+    request: Request,
+    response: Response,
+    current_user: dict = Depends(get_current_user)
+):
     """Получить список отделов"""
-    departments = await db.departments.find({}, {"_id": 0}).to_list(1000)
-    for dept in departments:
-        if isinstance(dept.get('created_at'), str):
-            dept['created_at'] = datetime.fromisoformat(dept['created_at'])
-    return departments
+    not_modified = await etags.conditional_get(db, request, response, [etags.DEPARTMENTS], "")
+    if not_modified:
+        return not_modified
+    
+    # Read past the worker cache: the tag is only as fresh as the body it labels
+    departments = await db.departments.find({}, {"_id": 0}).to_list(None)
+    return json_response(project(departments, Department), response)
 
 
 # ============= VACATION BALANCE ENDPOINTS =============
 
 @api_router.get("/vacation-balance/my")
-async def get_my_balance(current_user: dict = Depends(get_current_user)):
+async def get_my_balance(
+    request: Request,
+    response: Response,
+    current_user: dict = Depends(get_current_user)
+):
     """Получить свой баланс отпусков"""
     current_year = datetime.now(timezone.utc).year
+    # The year is part of the tag: a new year means another balance
+    not_modified = await etags.conditional_get(
+        db, request, response, [etags.user_balance(current_user['sub'])], f"{current_user['sub']}:{current_year}"
+    )
+    if not_modified:
+        return not_modified
+    
+    # Read past the worker cache: the tag is only as fresh as the body it labels
     balance = await db.vacation_balances.find_one(
-        {"user_id": current_user['sub'], "year": current_year},
-        {"_id": 0}
+        {"user_id": current_user['sub'], "year": current_year}, {"_id": 0}
     )
     
     if not balance:
-        # Create default balance
-        balance = VacationBalance(user_id=current_user['sub'], year=current_year, total_days=28)
-        balance_dict = balance.model_dump()
-        balance_dict['created_at'] = balance_dict['created_at'].isoformat()
-        await db.vacation_balances.insert_one(balance_dict)
-        return balance
-    
-    if isinstance(balance.get('created_at'), str):
-        balance['created_at'] = datetime.fromisoformat(balance['created_at'])
+        # Create default balance; an upsert, so concurrent first requests do not
+        # collide on the unique (user_id, year) index
+        default = VacationBalance(user_id=current_user['sub'], year=current_year, total_days=28)
+        balance = await db.vacation_balances.find_one_and_update(
+            {"user_id": current_user['sub'], "year": current_year},
+            {"$setOnInsert": default.model_dump()},
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        await etags.bump(db, [etags.BALANCES])
     
     return balance
 
@@ -167,17 +331,11 @@ async def get_user_balance(user_id: str, current_user: dict = Depends(get_curren
         raise HTTPException(status_code=403, detail="Доступ запрещён")
     
     current_year = datetime.now(timezone.utc).year
-    balance = await db.vacation_balances.find_one(
-        {"user_id": user_id, "year": current_year},
-        {"_id": 0}
-    )
+    balance = await cache.get_balance(db, user_id, current_year)
     
     if not balance:
         raise HTTPException(status_code=404, detail="Баланс не найден")
     
-    if isinstance(balance.get('created_at'), str):
-        balance['created_at'] = datetime.fromisoformat(balance['created_at'])
-    
     return balance
 
 @api_router.put("/vacation-balance/{user_id}")
@@ -206,16 +364,13 @@ async def update_user_balance(
             {"user_id": user_id, "year": current_year},
             {"$set": update_dict}
         )
+        await cache.invalidate_balances([(user_id, current_year)])
+        await etags.bump(db, [etags.user_balance(user_id), etags.BALANCES])
     
-    updated_balance = await db.vacation_balances.find_one(
+    return await db.vacation_balances.find_one(
         {"user_id": user_id, "year": current_year},
         {"_id": 0}
     )
-    
-    if isinstance(updated_balance.get('created_at'), str):
-        updated_balance['created_at'] = datetime.fromisoformat(updated_balance['created_at'])
-    
-    return updated_balance
 
 
 # ============= VACATION REQUEST ENDPOINTS =============
@@ -227,23 +382,10 @@ async def create_vacation_request(
 ):
     """Создать заявку на отпуск"""
     # Calculate work days
-    work_days = calculate_work_days(request_data.start_date, request_data.end_date)
-    
-    # Check balance if annual vacation
-    if request_data.vacation_type == 'annual':
-        current_year = datetime.now(timezone.utc).year
-        balance = await db.vacation_balances.find_one(
-            {"user_id": current_user['sub'], "year": current_year},
-            {"_id": 0}
-        )
-        
-        if balance:
-            available = balance['total_days'] - balance['used_days']
-            if work_days > available:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Недостаточно дней отпуска. Доступно: {available}, требуется: {work_days}"
-                )
+    try:
+        work_days = calculate_work_days(request_data.start_date, request_data.end_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный формат даты")
     
     # Create request
     vacation_request = VacationRequest(
@@ -255,96 +397,232 @@ async def create_vacation_request(
         work_days=work_days
     )
     
-    request_dict = vacation_request.model_dump()
-    request_dict['created_at'] = request_dict['created_at'].isoformat()
-    request_dict['updated_at'] = request_dict['updated_at'].isoformat()
-    
-    await db.vacation_requests.insert_one(request_dict)
+    # Reserve the days up front so parallel submissions cannot overdraw the balance
+    if request_data.vacation_type == 'annual':
+        year = current_year()
+        reserved = await adjust_balance(db, current_user['sub'], year, reserved=work_days)
+        if reserved is False:
+            balance = await db.vacation_balances.find_one(
+                {"user_id": current_user['sub'], "year": year},
+                {"_id": 0}
+            )
+            raise HTTPException(
+                status_code=400,
+                detail=f"Недостаточно дней отпуска. Доступно: {available_days(balance)}, требуется: {work_days}"
+            )
+        if reserved:
+            vacation_request.reserved_days = work_days
+            vacation_request.balance_year = year
+            await cache.invalidate_balances([(current_user['sub'], year)])
     
+    request_dict = vacation_request.model_dump()
+    # Native dates next to the strings make overlap queries index-friendly
+    request_dict['start_at'] = to_bson_date(request_dict['start_date'])
+    request_dict['end_at'] = to_bson_date(request_dict['end_date'])
+    
+    try:
+        await db.vacation_requests.insert_one(request_dict)
+    except Exception:
+        if vacation_request.reserved_days:
+            await adjust_balance(db, current_user['sub'], vacation_request.balance_year,
+                                 reserved=-vacation_request.reserved_days)
+            await cache.invalidate_balances([(current_user['sub'], vacation_request.balance_year)])
+        raise
+    
+    department_id = await get_department_id(current_user)
+    await etags.bump(db, etags.request_scopes(current_user['sub'], department_id))
+    await event_hub.publish_local([events.request_event(request_dict, department_id, created=True)])
     return vacation_request
 
 @api_router.get("/vacation-requests/my", response_model=List[VacationRequest])
-async def get_my_requests(current_user: dict = Depends(get_current_user)):
+async def get_my_requests(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
     """Получить свои заявки на отпуск"""
-    requests = await db.vacation_requests.find(
-        {"user_id": current_user['sub']},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(1000)
+    query = {"user_id": current_user['sub']}
+    if stream:
+        return ndjson_response(find_keyset(db.vacation_requests, query, after, limit))
     
-    for req in requests:
-        if isinstance(req.get('created_at'), str):
-            req['created_at'] = datetime.fromisoformat(req['created_at'])
-        if isinstance(req.get('updated_at'), str):
-            req['updated_at'] = datetime.fromisoformat(req['updated_at'])
+    not_modified = await etags.conditional_get(
+        db, request, response, [etags.user_requests(current_user['sub'])], current_user['sub']
+    )
+    if not_modified:
+        return not_modified
     
-    return requests
+    requests, next_cursor = await fetch_page(db.vacation_requests, query, after, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    
+    return json_response(project(requests, VacationRequest), response)
+
+# Fields of a request shown in list views
+REQUEST_LIST_PROJECTION = {
+    "_id": 0, "id": 1, "user_id": 1, "start_date": 1, "end_date": 1, "vacation_type": 1,
+    "status": 1, "comment": 1, "manager_comment": 1, "work_days": 1, "created_at": 1, "updated_at": 1
+}
+
+def department_requests_pipeline(department_id: str, after: Optional[str], limit: Optional[int]) -> List[dict]:
+    """Requests of a department joined with their authors, newest first.
+
+    Starts from the department's users so each $lookup hits the
+    (user_id, created_at, id) index; a page never needs more than limit
+    requests per user.
+    """
+    request_pipeline = [{"$match": keyset_query({}, after)}, {"$sort": dict(KEYSET_SORT)}]
+    if limit:
+        request_pipeline.append({"$limit": limit})
+    request_pipeline.append({"$project": REQUEST_LIST_PROJECTION})
+    
+    pipeline = [
+        {"$match": {"department_id": department_id}},
+        {"$project": {"_id": 0, "id": 1, "full_name": 1, "email": 1}},
+        {"$lookup": {
+            "from": "vacation_requests",
+            "localField": "id",
+            "foreignField": "user_id",
+            "pipeline": request_pipeline,
+            "as": "request"
+        }},
+        {"$unwind": "$request"},
+        {"$replaceRoot": {"newRoot": {"$mergeObjects": [
+            "$request", {"user_name": "$full_name", "user_email": "$email"}
+        ]}}},
+        {"$sort": dict(KEYSET_SORT)},
+    ]
+    if limit:
+        pipeline.append({"$limit": limit})
+    return pipeline
 
 @api_router.get("/vacation-requests/department")
-async def get_department_requests(current_user: dict = Depends(get_current_user)):
+async def get_department_requests(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
     """Получить заявки отдела (для менеджеров)"""
     if current_user['role'] not in ['manager', 'hr']:
         raise HTTPException(status_code=403, detail="Доступ запрещён")
     
-    # Get current user info
-    user = await db.users.find_one({"id": current_user['sub']}, {"_id": 0})
-    if not user:
-        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    department_id = await get_department_id(current_user)
     
-    # Get all users from the same department
-    department_users = await db.users.find(
-        {"department_id": user['department_id']},
-        {"_id": 0}
-    ).to_list(1000)
+    # Requests of the department enriched with user info in one aggregation
+    if stream:
+        pipeline = department_requests_pipeline(department_id, after, limit)
+        return ndjson_response(db.users.aggregate(pipeline))
     
-    user_ids = [u['id'] for u in department_users]
+    not_modified = await etags.conditional_get(
+        db, request, response, [etags.department_requests(department_id)], current_user['sub']
+    )
+    if not_modified:
+        return not_modified
     
-    # Get requests for department
-    requests = await db.vacation_requests.find(
-        {"user_id": {"$in": user_ids}},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(1000)
+    page_size = limit or DEFAULT_PAGE_SIZE
+    pipeline = department_requests_pipeline(department_id, after, page_size + 1)
+    requests, next_cursor = await fetch_aggregate_page(db.users, pipeline, page_size)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    
+    # the pipeline already shapes the rows
+    return json_response(requests, response)
+
+# Author fields enrich_with_users adds to requests
+ALL_REQUESTS_EXTRA = ('user_name', 'user_email', 'department_id')
+
+async def enrich_with_users(requests: List[dict]) -> List[dict]:
+    """Add author name, email and department to a chunk of requests"""
+    user_ids = list({req['user_id'] for req in requests})
+    users = await db.users.find(
+        {"id": {"$in": user_ids}},
+        {"_id": 0, "id": 1, "full_name": 1, "email": 1, "department_id": 1}
+    ).to_list(None)
+    user_map = {u['id']: u for u in users}
     
-    # Enrich with user info
     for req in requests:
-        if isinstance(req.get('created_at'), str):
-            req['created_at'] = datetime.fromisoformat(req['created_at'])
-        if isinstance(req.get('updated_at'), str):
-            req['updated_at'] = datetime.fromisoformat(req['updated_at'])
-        
-        # Add user info
-        req_user = next((u for u in department_users if u['id'] == req['user_id']), None)
-        if req_user:
-            req['user_name'] = req_user['full_name']
-            req['user_email'] = req_user['email']
+        user = user_map.get(req['user_id'])
+        if user:
+            req['user_name'] = user['full_name']
+            req['user_email'] = user['email']
+            req['department_id'] = user['department_id']
     
     return requests
 
 @api_router.get("/vacation-requests/all")
-async def get_all_requests(current_user: dict = Depends(get_current_user)):
+async def get_all_requests(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
     """Получить все заявки (только для HR)"""
     if current_user['role'] != 'hr':
         raise HTTPException(status_code=403, detail="Доступ запрещён")
     
-    requests = await db.vacation_requests.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    if stream:
+        return ndjson_response(find_keyset(db.vacation_requests, {}, after, limit), enrich_with_users)
     
-    # Get all users
-    users = await db.users.find({}, {"_id": 0}).to_list(1000)
-    user_map = {u['id']: u for u in users}
+    not_modified = await etags.conditional_get(db, request, response, [etags.ALL_REQUESTS], current_user['sub'])
+    if not_modified:
+        return not_modified
     
-    # Enrich requests with user info
-    for req in requests:
-        if isinstance(req.get('created_at'), str):
-            req['created_at'] = datetime.fromisoformat(req['created_at'])
-        if isinstance(req.get('updated_at'), str):
-            req['updated_at'] = datetime.fromisoformat(req['updated_at'])
-        
-        user = user_map.get(req['user_id'])
-        if user:
-            req['user_name'] = user['full_name']
-            req['user_email'] = user['email']
-            req['department_id'] = user['department_id']
+    requests, next_cursor = await fetch_page(db.vacation_requests, {}, after, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     
-    return requests
+    return json_response(project(await enrich_with_users(requests), VacationRequest, ALL_REQUESTS_EXTRA), response)
+
+async def change_request_status(vacation_request: dict, update_dict: dict):
+    """Move a request to update_dict['status'] and settle its balance.
+
+    The balance is settled first and the status change is conditional on
+    the status that was read, so of two concurrent decisions only one goes
+    through and the loser gives its days back; a request is never seen in
+    a status its balance does not reflect.
+    """
+    status = update_dict['status']
+    if status != vacation_request['status']:
+        update_dict = {**update_dict, "reserved_days": 0}
+    user_id = vacation_request['user_id']
+    used, reserved = request_balance_change(vacation_request, status)
+    balance_year = request_balance_year(vacation_request)
+    applied = await adjust_balance(db, user_id, balance_year, used, reserved)
+    if applied is False:
+        raise HTTPException(status_code=400, detail="Недостаточно дней отпуска")
+    
+    claimed = await db.vacation_requests.update_one(
+        {"id": vacation_request['id'], "status": vacation_request['status']},
+        {"$set": update_dict}
+    )
+    if not claimed.matched_count and applied:
+        await adjust_balance(db, user_id, balance_year, -used, -reserved, enforce=False)
+    if applied:
+        await cache.invalidate_balances([(user_id, balance_year)])
+    if not claimed.matched_count:
+        raise HTTPException(status_code=409, detail="Заявка уже изменена, обновите страницу")
+    
+    owner = await cache.get_user(db, vacation_request['user_id'])
+    department_id = owner['department_id'] if owner else None
+    if department_id and (vacation_request['status'] == 'approved') != (status == 'approved'):
+        await update_occupancy([(department_id, vacation_request)], status == 'approved')
+    await etags.bump(db, etags.request_scopes(vacation_request['user_id'], department_id))
+    await event_hub.publish_local([events.request_event({**vacation_request, **update_dict}, department_id)])
+
+async def update_occupancy(changes: List[tuple], approved: bool):
+    """Keep department_occupancy in step; after a failure the departments are rebuilt in the background"""
+    try:
+        await occupancy.record(db, changes, approved)
+    except PyMongoError as e:
+        logger.error(f"Failed to update department occupancy, queued for rebuild: {str(e)}")
+        await occupancy.mark_dirty(db, {department_id for department_id, _ in changes})
 
 @api_router.put("/vacation-requests/{request_id}")
 async def update_vacation_request(
@@ -362,24 +640,19 @@ async def update_vacation_request(
         raise HTTPException(status_code=404, detail="Заявка не найдена")
     
     # Get user info
-    user = await db.users.find_one({"id": vacation_request['user_id']}, {"_id": 0})
+    user = await cache.get_user(db, vacation_request['user_id'])
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
     # Check if manager has permission (only for their department)
     if current_user['role'] == 'manager':
-        manager = await db.users.find_one({"id": current_user['sub']}, {"_id": 0})
-        if manager['department_id'] != user['department_id']:
+        if await get_department_id(current_user) != user['department_id']:
             raise HTTPException(status_code=403, detail="Доступ запрещён")
     
-    # Update request
+    # Update request and balance
     update_dict = update_data.model_dump()
-    update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
-    
-    await db.vacation_requests.update_one(
-        {"id": request_id},
-        {"$set": update_dict}
-    )
+    update_dict['updated_at'] = datetime.now(timezone.utc)
+    await change_request_status(vacation_request, update_dict)
     
     # Create history record
     history = RequestHistory(
@@ -388,20 +661,12 @@ async def update_vacation_request(
         comment=update_data.manager_comment,
         acted_by=current_user['sub']
     )
-    history_dict = history.model_dump()
-    history_dict['acted_at'] = history_dict['acted_at'].isoformat()
-    await db.request_history.insert_one(history_dict)
+    await db.request_history.insert_one(history.model_dump())
     
-    # Update vacation balance if approved
-    if update_data.status == 'approved' and vacation_request['vacation_type'] == 'annual':
-        current_year = datetime.now(timezone.utc).year
-        await db.vacation_balances.update_one(
-            {"user_id": vacation_request['user_id'], "year": current_year},
-            {"$inc": {"used_days": vacation_request['work_days']}}
-        )
-    
-    # Send email notification
-    email_service.send_vacation_status_email(
+    # Queue email notification
+    await notification_queue.enqueue_vacation_status(
+        request_id=request_id,
+        history_id=history.id,
         to_email=user['email'],
         employee_name=user['full_name'],
         start_date=vacation_request['start_date'],
@@ -411,13 +676,187 @@ async def update_vacation_request(
     )
     
     # Get updated request
-    updated_request = await db.vacation_requests.find_one({"id": request_id}, {"_id": 0})
-    if isinstance(updated_request.get('created_at'), str):
-        updated_request['created_at'] = datetime.fromisoformat(updated_request['created_at'])
-    if isinstance(updated_request.get('updated_at'), str):
-        updated_request['updated_at'] = datetime.fromisoformat(updated_request['updated_at'])
-    
-    return updated_request
+    return await db.vacation_requests.find_one({"id": request_id}, {"_id": 0})
+
+BULK_DECISION_STATUSES = ('approved', 'rejected')
+
+@api_router.post("/vacation-requests/bulk-decision", response_model=VacationRequestBulkResult)
+async def bulk_update_vacation_requests(
+    update_data: VacationRequestBulkUpdate,
+    current_user: dict = Depends(get_current_user)
+):
+    """Одобрить или отклонить несколько заявок одним запросом"""
+    if current_user['role'] not in ['manager', 'hr']:
+        raise HTTPException(status_code=403, detail="Доступ запрещён")
+    if update_data.status not in BULK_DECISION_STATUSES:
+        raise HTTPException(status_code=400, detail="Недопустимый статус")
+
+    request_ids = list(dict.fromkeys(update_data.request_ids))
+    department_id = await get_department_id(current_user) if current_user['role'] == 'manager' else None
+
+    # Requests with their owners in one round trip
+    candidates = await db.vacation_requests.aggregate([
+        {"$match": {"id": {"$in": request_ids}}},
+        {"$project": {"_id": 0, "id": 1, "user_id": 1, "status": 1, "vacation_type": 1, "work_days": 1,
+                      "reserved_days": 1, "balance_year": 1, "start_date": 1, "end_date": 1,
+                      "manager_comment": 1, "updated_at": 1}},
+        {"$lookup": {
+            "from": "users",
+            "localField": "user_id",
+            "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, "department_id": 1, "email": 1, "full_name": 1}}],
+            "as": "user"
+        }},
+    ]).to_list(None)
+    found = {req['id']: req for req in candidates}
+
+    accepted, skipped = [], []
+    for request_id in request_ids:
+        req = found.get(request_id)
+        if req is None:
+            reason = "Заявка не найдена"
+        elif not req['user']:
+            reason = "Пользователь не найден"
+        elif department_id is not None and req['user'][0]['department_id'] != department_id:
+            reason = "Доступ запрещён"
+        elif req['status'] == 'cancelled':
+            reason = "Заявка отменена"
+        elif req['status'] != 'pending':
+            reason = "Заявка уже рассмотрена"
+        else:
+            accepted.append(req)
+            continue
+        skipped.append(BulkSkippedRequest(id=request_id, reason=reason))
+
+    if not accepted:
+        return VacationRequestBulkResult(updated=[], skipped=skipped)
+
+    now = datetime.now(timezone.utc)
+    status = update_data.status
+    # Marks the requests this call moved, in case some were decided concurrently
+    decision_id = str(uuid.uuid4())
+    by_id = {req['id']: req for req in accepted}
+    # Fixed up front, so a retried transaction writes the same history the emails refer to
+    history_ids = {req['id']: str(uuid.uuid4()) for req in accepted}
+
+    async def apply(session):
+        # One balance update per employee instead of one per request
+        changes = {}
+        for req in accepted:
+            used, reserved = request_balance_change(req, status)
+            key = (req['user_id'], request_balance_year(req))
+            total_used, total_reserved, reqs = changes.get(key, (0, 0, []))
+            changes[key] = (total_used + used, total_reserved + reserved, reqs + [req])
+
+        # Balances move before the requests do: without a transaction a request
+        # is never seen decided while its days are not yet counted
+        settled = [
+            UpdateOne({"user_id": user_id, "year": year}, {"$inc": {"used_days": used, "reserved_days": reserved}})
+            for (user_id, year), (used, reserved, _) in changes.items()
+            if (used or reserved) and used + reserved <= 0
+        ]
+        if settled:
+            await db.vacation_balances.bulk_write(settled, ordered=False, session=session)
+
+        # Approvals not covered by a reservation (requests made before reservations
+        # existed) have to fit the balance; otherwise they stay pending
+        overdrawn = []
+        for (user_id, year), (used, reserved, reqs) in changes.items():
+            if used + reserved > 0 and await adjust_balance(db, user_id, year, used, reserved, session) is False:
+                overdrawn.extend(reqs)
+        overdrawn_ids = {req['id'] for req in overdrawn}
+
+        to_claim = [request_id for request_id in by_id if request_id not in overdrawn_ids]
+        claimed = []
+        if to_claim:
+            claim = await db.vacation_requests.update_many(
+                {"id": {"$in": to_claim}, "status": "pending"},
+                {"$set": {
+                    "status": status,
+                    "manager_comment": update_data.manager_comment,
+                    "updated_at": now,
+                    "reserved_days": 0,
+                    "decision_id": decision_id
+                }},
+                session=session
+            )
+            if claim.modified_count == len(to_claim):
+                claimed = [by_id[request_id] for request_id in to_claim]
+            else:
+                claimed = [
+                    by_id[doc['id']] async for doc in db.vacation_requests.find(
+                        {"decision_id": decision_id}, {"_id": 0, "id": 1}, session=session
+                    )
+                ]
+
+        # Requests decided concurrently give back the days counted for them above
+        claimed_ids = {req['id'] for req in claimed}
+        lost = {}
+        for request_id in to_claim:
+            if request_id not in claimed_ids:
+                req = by_id[request_id]
+                used, reserved = request_balance_change(req, status)
+                key = (req['user_id'], request_balance_year(req))
+                total_used, total_reserved = lost.get(key, (0, 0))
+                lost[key] = (total_used + used, total_reserved + reserved)
+        undo = [
+            UpdateOne({"user_id": user_id, "year": year}, {"$inc": {"used_days": -used, "reserved_days": -reserved}})
+            for (user_id, year), (used, reserved) in lost.items()
+            if used or reserved
+        ]
+        if undo:
+            await db.vacation_balances.bulk_write(undo, ordered=False, session=session)
+
+        if claimed:
+            history = []
+            for req in claimed:
+                history.append(RequestHistory(
+                    id=history_ids[req['id']],
+                    request_id=req['id'],
+                    action=status,
+                    comment=update_data.manager_comment,
+                    acted_by=current_user['sub'],
+                    acted_at=now
+                ).model_dump())
+            await db.request_history.insert_many(history, session=session)
+            if status == 'approved':
+                await occupancy.record(
+                    db, [(req['user'][0]['department_id'], req) for req in claimed], True, session
+                )
+            await etags.bump(db, [
+                scope for req in claimed
+                for scope in etags.request_scopes(req['user_id'], req['user'][0]['department_id'])
+            ], session)
+        return claimed, overdrawn_ids
+
+    applied, overdrawn_ids = await run_in_transaction(client, apply)
+    # after the commit, so no worker reloads a balance from before it
+    await cache.invalidate_balances([(req['user_id'], request_balance_year(req)) for req in applied])
+    await event_hub.publish_local([
+        events.request_event({**req, "status": status}, req['user'][0]['department_id']) for req in applied
+    ])
+    applied_ids = {req['id'] for req in applied}
+    for req in accepted:
+        if req['id'] in overdrawn_ids:
+            skipped.append(BulkSkippedRequest(id=req['id'], reason="Недостаточно дней отпуска"))
+        elif req['id'] not in applied_ids:
+            skipped.append(BulkSkippedRequest(id=req['id'], reason="Заявка уже рассмотрена"))
+
+    await notification_queue.enqueue_many([
+        notification_queue.vacation_status_message(
+            request_id=req['id'],
+            history_id=history_ids[req['id']],
+            to_email=req['user'][0]['email'],
+            employee_name=req['user'][0]['full_name'],
+            start_date=req['start_date'],
+            end_date=req['end_date'],
+            status=status,
+            manager_comment=update_data.manager_comment
+        )
+        for req in applied
+    ])
+
+    return VacationRequestBulkResult(updated=[req['id'] for req in applied], skipped=skipped)
 
 @api_router.post("/vacation-requests/{request_id}/cancel")
 async def cancel_vacation_request(
@@ -440,31 +879,11 @@ async def cancel_vacation_request(
     if vacation_request['status'] == 'cancelled':
         raise HTTPException(status_code=400, detail="Заявка уже отменена")
 
-    old_status = vacation_request['status']
-
-    # Обновляем статус
-    await db.vacation_requests.update_one(
-        {"id": request_id},
-        {
-            "$set": {
-                "status": "cancelled",
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }
-        }
-    )
-
-    # Если был одобрен — возвращаем дни
-    if old_status == "approved" and vacation_request['vacation_type'] == "annual":
-        current_year = datetime.now(timezone.utc).year
-        await db.vacation_balances.update_one(
-            {
-                "user_id": vacation_request['user_id'],
-                "year": current_year
-            },
-            {
-                "$inc": {"used_days": -vacation_request['work_days']}
-            }
-        )
+    # Обновляем статус; одобренные дни и резерв возвращаются на баланс
+    await change_request_status(vacation_request, {
+        "status": "cancelled",
+        "updated_at": datetime.now(timezone.utc)
+    })
 
     # История
     history = RequestHistory(
@@ -473,9 +892,7 @@ async def cancel_vacation_request(
         comment="Отпуск отменён",
         acted_by=current_user['sub']
     )
-    history_dict = history.model_dump()
-    history_dict['acted_at'] = history_dict['acted_at'].isoformat()
-    await db.request_history.insert_one(history_dict)
+    await db.request_history.insert_one(history.model_dump())
 
     return {"status": "cancelled"}
 
@@ -486,65 +903,62 @@ async def check_vacation_overlap(
 ):
     """Проверить пересечение отпусков"""
     # Get user's department
-    user = await db.users.find_one({"id": current_user['sub']}, {"_id": 0})
-    if not user:
-        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    department_id = await get_department_id(current_user)
     
     # Get department info
-    department = await db.departments.find_one({"id": user['department_id']}, {"_id": 0})
+    department = await cache.get_department(db, department_id)
     max_allowed = department['max_simultaneous_vacations'] if department else 2
     
-    # Get department users
-    department_users = await db.users.find(
-        {"department_id": user['department_id']},
-        {"_id": 0}
-    ).to_list(1000)
-    user_ids = [u['id'] for u in department_users]
-    
-    # Get approved requests for department
-    approved_requests = await db.vacation_requests.find(
-        {"user_id": {"$in": user_ids}, "status": "approved"},
-        {"_id": 0}
-    ).to_list(1000)
-    
-    # Check for overlaps
-    warnings = check_overlap(
-        approved_requests,
-        request_data.start_date,
-        request_data.end_date,
-        max_allowed
-    )
-    
-    return warnings
+    # Days of the requested range on which the department is already at the limit
+    try:
+        days = await occupancy.occupied_days(
+            db, department_id, request_data.start_date, request_data.end_date, max(max_allowed, 1)
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный формат даты")
+    
+    return [
+        OverlapWarning(
+            date=day['date'].strftime('%Y-%m-%d'),
+            count=day['count'] + 1,  # +1 for the new request
+            employees=[entry['user_id'] for entry in day['requests']],
+            max_allowed=max_allowed
+        )
+        for day in days
+    ]
 
 
 # ============= REPORTS AND EXPORT =============
 
-@api_router.get("/reports/vacations")
-async def get_vacation_report(
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    current_user: dict = Depends(get_current_user)
-):
-    """Получить отчет по отпускам (только для HR)"""
-    if current_user['role'] != 'hr':
-        raise HTTPException(status_code=403, detail="Доступ запрещён")
-    
+REPORT_COLUMNS = [
+    'Сотрудник', 'Email', 'Отдел', 'Дата начала', 'Дата окончания', 'Тип',
+    'Рабочих дней', 'Статус', 'Комментарий', 'Комментарий руководителя'
+]
+
+REPORT_PROJECTION = {
+    "_id": 0, "user_id": 1, "start_date": 1, "end_date": 1, "vacation_type": 1,
+    "work_days": 1, "status": 1, "comment": 1, "manager_comment": 1
+}
+
+EXPORT_CHUNK_SIZE = 2000
+
+def _report_query(start_date: Optional[str], end_date: Optional[str]) -> dict:
     query = {}
     if start_date and end_date:
         query['start_date'] = {"$gte": start_date, "$lte": end_date}
-    
-    requests = await db.vacation_requests.find(query, {"_id": 0}).to_list(1000)
-    
-    # Get all users
-    users = await db.users.find({}, {"_id": 0}).to_list(1000)
+    return query
+
+async def build_report_rows(requests: List[dict]) -> List[dict]:
+    """Turn a chunk of requests into report rows"""
+    user_ids = list({req['user_id'] for req in requests})
+    users = await db.users.find(
+        {"id": {"$in": user_ids}},
+        {"_id": 0, "id": 1, "full_name": 1, "email": 1, "department_id": 1}
+    ).to_list(None)
     user_map = {u['id']: u for u in users}
     
-    # Get all departments
-    departments = await db.departments.find({}, {"_id": 0}).to_list(1000)
-    dept_map = {d['id']: d for d in departments}
+    dept_map = {d['id']: d for d in await cache.get_departments(db)}
     
-    # Prepare report data
     report_data = []
     for req in requests:
         user = user_map.get(req['user_id'], {})
@@ -565,6 +979,62 @@ async def get_vacation_report(
     
     return report_data
 
+@api_router.get("/reports/vacations")
+async def get_vacation_report(
+    response: Response,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """Получить отчет по отпускам (только для HR)"""
+    if current_user['role'] != 'hr':
+        raise HTTPException(status_code=403, detail="Доступ запрещён")
+    
+    query = _report_query(start_date, end_date)
+    if stream:
+        return ndjson_response(find_keyset(db.vacation_requests, query, after, limit), build_report_rows)
+    
+    requests, next_cursor = await fetch_page(db.vacation_requests, query, after, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    
+    return json_response(await build_report_rows(requests), response)
+
+@api_router.get("/analytics/summary")
+async def get_analytics_summary(
+    request: Request,
+    response: Response,
+    year: Optional[int] = Query(None, ge=2000, le=2100),
+    refresh: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """Сводная аналитика по отпускам: статусы, отделы, загрузка по месяцам, сроки согласования (только для HR)"""
+    if current_user['role'] != 'hr':
+        raise HTTPException(status_code=403, detail="Доступ запрещён")
+    
+    # Revalidated on every load, so counters follow writes at once; the
+    # window keeps request ages from going stale while nothing is written
+    window = str(int(time.time() // analytics.ANALYTICS_CACHE_TTL))
+    not_modified = await etags.conditional_get(
+        db, request, response, [etags.ALL_REQUESTS, etags.DEPARTMENTS, etags.USERS, etags.BALANCES], window
+    )
+    if not_modified:
+        return not_modified
+    
+    year = year or datetime.now(timezone.utc).year
+    return await analytics.get_summary(db, year, refresh, version=response.headers["ETag"])
+
+async def iter_report_chunks(start_date: Optional[str], end_date: Optional[str]):
+    """Report rows in chunks, straight from the database cursor"""
+    cursor = db.vacation_requests.find(
+        _report_query(start_date, end_date), REPORT_PROJECTION, batch_size=EXPORT_CHUNK_SIZE
+    )
+    async for chunk in iter_chunks(cursor, EXPORT_CHUNK_SIZE):
+        yield await build_report_rows(chunk)
+
 @api_router.get("/reports/export-csv")
 async def export_report_csv(
     start_date: Optional[str] = None,
@@ -575,71 +1045,187 @@ async def export_report_csv(
     if current_user['role'] != 'hr':
         raise HTTPException(status_code=403, detail="Доступ запрещён")
     
-    # Get report data
-    report_data = await get_vacation_report(start_date, end_date, current_user)
-    
-    # Convert to CSV
-    csv_content = export_to_csv(report_data)
-    
-    # Return as file download
+    # Rows are written as they are read, so memory does not grow with the report
     return StreamingResponse(
-        iter([csv_content.encode('utf-8-sig')]),
+        iter_csv(iter_report_chunks(start_date, end_date), REPORT_COLUMNS),
         media_type="text/csv",
         headers={
             "Content-Disposition": "attachment; filename=vacation_report.csv"
         }
     )
 
+@api_router.get("/reports/export-xlsx")
+async def export_report_xlsx(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Экспортировать отчет в XLSX (только для HR)"""
+    if current_user['role'] != 'hr':
+        raise HTTPException(status_code=403, detail="Доступ запрещён")
+    
+    return StreamingResponse(
+        iter_xlsx(iter_report_chunks(start_date, end_date), REPORT_COLUMNS),
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={
+            "Content-Disposition": "attachment; filename=vacation_report.xlsx"
+        }
+    )
+
 
 # ============= CALENDAR EVENTS =============
 
 @api_router.get("/calendar/department")
-async def get_department_calendar(current_user: dict = Depends(get_current_user)):
+async def get_department_calendar(
+    response: Response,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
     """Получить календарь отпусков отдела для FullCalendar"""
     # Get user's department
-    user = await db.users.find_one({"id": current_user['sub']}, {"_id": 0})
-    if not user:
-        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    department_id = await get_department_id(current_user)
     
     # Get department users
     department_users = await db.users.find(
-        {"department_id": user['department_id']},
-        {"_id": 0}
-    ).to_list(1000)
-    user_ids = [u['id'] for u in department_users]
+        {"department_id": department_id},
+        {"_id": 0, "id": 1, "full_name": 1}
+    ).to_list(None)
     user_map = {u['id']: u for u in department_users}
     
-    # Get approved requests
-    requests = await db.vacation_requests.find(
-        {"user_id": {"$in": user_ids}, "status": "approved"},
-        {"_id": 0}
-    ).to_list(1000)
-    
     # Format for FullCalendar
-    events = []
-    for req in requests:
-        req_user = user_map.get(req['user_id'])
-        if req_user:
-            events.append({
-                "id": req['id'],
-                "title": req_user['full_name'],
-                "start": req['start_date'],
-                "end": req['end_date'],
-                "backgroundColor": "#10B981",
-                "borderColor": "#10B981",
-                "extendedProps": {
-                    "user_id": req['user_id'],
-                    "vacation_type": req['vacation_type'],
-                    "work_days": req['work_days']
-                }
-            })
-    
-    return events
+    async def to_events(requests):
+        events = []
+        for req in requests:
+            req_user = user_map.get(req['user_id'])
+            if req_user:
+                events.append({
+                    "id": req['id'],
+                    "title": req_user['full_name'],
+                    "start": req['start_date'],
+                    "end": req['end_date'],
+                    "backgroundColor": "#10B981",
+                    "borderColor": "#10B981",
+                    "extendedProps": {
+                        "user_id": req['user_id'],
+                        "vacation_type": req['vacation_type'],
+                        "work_days": req['work_days']
+                    }
+                })
+        return events
+    
+    # Get approved requests, limited to the visible range when given
+    query = {"user_id": {"$in": list(user_map)}, "status": "approved"}
+    if start and end:
+        query.update(overlapping_range_query(start, end))
+    if stream:
+        return ndjson_response(find_keyset(db.vacation_requests, query, after, limit), to_events)
+    
+    requests, next_cursor = await fetch_page(db.vacation_requests, query, after, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    
+    return await to_events(requests)
+
+
+@api_router.get("/calendar/occupancy")
+async def get_department_occupancy(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    department_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Тепловая карта занятости отдела по дням (по умолчанию — текущий год)"""
+    if department_id is None or current_user['role'] != 'hr':
+        department_id = await get_department_id(current_user)
+    year = datetime.now(timezone.utc).year
+    start = start or f"{year}-01-01"
+    end = end or f"{year}-12-31"
+    
+    department = await cache.get_department(db, department_id)
+    try:
+        days = await occupancy.occupied_days(db, department_id, start, end, with_users=False)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный формат даты")
+    
+    return {
+        "department_id": department_id,
+        "max_allowed": department['max_simultaneous_vacations'] if department else 2,
+        "days": [{"date": day['date'].strftime('%Y-%m-%d'), "count": day['count']} for day in days]
+    }
+
+
+# ============= EVENTS =============
+
+async def get_stream_user(ticket: str = Query(...)) -> dict:
+    """EventSource cannot send headers, so the stream is opened with a ticket
+    from /events/ticket instead of the long-lived token"""
+    return await redeem_stream_ticket(db, ticket)
+
+@api_router.post("/events/ticket")
+async def create_stream_ticket(current_user: dict = Depends(get_current_user)):
+    """Одноразовый билет для подключения к потоку событий"""
+    claims = {k: v for k, v in current_user.items() if k not in ('exp', 'iat')}
+    return {"ticket": await issue_stream_ticket(db, claims), "expires_in": STREAM_TICKET_TTL}
+
+@api_router.get("/events/stream")
+async def stream_events(current_user: dict = Depends(get_stream_user)):
+    """Поток событий по заявкам (Server-Sent Events): свои заявки, заявки отдела для менеджера, все для HR"""
+    if event_hub.full():
+        raise HTTPException(status_code=503, detail="Слишком много подключений, повторите позже")
+    
+    department_id = await get_department_id(current_user) if current_user['role'] == 'manager' else None
+    subscription = event_hub.subscribe(
+        events.subscriber_topics(current_user['role'], current_user['sub'], department_id)
+    )
+    return StreamingResponse(
+        event_hub.stream(subscription),
+        media_type="text/event-stream",
+        # no buffering in nginx, no caching anywhere
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# ============= RUNTIME METRICS =============
+
+@api_router.get("/metrics/runtime")
+async def get_runtime_metrics(current_user: dict = Depends(get_current_user)):
+    """Метрики фоновых сервисов (только для HR)"""
+    if current_user['role'] != 'hr':
+        raise HTTPException(status_code=403, detail="Доступ запрещён")
+
+    return {
+        "password_hasher": password_hasher.stats(),
+        "notifications": notification_queue.stats(),
+        "cache": cache.cache_stats(),
+        "events": event_hub.stats(),
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    """Метрики в формате Prometheus"""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=403, detail="Метрики отключены: не задан METRICS_TOKEN")
+    if authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Требуется авторизация")
+    return Response(metrics.registry.expose(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Background services, read at scrape time
+for gauge in (
+    metrics.Gauge("password_hash_queue_depth", "bcrypt calls waiting for a worker", lambda: password_hasher.queued),
+    metrics.Gauge("password_hash_in_flight", "bcrypt calls running", lambda: password_hasher.in_flight),
+    metrics.Gauge("notification_queue_depth", "Emails waiting to be sent",
+                  lambda: notification_queue.stats()["queue_depth"]),
+    metrics.Gauge("event_stream_connections", "Open SSE connections", lambda: event_hub.connections),
+    metrics.Gauge("cache_hit_ratio", "Hit ratio of in-process caches",
+                  lambda: {name: s["hit_ratio"] for name, s in cache.cache_stats().items()}, label="cache"),
+):
+    metrics.registry.register(gauge)
 
 
 # Include the router in the main app
 app.include_router(api_router)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
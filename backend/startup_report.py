@@ -0,0 +1,82 @@
+"""Where a worker's cold start goes: module imports and lifespan steps.
+
+Imports are measured in a fresh interpreter with `python -X importtime`, so
+nothing already loaded hides its cost, and grouped by top-level package.
+Then the app's lifespan runs once against the configured MongoDB and the
+time of each startup step is printed (skip it with --imports-only).
+
+Usage: python startup_report.py [--top 15] [--imports-only]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT_DIR = Path(__file__).parent
+
+
+def measure_imports(module: str = "server") -> List[Tuple[str, int, int]]:
+    """(module, self us, cumulative us) for every import, in import order"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, env=os.environ.copy(), capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise SystemExit(result.stderr.strip().splitlines()[-1])
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def local_modules() -> set:
+    return {path.stem for path in ROOT_DIR.glob("*.py")}
+
+
+def print_imports(imports: List[Tuple[str, int, int]], top: int):
+    total = next((cumulative for name, _, cumulative in imports if name == "server"), 0)
+    print(f"import server: {total / 1000:.0f} ms, {len(imports)} modules")
+
+    packages: Dict[str, List[int]] = {}
+    for name, self_us, _ in imports:
+        entry = packages.setdefault(name.split(".")[0], [0, 0])
+        entry[0] += self_us
+        entry[1] += 1
+    print("\nSlowest packages (own time of all their modules):")
+    for package, (self_us, count) in sorted(packages.items(), key=lambda item: -item[1][0])[:top]:
+        print(f"  {package:<28} {self_us / 1000:8.1f} ms  {count:4d} modules")
+
+    own = local_modules()
+    print("\nApplication modules (with everything they import first):")
+    for name, self_us, cumulative in imports:
+        if name in own:
+            print(f"  {name:<28} {cumulative / 1000:8.1f} ms  (own {self_us / 1000:.1f} ms)")
+
+
+async def measure_lifespan():
+    import server
+
+    started = time.perf_counter()
+    async with server.lifespan(server.app):
+        total = (time.perf_counter() - started) * 1000
+    print(f"\nLifespan startup: {total:.0f} ms")
+    for name, ms in server.app.state.startup_timings.items():
+        print(f"  {name:<28} {ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=15, help="packages to list")
+    parser.add_argument("--imports-only", action="store_true", help="do not connect to MongoDB")
+    args = parser.parse_args()
+
+    print_imports(measure_imports(), args.top)
+    if not args.imports_only:
+        asyncio.run(measure_lifespan())
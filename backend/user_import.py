@@ -0,0 +1,218 @@
+"""Bulk import of users and their vacation balances from HR exports.
+
+Usage: python user_import.py staff.csv [--format csv|jsonl] [--chunk-size 500] [--year 2025]
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+from auth import password_hasher
+from models import User, UserImportError, UserImportReport, UserImportRow, VacationBalance
+import cache
+import etags
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = int(os.environ.get('USER_IMPORT_CHUNK_SIZE', 500))
+# Per-row errors kept in the report; the counters cover the rest
+MAX_REPORTED_ERRORS = 100
+DUPLICATE_KEY = 11000
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+
+def detect_format(filename: Optional[str] = None, content_type: Optional[str] = None) -> str:
+    if content_type and ('ndjson' in content_type or 'jsonl' in content_type):
+        return 'jsonl'
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return 'csv'
+
+
+def read_rows(f: IO[str], fmt: str) -> Iterator[Tuple[int, dict]]:
+    """Yield (line number, raw row) pairs from a CSV file with a header or from JSON lines"""
+    if fmt == 'jsonl':
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except ValueError:
+                yield line_no, {}
+        return
+
+    reader = csv.DictReader(f)
+    for row in reader:
+        # empty cells mean "not set", not an empty string
+        yield reader.line_num, {k: v for k, v in row.items() if k and v not in ('', None)}
+
+
+def _chunks(rows: Iterable[Tuple[int, dict]], size: int) -> Iterator[List[Tuple[int, dict]]]:
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _inserted_indexes(error: BulkWriteError, count: int) -> List[int]:
+    """Indexes of documents an unordered insert_many did write, re-raising non-duplicate errors"""
+    errors = error.details.get('writeErrors', [])
+    if any(e['code'] != DUPLICATE_KEY for e in errors):
+        raise error
+    failed = {e['index'] for e in errors}
+    return [i for i in range(count) if i not in failed]
+
+
+class UserImporter:
+    """Validates, deduplicates, hashes and inserts rows chunk by chunk"""
+
+    def __init__(self, db, chunk_size: int = IMPORT_CHUNK_SIZE, year: Optional[int] = None):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.year = year or datetime.now(timezone.utc).year
+        self.report = UserImportReport()
+        self._seen_logins = set()
+        self._department_ids = set()
+        self._departments_by_name = {}
+
+    def _error(self, line: int, login: Optional[str], error: str):
+        self.report.invalid += 1
+        if len(self.report.errors) < MAX_REPORTED_ERRORS:
+            self.report.errors.append(UserImportError(line=line, login=login, error=error))
+
+    def _validate(self, chunk: List[Tuple[int, dict]]) -> List[UserImportRow]:
+        valid = []
+        for line, raw in chunk:
+            # a JSON line may hold any value, not only an object
+            if not isinstance(raw, dict):
+                self._error(line, None, "Строка должна быть JSON-объектом")
+                continue
+            try:
+                row = UserImportRow(**raw)
+            except ValidationError as e:
+                self._error(line, raw.get('login'), "; ".join(
+                    f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+                ))
+                continue
+            if row.department_id is None and row.department is not None:
+                row.department_id = self._departments_by_name.get(row.department)
+            if row.department_id not in self._department_ids:
+                self._error(line, row.login, "Отдел не найден")
+                continue
+            if row.login in self._seen_logins:
+                self.report.duplicates += 1
+                continue
+            self._seen_logins.add(row.login)
+            valid.append(row)
+        return valid
+
+    async def _import_chunk(self, chunk: List[Tuple[int, dict]]):
+        rows = self._validate(chunk)
+        if not rows:
+            return
+
+        existing = {
+            u['login'] async for u in self.db.users.find(
+                {"login": {"$in": [r.login for r in rows]}}, {"_id": 0, "login": 1}
+            )
+        }
+        rows = [r for r in rows if r.login not in existing]
+        self.report.existing += len(existing)
+        if not rows:
+            return
+
+        hashes = await password_hasher.hash_many([r.password for r in rows])
+        users = []
+        for row, password_hash in zip(rows, hashes):
+            users.append(User(
+                login=row.login,
+                password_hash=password_hash,
+                role=row.role,
+                full_name=row.full_name,
+                email=row.email,
+                department_id=row.department_id,
+                manager_id=row.manager_id
+            ).model_dump())
+
+        try:
+            await self.db.users.insert_many(users, ordered=False)
+            inserted = list(range(len(users)))
+        except BulkWriteError as e:
+            # logins taken by a concurrent registration since the $in check
+            inserted = _inserted_indexes(e, len(users))
+            self.report.existing += len(users) - len(inserted)
+
+        balances = [
+            VacationBalance(user_id=users[i]['id'], year=self.year, total_days=rows[i].total_days).model_dump()
+            for i in inserted
+        ]
+        if balances:
+            try:
+                await self.db.vacation_balances.insert_many(balances, ordered=False)
+            except BulkWriteError as e:
+                _inserted_indexes(e, len(balances))
+        self.report.created += len(inserted)
+
+    async def run(self, rows: Iterable[Tuple[int, dict]]) -> UserImportReport:
+        started = time.perf_counter()
+        departments = await cache.get_departments(self.db)
+        self._department_ids = {d['id'] for d in departments}
+        self._departments_by_name = {d['name']: d['id'] for d in departments}
+
+        for chunk in _chunks(rows, self.chunk_size):
+            self.report.rows += len(chunk)
+            await self._import_chunk(chunk)
+            elapsed = time.perf_counter() - started
+            logger.info(f"Imported {self.report.created}/{self.report.rows} users, {self.report.rows / elapsed:.0f} rows/s")
+        if self.report.created:
+            await etags.bump(self.db, [etags.USERS])
+
+        self.report.seconds = round(time.perf_counter() - started, 3)
+        if self.report.seconds:
+            self.report.rows_per_sec = round(self.report.rows / self.report.seconds, 1)
+        return self.report
+
+
+async def import_users(db, rows: Iterable[Tuple[int, dict]], chunk_size: int = IMPORT_CHUNK_SIZE,
+                       year: Optional[int] = None) -> UserImportReport:
+    return await UserImporter(db, chunk_size, year).run(rows)
+
+
+async def main(path: Path, fmt: str, chunk_size: int, year: Optional[int]):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            report = await import_users(db, read_rows(f, fmt), chunk_size, year)
+        print(json.dumps(report.model_dump(), indent=2, ensure_ascii=False))
+    finally:
+        client.close()
+        password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--format", choices=IMPORT_FORMATS)
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    parser.add_argument("--year", type=int)
+    args = parser.parse_args()
+    asyncio.run(main(args.path, args.format or detect_format(args.path.name), args.chunk_size, args.year))
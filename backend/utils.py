@@ -1,77 +1,150 @@
-from datetime import datetime, timedelta
-from dateutil import rrule
-import pandas as pd
+import asyncio
+import csv
+import tempfile
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
 from io import StringIO
-from typing import List, Dict
+from operator import itemgetter
+from typing import Any, AsyncIterator, Callable, List, Dict, Optional, Tuple
+from work_calendar import work_calendar
 
 def calculate_work_days(start_date_str: str, end_date_str: str) -> int:
-    """Calculate work days between two dates (excluding weekends)"""
-    try:
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-        
-        # Use rrule to count weekdays
-        work_days = len(list(rrule.rrule(
-            rrule.DAILY,
-            dtstart=start_date,
-            until=end_date,
-            byweekday=(rrule.MO, rrule.TU, rrule.WE, rrule.TH, rrule.FR)
-        )))
-        
-        return work_days
-    except Exception as e:
-        # If parsing fails, return calendar days
-        return (end_date - start_date).days + 1
+    """Calculate work days between two dates (excluding weekends and public holidays)"""
+    return work_calendar.count(_parse_date(start_date_str), _parse_date(end_date_str))
+
+def calculate_work_days_batch(ranges: List[Tuple[str, str]]) -> List[int]:
+    """Calculate work days for many (start, end) date string pairs"""
+    return work_calendar.count_batch((_parse_date(start), _parse_date(end)) for start, end in ranges)
 
 def export_to_csv(data: List[Dict]) -> str:
     """Export data to CSV format"""
     if not data:
         return ""
     
-    df = pd.DataFrame(data)
     csv_buffer = StringIO()
-    df.to_csv(csv_buffer, index=False, encoding='utf-8')
+    writer = csv.DictWriter(csv_buffer, fieldnames=list(data[0]), lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(data)
     return csv_buffer.getvalue()
 
-def check_overlap(requests: List[Dict], start_date: str, end_date: str, max_allowed: int) -> List[Dict]:
-    """Check for vacation overlaps in department"""
-    warnings = []
-    start = datetime.strptime(start_date, '%Y-%m-%d').date()
-    end = datetime.strptime(end_date, '%Y-%m-%d').date()
+async def iter_csv(chunks: AsyncIterator[List[Dict]], columns: List[str]) -> AsyncIterator[bytes]:
+    """Encode chunks of rows as UTF-8 CSV with BOM, one piece per chunk"""
+    buffer = StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+    yield buffer.getvalue().encode('utf-8-sig')
     
-    # Create a date range for the requested vacation
-    requested_dates = set()
-    current = start
-    while current <= end:
-        requested_dates.add(current)
-        current += timedelta(days=1)
+    values = itemgetter(*columns)
+    async for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(map(values, rows))
+        yield buffer.getvalue().encode('utf-8')
+
+async def iter_xlsx(chunks: AsyncIterator[List[Dict]], columns: List[str],
+                    read_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """Write rows to an XLSX file in constant memory, then stream the file"""
+    import xlsxwriter
     
-    # Count overlapping employees for each date
-    overlap_counts = {}
-    for req in requests:
+    with tempfile.TemporaryFile() as output:
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'in_memory': False})
+        worksheet = workbook.add_worksheet()
+        worksheet.write_row(0, 0, columns)
+        
+        def write_rows(first_row: int, rows: List[Dict]):
+            for offset, row in enumerate(rows):
+                worksheet.write_row(first_row + offset, 0, [row.get(column) for column in columns])
+        
+        # xlsxwriter is pure Python and slow enough to stall the event loop
+        row_number = 1
+        async for rows in chunks:
+            await asyncio.to_thread(write_rows, row_number, rows)
+            row_number += len(rows)
+        # Zipping the parts is CPU-bound for big reports
+        await asyncio.to_thread(workbook.close)
+        
+        output.seek(0)
+        while True:
+            data = await asyncio.to_thread(output.read, read_size)
+            if not data:
+                break
+            yield data
+
+def to_bson_date(value: str) -> datetime:
+    """Midnight of an ISO date; stored by MongoDB as a native, range-indexable date"""
+    return datetime.strptime(value[:10], '%Y-%m-%d')
+
+def _parse_date(value: str) -> date:
+    return date.fromisoformat(value)
+
+def build_occupancy_segments(requests: List[Dict], min_count: int = 1,
+                             window: Optional[Tuple[str, str]] = None,
+                             key: Callable[[Dict], Any] = itemgetter('user_id')) -> List[Tuple[date, date, List[Any]]]:
+    """Sweep approved requests into segments of constant occupancy.
+
+    Returns (first_day, last_day, employees) for every stretch of days during
+    which at least min_count employees are off, in date order. employees holds
+    key(request) in the order of the requests list. Requests outside the
+    optional (start, end) window are skipped without parsing their dates.
+    """
+    events = {}
+    for index, req in enumerate(requests):
         if req.get('status') != 'approved':
             continue
-            
-        req_start = datetime.strptime(req['start_date'], '%Y-%m-%d').date()
-        req_end = datetime.strptime(req['end_date'], '%Y-%m-%d').date()
-        
-        current = req_start
-        while current <= req_end:
-            if current in requested_dates:
-                if current not in overlap_counts:
-                    overlap_counts[current] = {'count': 0, 'employees': []}
-                overlap_counts[current]['count'] += 1
-                overlap_counts[current]['employees'].append(req.get('user_id'))
-            current += timedelta(days=1)
+        # ISO dates compare correctly as strings
+        if window and (req['end_date'] < window[0] or req['start_date'] > window[1]):
+            continue
+        req_start = _parse_date(req['start_date'])
+        req_end = _parse_date(req['end_date'])
+        if req_end < req_start:
+            continue
+        events.setdefault(req_start, ([], []))[0].append(index)
+        events.setdefault(req_end + timedelta(days=1), ([], []))[1].append(index)
     
-    # Create warnings for dates exceeding limit
-    for date, data in overlap_counts.items():
-        if data['count'] >= max_allowed:
-            warnings.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'count': data['count'] + 1,  # +1 for the new request
-                'employees': data['employees'],
-                'max_allowed': max_allowed
-            })
+    segments = []
+    active = {}
+    boundaries = sorted(events)
+    for current, following in zip(boundaries, boundaries[1:] + [None]):
+        starts, ends = events[current]
+        for index in ends:
+            del active[index]
+        for index in starts:
+            active[index] = key(requests[index])
+        if following is not None and active and len(active) >= min_count:
+            segments.append((current, following - timedelta(days=1), [active[i] for i in sorted(active)]))
     
-    return warnings
\ No newline at end of file
+    return segments
+
+def check_overlaps_batch(requests: List[Dict], ranges: List[Tuple[str, str]], max_allowed: int) -> List[List[Dict]]:
+    """Check many candidate date ranges against the same approved requests"""
+    if not ranges:
+        return []
+    window = (min(start for start, _ in ranges), max(end for _, end in ranges))
+    segments = build_occupancy_segments(requests, max(max_allowed, 1), window)
+    segment_ends = [segment[1] for segment in segments]
+    
+    results = []
+    for start_date, end_date in ranges:
+        start = _parse_date(start_date)
+        end = _parse_date(end_date)
+        warnings = []
+        # First segment that may still cover the start of the range
+        for first_day, last_day, employees in segments[bisect_left(segment_ends, start):]:
+            if first_day > end:
+                break
+            current = max(first_day, start)
+            while current <= min(last_day, end):
+                warnings.append({
+                    'date': current.strftime('%Y-%m-%d'),
+                    'count': len(employees) + 1,  # +1 for the new request
+                    'employees': employees,
+                    'max_allowed': max_allowed
+                })
+                current += timedelta(days=1)
+        results.append(warnings)
+    
+    return results
+
+def check_overlap(requests: List[Dict], start_date: str, end_date: str, max_allowed: int) -> List[Dict]:
+    """Check for vacation overlaps in department"""
+    return check_overlaps_batch(requests, [(start_date, end_date)], max_allowed)[0]
@@ -0,0 +1,123 @@
+import json
+import logging
+import os
+from array import array
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_FILE = Path(os.environ.get(
+    'PRODUCTION_CALENDAR_FILE', Path(__file__).parent / 'production_calendar.json'
+))
+
+# Statutory holidays (month, day) used for years missing from the calendar file,
+# without the government's yearly transfers
+DEFAULT_HOLIDAYS = [
+    (1, 1), (1, 2), (1, 3), (1, 4), (1, 5), (1, 6), (1, 7), (1, 8),
+    (2, 23), (3, 8), (5, 1), (5, 9), (6, 12), (11, 4),
+]
+
+
+class WorkCalendar:
+    """Working-day counts backed by a per-year prefix-sum table.
+
+    prefix[year][n] is the number of working days among the first n days of
+    the year, so any range within a year is answered with two lookups.
+    """
+
+    def __init__(self, holidays: Dict[int, Set[date]] = None, working_days: Dict[int, Set[date]] = None):
+        self.holidays = holidays or {}
+        self.working_days = working_days or {}
+        self._prefix: Dict[int, array] = {}
+        self._span = None
+        self._span_years = (0, 0)
+
+    @classmethod
+    def load(cls, path: Path = CALENDAR_FILE) -> "WorkCalendar":
+        """Load holidays and transferred working days from a JSON production calendar"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            logger.warning(f"Production calendar {path} not found, counting weekends only")
+            return cls()
+
+        holidays, working_days = {}, {}
+        for year, entry in data.items():
+            holidays[int(year)] = {date.fromisoformat(d) for d in entry.get('holidays', [])}
+            working_days[int(year)] = {date.fromisoformat(d) for d in entry.get('working_days', [])}
+        return cls(holidays, working_days)
+
+    def _is_working_day(self, day: date) -> bool:
+        if day in self.working_days.get(day.year, ()):
+            return True
+        if day.year in self.holidays:
+            if day in self.holidays[day.year]:
+                return False
+        elif (day.month, day.day) in DEFAULT_HOLIDAYS:
+            return False
+        return day.weekday() < 5
+
+    def _year_prefix(self, year: int) -> array:
+        prefix = self._prefix.get(year)
+        if prefix is None:
+            prefix = array('H', [0])
+            day = date(year, 1, 1)
+            while day.year == year:
+                prefix.append(prefix[-1] + self._is_working_day(day))
+                day += timedelta(days=1)
+            self._prefix[year] = prefix
+        return prefix
+
+    def is_working_day(self, day: date) -> bool:
+        n = day.timetuple().tm_yday
+        prefix = self._year_prefix(day.year)
+        return prefix[n] > prefix[n - 1]
+
+    def count(self, start: date, end: date) -> int:
+        """Working days in [start, end], both inclusive"""
+        if end < start:
+            return 0
+        start_n = start.timetuple().tm_yday
+        end_n = end.timetuple().tm_yday
+        if start.year == end.year:
+            prefix = self._year_prefix(start.year)
+            return prefix[end_n] - prefix[start_n - 1]
+
+        first = self._year_prefix(start.year)
+        total = first[-1] - first[start_n - 1]
+        for year in range(start.year + 1, end.year):
+            total += self._year_prefix(year)[-1]
+        return total + self._year_prefix(end.year)[end_n]
+
+    def _span_prefix(self, first_year: int, last_year: int) -> Tuple[int, array]:
+        """(ordinal of the day before the table, prefix over consecutive days) covering
+        first_year to last_year; a range in them is then two lookups by ordinal"""
+        if self._span is not None:
+            span_first, span_last = self._span_years
+            if span_first <= first_year and last_year <= span_last:
+                return self._span
+            # grown to cover both, so alternating batches do not rebuild it
+            first_year, last_year = min(first_year, span_first), max(last_year, span_last)
+        prefix = array('I', [0])
+        for year in range(first_year, last_year + 1):
+            offset = prefix[-1]
+            prefix.extend(offset + n for n in self._year_prefix(year)[1:])
+        self._span = (date(first_year, 1, 1).toordinal() - 1, prefix)
+        self._span_years = (first_year, last_year)
+        return self._span
+
+    def count_batch(self, ranges: Iterable[Tuple[date, date]]) -> List[int]:
+        """Like count for each range, indexing one table by ordinal instead of per-year lookups"""
+        pairs = [(start.toordinal(), end.toordinal()) for start, end in ranges]
+        if not pairs:
+            return []
+        first = min(min(start for start, _ in pairs), min(end for _, end in pairs))
+        last = max(max(start for start, _ in pairs), max(end for _, end in pairs))
+        base, prefix = self._span_prefix(date.fromordinal(first).year, date.fromordinal(last).year)
+        return [prefix[end - base] - prefix[start - base - 1] if end >= start else 0 for start, end in pairs]
+
+
+work_calendar = WorkCalendar.load()
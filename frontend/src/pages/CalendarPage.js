@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React from 'react';
 import Layout from '../components/Layout';
 import api from '../utils/api';
 import FullCalendar from '@fullcalendar/react';
@@ -7,38 +7,22 @@ import timeGridPlugin from '@fullcalendar/timegrid';
 import listPlugin from '@fullcalendar/list';
 import interactionPlugin from '@fullcalendar/interaction';
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from '../components/ui/card';
-import { Loader2 } from 'lucide-react';
 import { toast } from 'sonner';
 
 const CalendarPage = () => {
-  const [events, setEvents] = useState([]);
-  const [loading, setLoading] = useState(true);
-
-  useEffect(() => {
-    fetchCalendarEvents();
-  }, []);
-
-  const fetchCalendarEvents = async () => {
+  // FullCalendar requests only the visible date range
+  const fetchCalendarEvents = async (info, successCallback, failureCallback) => {
     try {
-      const response = await api.get('/calendar/department');
-      setEvents(response.data);
+      const response = await api.get('/calendar/department', {
+        params: { start: info.startStr, end: info.endStr },
+      });
+      successCallback(response.data);
     } catch (error) {
       toast.error('Ошибка загрузки календаря');
-    } finally {
-      setLoading(false);
+      failureCallback(error);
     }
   };
 
-  if (loading) {
-    return (
-      <Layout>
-        <div className="flex h-96 items-center justify-center">
-          <Loader2 className="h-8 w-8 animate-spin text-muted-foreground" />
-        </div>
-      </Layout>
-    );
-  }
-
   return (
     <Layout>
       <div className="space-y-8">
@@ -72,7 +56,7 @@ const CalendarPage = () => {
                   month: 'Месяц',
                   list: 'Список'
                 }}
-                events={events}
+                events={fetchCalendarEvents}
                 height="auto"
                 eventDisplay="block"
                 displayEventTime={false}
@@ -245,11 +245,16 @@ const DashboardPage = () => {
             </CardHeader>
             <CardContent>
               <div className="text-3xl font-bold font-mono" data-testid="available-days">
-                {balance ? balance.total_days - balance.used_days : 0} дней
+                {balance ? balance.total_days - balance.used_days - (balance.reserved_days || 0) : 0} дней
               </div>
               <p className="text-sm text-muted-foreground mt-2">
                 Использовано: {balance?.used_days || 0} из {balance?.total_days || 0}
               </p>
+              {balance?.reserved_days > 0 && (
+                <p className="text-sm text-muted-foreground" data-testid="reserved-days">
+                  Зарезервировано заявками: {balance.reserved_days}
+                </p>
+              )}
             </CardContent>
           </Card>
 
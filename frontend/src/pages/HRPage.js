@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import Layout from '../components/Layout';
 import api from '../utils/api';
+import { subscribeToRequestEvents } from '../utils/events';
 import { Button } from '../components/ui/button';
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from '../components/ui/card';
 import { Input } from '../components/ui/input';
@@ -9,8 +10,13 @@ import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle, Di
 import { Loader2, Download } from 'lucide-react';
 import { toast } from 'sonner';
 
+// Events arrive in bursts (bulk approvals) and reach every open HR tab at once,
+// so a refetch waits a little, with jitter, and covers all events seen meanwhile
+const EVENT_REFETCH_DELAY_MS = 2000;
+
 const HRPage = () => {
   const [requests, setRequests] = useState([]);
+  const [summary, setSummary] = useState(null);
   const [users, setUsers] = useState([]);
   const [loading, setLoading] = useState(true);
   const [exportLoading, setExportLoading] = useState(false);
@@ -25,15 +31,38 @@ const HRPage = () => {
 
   useEffect(() => {
     fetchData();
+    let refetch = null;
+    const unsubscribe = subscribeToRequestEvents(() => {
+      if (refetch) {
+        return;
+      }
+      refetch = setTimeout(() => {
+        refetch = null;
+        fetchActivity().catch(() => toast.error('Ошибка загрузки данных'));
+      }, EVENT_REFETCH_DELAY_MS * (1 + Math.random()));
+    });
+    return () => {
+      clearTimeout(refetch);
+      unsubscribe();
+    };
   }, []);
 
+  // Request events change only the recent requests and the summary
+  const fetchActivity = async () => {
+    const [requestsRes, summaryRes] = await Promise.all([
+      api.get('/vacation-requests/all', { params: { limit: 10 } }),
+      api.get('/analytics/summary'),
+    ]);
+    setRequests(requestsRes.data);
+    setSummary(summaryRes.data);
+  };
+
   const fetchData = async () => {
     try {
-      const [requestsRes, usersRes] = await Promise.all([
-        api.get('/vacation-requests/all'),
+      const [, usersRes] = await Promise.all([
+        fetchActivity(),
         api.get('/departments'),
       ]);
-      setRequests(requestsRes.data);
       
       const allUsers = [];
       for (const dept of usersRes.data) {
@@ -105,12 +134,14 @@ const HRPage = () => {
     }
   };
 
+  const statuses = summary?.statuses || {};
   const stats = {
-    totalRequests: requests.length,
-    pendingRequests: requests.filter(r => r.status === 'pending').length,
-    approvedRequests: requests.filter(r => r.status === 'approved').length,
-    rejectedRequests: requests.filter(r => r.status === 'rejected').length,
+    totalRequests: Object.values(statuses).reduce((sum, count) => sum + count, 0),
+    pendingRequests: statuses.pending || 0,
+    approvedRequests: statuses.approved || 0,
+    rejectedRequests: statuses.rejected || 0,
   };
+  const backlog = summary?.pending_backlog;
 
   if (loading) {
     return (
@@ -181,6 +212,55 @@ const HRPage = () => {
           </Card>
         </div>
 
+        {/* Departments */}
+        {summary && (
+          <Card>
+            <CardHeader>
+              <CardTitle className="font-heading text-xl">Отделы</CardTitle>
+              <CardDescription>
+                Дни отпуска за {summary.year} год
+                {backlog && backlog.count > 0 && (
+                  <> • ожидают решения: {backlog.count}, в среднем {backlog.avg_age_days} дн., максимум {backlog.max_age_days} дн.</>
+                )}
+              </CardDescription>
+            </CardHeader>
+            <CardContent>
+              <div className="overflow-x-auto">
+                <table className="w-full text-sm" data-testid="departments-table">
+                  <thead>
+                    <tr className="border-b border-border text-left text-muted-foreground">
+                      <th className="py-2 pr-4 font-medium">Отдел</th>
+                      <th className="py-2 pr-4 font-medium text-right">Сотрудники</th>
+                      <th className="py-2 pr-4 font-medium text-right">Использовано</th>
+                      <th className="py-2 pr-4 font-medium text-right">Запрошено</th>
+                      <th className="py-2 font-medium text-right">Осталось</th>
+                    </tr>
+                  </thead>
+                  <tbody>
+                    {summary.departments.map((dept) => (
+                      <tr key={dept.department_id} className="border-b border-border last:border-0">
+                        <td className="py-2 pr-4">{dept.name}</td>
+                        <td className="py-2 pr-4 text-right font-mono">{dept.employees}</td>
+                        <td className="py-2 pr-4 text-right font-mono">{dept.used_days}</td>
+                        <td className="py-2 pr-4 text-right font-mono">{dept.reserved_days}</td>
+                        <td className="py-2 text-right font-mono">{dept.remaining_days}</td>
+                      </tr>
+                    ))}
+                  </tbody>
+                </table>
+              </div>
+              {summary.approval_latency.length > 0 && (
+                <p className="mt-4 text-sm text-muted-foreground">
+                  Среднее время рассмотрения:{' '}
+                  {summary.approval_latency
+                    .map((row) => `${row.action === 'approved' ? 'одобрение' : 'отклонение'} — ${row.avg_hours} ч.`)
+                    .join(', ')}
+                </p>
+              )}
+            </CardContent>
+          </Card>
+        )}
+
         {/* Export */}
         <Card>
           <CardHeader>
@@ -239,7 +319,7 @@ const HRPage = () => {
               {requests.length === 0 ? (
                 <p className="text-center text-muted-foreground py-8">Нет заявок</p>
               ) : (
-                requests.slice(0, 10).map((request) => (
+                requests.map((request) => (
                   <div
                     key={request.id}
                     className="rounded-sm border border-border p-4"
@@ -274,9 +354,9 @@ const HRPage = () => {
                   </div>
                 ))
               )}
-              {requests.length > 10 && (
+              {stats.totalRequests > requests.length && (
                 <p className="text-center text-sm text-muted-foreground">
-                  Показано 10 из {requests.length} заявок
+                  Показано {requests.length} из {stats.totalRequests} заявок
                 </p>
               )}
             </div>
@@ -2,11 +2,13 @@ import React, { useState, useEffect } from 'react';
 import { useAuth } from '../contexts/AuthContext';
 import Layout from '../components/Layout';
 import api from '../utils/api';
+import { subscribeToRequestEvents } from '../utils/events';
 import { Button } from '../components/ui/button';
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from '../components/ui/card';
 import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle } from '../components/ui/dialog';
 import { Textarea } from '../components/ui/textarea';
 import { Label } from '../components/ui/label';
+import { Checkbox } from '../components/ui/checkbox';
 import { CheckCircle, XCircle, Clock, Loader2, User, Mail } from 'lucide-react';
 import { toast } from 'sonner';
 
@@ -19,9 +21,12 @@ const RequestsPage = () => {
   const [dialogOpen, setDialogOpen] = useState(false);
   const [actionType, setActionType] = useState(null);
   const [submitting, setSubmitting] = useState(false);
+  const [selectedIds, setSelectedIds] = useState([]);
 
   useEffect(() => {
     fetchRequests();
+    // new and decided requests of the department arrive without reloading
+    return subscribeToRequestEvents(() => fetchRequests());
   }, []);
 
   const fetchRequests = async () => {
@@ -38,11 +43,25 @@ const RequestsPage = () => {
   const handleAction = async () => {
     setSubmitting(true);
     try {
-      await api.put(`/vacation-requests/${selectedRequest.id}`, {
-        status: actionType,
-        manager_comment: managerComment,
-      });
-      toast.success(`Заявка ${actionType === 'approved' ? 'одобрена' : 'отклонена'}`);
+      if (selectedRequest) {
+        await api.put(`/vacation-requests/${selectedRequest.id}`, {
+          status: actionType,
+          manager_comment: managerComment,
+        });
+        toast.success(`Заявка ${actionType === 'approved' ? 'одобрена' : 'отклонена'}`);
+      } else {
+        const response = await api.post('/vacation-requests/bulk-decision', {
+          request_ids: selectedIds,
+          status: actionType,
+          manager_comment: managerComment,
+        });
+        const { updated, skipped } = response.data;
+        toast.success(`${actionType === 'approved' ? 'Одобрено' : 'Отклонено'} заявок: ${updated.length}`);
+        if (skipped.length > 0) {
+          toast.warning(`Пропущено заявок: ${skipped.length}`);
+        }
+        setSelectedIds([]);
+      }
       setDialogOpen(false);
       setManagerComment('');
       setSelectedRequest(null);
@@ -54,6 +73,10 @@ const RequestsPage = () => {
     }
   };
 
+  const toggleSelected = (id) => {
+    setSelectedIds((ids) => (ids.includes(id) ? ids.filter((x) => x !== id) : [...ids, id]));
+  };
+
   const openDialog = (request, action) => {
     setSelectedRequest(request);
     setActionType(action);
@@ -100,8 +123,35 @@ const RequestsPage = () => {
 
         <Card>
           <CardHeader>
-            <CardTitle className="font-heading text-xl">Заявки отдела</CardTitle>
-            <CardDescription>Список заявок на согласование</CardDescription>
+            <div className="flex items-start justify-between gap-4">
+              <div>
+                <CardTitle className="font-heading text-xl">Заявки отдела</CardTitle>
+                <CardDescription>Список заявок на согласование</CardDescription>
+              </div>
+              {selectedIds.length > 0 && (
+                <div className="flex gap-2" data-testid="bulk-actions">
+                  <Button
+                    size="sm"
+                    onClick={() => openDialog(null, 'approved')}
+                    className="gap-2"
+                    data-testid="bulk-approve-btn"
+                  >
+                    <CheckCircle className="h-4 w-4" />
+                    Одобрить выбранные ({selectedIds.length})
+                  </Button>
+                  <Button
+                    size="sm"
+                    variant="destructive"
+                    onClick={() => openDialog(null, 'rejected')}
+                    className="gap-2"
+                    data-testid="bulk-reject-btn"
+                  >
+                    <XCircle className="h-4 w-4" />
+                    Отклонить выбранные
+                  </Button>
+                </div>
+              )}
+            </div>
           </CardHeader>
           <CardContent>
             <div className="space-y-4" data-testid="requests-list">
@@ -117,6 +167,13 @@ const RequestsPage = () => {
                     <div className="flex items-start justify-between mb-3">
                       <div className="flex-1">
                         <div className="flex items-center gap-2 mb-2">
+                          {request.status === 'pending' && (
+                            <Checkbox
+                              checked={selectedIds.includes(request.id)}
+                              onChange={() => toggleSelected(request.id)}
+                              data-testid={`select-request-${request.id}`}
+                            />
+                          )}
                           <User className="h-4 w-4 text-muted-foreground" />
                           <span className="font-medium">{request.user_name}</span>
                         </div>
@@ -192,13 +249,17 @@ const RequestsPage = () => {
         <DialogContent data-testid="action-dialog">
           <DialogHeader>
             <DialogTitle>
-              {actionType === 'approved' ? 'Одобрить заявку' : 'Отклонить заявку'}
+              {selectedRequest
+                ? (actionType === 'approved' ? 'Одобрить заявку' : 'Отклонить заявку')
+                : (actionType === 'approved' ? 'Одобрить заявки' : 'Отклонить заявки')}
             </DialogTitle>
             <DialogDescription>
-              {selectedRequest && (
+              {selectedRequest ? (
                 <>
                   {selectedRequest.user_name} • {selectedRequest.start_date} — {selectedRequest.end_date}
                 </>
+              ) : (
+                <>Выбрано заявок: {selectedIds.length}</>
               )}
             </DialogDescription>
           </DialogHeader>
@@ -0,0 +1,50 @@
+import api, { API_BASE } from './api';
+
+const REQUEST_EVENTS = ['request.created', 'request.approved', 'request.rejected', 'request.cancelled'];
+const RECONNECT_DELAY_MS = 5000;
+
+// Subscribes to vacation request events pushed by the server.
+// The stream is opened with a single-use ticket rather than the token, so
+// every reconnect asks for a new one; returns a function that closes the stream.
+export const subscribeToRequestEvents = (onEvent) => {
+  if (!localStorage.getItem('token') || typeof EventSource === 'undefined') {
+    return () => {};
+  }
+  const handler = (message) => onEvent(JSON.parse(message.data));
+  let source = null;
+  let retry = null;
+  let closed = false;
+
+  const reconnect = () => {
+    if (!closed) {
+      retry = setTimeout(connect, RECONNECT_DELAY_MS);
+    }
+  };
+
+  async function connect() {
+    try {
+      const { data } = await api.post('/events/ticket');
+      if (closed) {
+        return;
+      }
+      source = new EventSource(`${API_BASE}/events/stream?ticket=${encodeURIComponent(data.ticket)}`);
+      REQUEST_EVENTS.forEach((type) => source.addEventListener(type, handler));
+      source.onerror = () => {
+        // EventSource would retry with the spent ticket
+        source.close();
+        reconnect();
+      };
+    } catch (error) {
+      reconnect();
+    }
+  }
+
+  connect();
+  return () => {
+    closed = true;
+    clearTimeout(retry);
+    if (source) {
+      source.close();
+    }
+  };
+};